@@ -0,0 +1 @@
+"""Performance benchmarks for Diamond, run with python -m benchmarks."""
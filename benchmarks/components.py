@@ -0,0 +1,152 @@
+import itertools
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from evdev import AbsInfo, InputEvent, ecodes
+
+from benchmarks.measure import NOISY_TOLERANCE, metric, timings
+from controllers.captures import CaptureCatalog
+from controllers.led_display import CountingBus, LedDisplay, benchmark as lcd_benchmark
+from controllers.simulation import ABS_RANGES, simulated_bus, stick_value
+from controllers.speaker import SOUND_BANK, write_tone
+from controllers.xbox_controller import XboxController
+
+
+CAPTURE_FILES = 10_000
+CAPTURE_SUFFIXES = (".jpg", ".mp4", ".wav", ".txt")
+TONE_RUNS = 200
+LCD_UPDATES = 50
+PAGE_RUNS = 200
+SCAN_RUNS = 5
+UPDATE_RUNS = 50
+GAMEPAD_READS = 100_000
+
+
+def lcd(options):
+    """Bus cost of a status-line update on the simulated 100 kHz I2C bus."""
+
+    counter = CountingBus(simulated_bus())
+    display = LedDisplay(bus=counter)
+    try:
+        results = lcd_benchmark(display, updates=LCD_UPDATES)
+    finally:
+        display.close()
+
+    # Bytes and transfers are exact, so any increase is a regression.
+    return {
+        "lcd.diff_bytes": metric(results["diff"]["bytes"], "bytes", tolerance=0),
+        "lcd.diff_transactions": metric(results["diff"]["transactions"], "transfers", tolerance=0),
+        "lcd.diff_ms": metric(results["diff"]["ms"], "ms"),
+        "lcd.full_bytes": metric(results["full"]["bytes"], "bytes", tolerance=0),
+        "lcd.full_ms": metric(results["full"]["ms"], "ms"),
+    }
+
+
+def tone(options):
+    """write_tone() to a WAV file, synthesizing every time and from the sound bank."""
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "tone.wav"
+
+        def cold():
+            SOUND_BANK.clear()
+            write_tone(path)
+
+        cold_ms = timings(cold, TONE_RUNS)
+        cached_ms = timings(lambda: write_tone(path), TONE_RUNS)
+    SOUND_BANK.clear()
+
+    return {
+        "tone.synth_p50_ms": metric(cold_ms["p50"], "ms", tolerance=NOISY_TOLERANCE),
+        "tone.cached_p50_ms": metric(cached_ms["p50"], "ms", tolerance=NOISY_TOLERANCE),
+    }
+
+
+def fill_captures(directory, count=CAPTURE_FILES):
+    now = time.time()
+    for index in range(count):
+        path = directory / f"capture-{index:05d}{CAPTURE_SUFFIXES[index % len(CAPTURE_SUFFIXES)]}"
+        path.write_bytes(b"x" * (index % 64))
+        # One capture a minute, so time filters and cursors see distinct mtimes.
+        modified = now - (count - index) * 60
+        os.utime(path, (modified, modified))
+
+
+def captures(options):
+    """List captures from a catalog of 10k files.
+
+    Times the first scan, pages served from the index, and a new capture
+    hooked in with update() followed by a listing, which must not rescan.
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        fill_captures(directory)
+
+        def scan():
+            CaptureCatalog(directory).page()
+
+        scan_ms = timings(scan, SCAN_RUNS)
+        catalog = CaptureCatalog(directory)
+        first = catalog.page()
+        page_ms = timings(catalog.page, PAGE_RUNS)
+        kind_ms = timings(lambda: catalog.page(kind="audio"), PAGE_RUNS)
+        cursor_ms = timings(lambda: catalog.page(cursor=first["next"]), PAGE_RUNS)
+        numbers = itertools.count()
+
+        def write_and_list():
+            # What a finished capture does: the writer hooks it in, then the next listing follows.
+            path = directory / f"new-{next(numbers):05d}.jpg"
+            path.write_bytes(b"x")
+            catalog.update(path)
+            catalog.page()
+
+        update_ms = timings(write_and_list, UPDATE_RUNS)
+
+    return {
+        "captures.scan_ms": metric(scan_ms["p50"], "ms"),
+        "captures.page_p50_ms": metric(page_ms["p50"], "ms", tolerance=NOISY_TOLERANCE),
+        "captures.kind_page_p50_ms": metric(kind_ms["p50"], "ms", tolerance=NOISY_TOLERANCE),
+        "captures.cursor_page_p50_ms": metric(cursor_ms["p50"], "ms", tolerance=NOISY_TOLERANCE),
+        "captures.update_page_p50_ms": metric(update_ms["p50"], "ms", tolerance=NOISY_TOLERANCE),
+    }
+
+
+class RecordedGamepad:
+    """InputDevice stand-in that hands back the same batch of events on every read."""
+
+    name = "Recorded gamepad"
+    path = "/dev/input/recorded"
+    fd = None
+
+    def __init__(self, events):
+        self.events = events
+
+    def absinfo(self, code):
+        low, high = ABS_RANGES[code]
+        return AbsInfo(value=low, min=low, max=high, fuzz=0, flat=0, resolution=0)
+
+    def read(self):
+        return iter(self.events)
+
+
+def gamepad(options):
+    """XboxController.read() cost for one left stick report, the drive path's usual event."""
+
+    report = [
+        InputEvent(0, 0, ecodes.EV_ABS, ecodes.ABS_X, stick_value(0.3)),
+        InputEvent(0, 0, ecodes.EV_ABS, ecodes.ABS_Y, stick_value(-0.6)),
+        InputEvent(0, 0, ecodes.EV_SYN, ecodes.SYN_REPORT, 0),
+    ]
+    controller = XboxController(device=RecordedGamepad(report))
+    started = time.perf_counter()
+    for _ in range(GAMEPAD_READS):
+        controller.read()
+    elapsed = (time.perf_counter() - started) / GAMEPAD_READS
+
+    return {
+        "gamepad.read_us": metric(elapsed * 1e6, "us", tolerance=NOISY_TOLERANCE),
+        "gamepad.event_us": metric(elapsed * 1e6 / len(report), "us", tolerance=NOISY_TOLERANCE),
+    }
@@ -0,0 +1,39 @@
+import time
+
+import numpy as np
+
+
+# Fraction a metric may get worse before compare reports a regression.
+DEFAULT_TOLERANCE = 0.25
+# Tail latencies and sub-millisecond timings move more between runs than the rest.
+NOISY_TOLERANCE = 0.5
+
+
+def metric(value, unit, better="lower", tolerance=DEFAULT_TOLERANCE):
+    if better not in ("lower", "higher"):
+        raise ValueError("better must be lower or higher")
+    return {"value": float(value), "unit": unit, "better": better, "tolerance": float(tolerance)}
+
+
+def percentiles(samples):
+    """p50, p99 and max of samples, in the samples' own units."""
+
+    samples = np.asarray(samples, dtype=np.float64)
+    if not samples.size:
+        return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "p50": float(np.percentile(samples, 50)),
+        "p99": float(np.percentile(samples, 99)),
+        "max": float(samples.max()),
+    }
+
+
+def timings(function, runs):
+    """Call function runs times and return percentiles of its wall time in milliseconds."""
+
+    elapsed = np.empty(runs)
+    for index in range(runs):
+        started = time.perf_counter()
+        function()
+        elapsed[index] = time.perf_counter() - started
+    return percentiles(elapsed * 1000)
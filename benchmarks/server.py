@@ -0,0 +1,179 @@
+import asyncio
+import multiprocessing
+import socket
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi.testclient import TestClient
+
+import diamond
+from benchmarks.measure import NOISY_TOLERANCE, metric, percentiles
+
+
+HOST = "127.0.0.1"
+# Every device simulated, and captures written straight to a directory instead of tmpfs.
+APP_ARGS = ("--simulate", "--staging-dir", "")
+MEDIA_DEVICES = ("camera", "speaker", "microphone")
+READY_TIMEOUT = 60.0
+WARMUP_SECONDS = 1.0
+DRIVE_BODY = {"x": 0.2, "y": 0.6}
+WAKE_SAMPLES = 400
+WAKE_TIMEOUT = 1.0
+
+
+def serve(port):
+    """Run the real app under uvicorn; the target of the benchmark server process."""
+
+    args = diamond.parse_args([*APP_ARGS, "--host", HOST, "--port", str(port)])
+    config = uvicorn.Config(
+        diamond.create_app(args),
+        host=HOST,
+        port=port,
+        log_level="warning",
+        timeout_graceful_shutdown=diamond.SHUTDOWN_GRACE,
+    )
+    diamond.DiamondServer(config).run()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, process):
+    """Wait for the server to answer and its media devices to finish warming up."""
+
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            raise RuntimeError("benchmark server exited during startup")
+        try:
+            controllers = httpx.get(f"{url}/api/status", timeout=1).json()["controllers"]
+            if all(controllers[name] for name in MEDIA_DEVICES):
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"benchmark server not ready after {READY_TIMEOUT:.0f}s")
+
+
+async def load(url, method, path, body, clients, seconds):
+    """Keep clients requests in flight for seconds after a warmup; return latencies, errors, rate."""
+
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=5) as client:
+
+        async def worker(deadline, record):
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                if record:
+                    latencies.append(time.perf_counter() - started)
+                    errors += response.status_code != 200
+
+        await asyncio.gather(*(worker(time.perf_counter() + WARMUP_SECONDS, False) for _ in range(clients)))
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(started + seconds, True) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, len(latencies) / elapsed
+
+
+def http(options):
+    """Throughput and latency of /api/drive and /api/status with concurrent keep-alive clients.
+
+    The app runs in its own process, as it does on the rover, so the load
+    generator does not share its interpreter lock.
+    """
+
+    port = free_port()
+    url = f"http://{HOST}:{port}"
+    # Spawn rather than fork, so the server does not inherit this process's threads.
+    process = multiprocessing.get_context("spawn").Process(target=serve, args=(port,), daemon=True)
+    process.start()
+    results = {}
+    try:
+        wait_ready(url, process)
+        for name, method, path, body in (
+            ("drive", "POST", "/api/drive", DRIVE_BODY),
+            ("status", "GET", "/api/status", None),
+        ):
+            latencies, errors, rate = asyncio.run(
+                load(url, method, path, body, options.clients, options.seconds)
+            )
+            if errors:
+                raise RuntimeError(f"{errors} of {len(latencies)} {path} requests failed")
+            latency = percentiles([value * 1000 for value in latencies])
+            results[f"{name}.throughput_rps"] = metric(rate, "req/s", better="higher")
+            results[f"{name}.p50_ms"] = metric(latency["p50"], "ms")
+            results[f"{name}.p99_ms"] = metric(latency["p99"], "ms", tolerance=NOISY_TOLERANCE)
+    finally:
+        process.terminate()
+        process.join(timeout=diamond.SHUTDOWN_GRACE + 5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+    return results
+
+
+def hardware_loop(options):
+    """Wake latency of hardware_loop and period jitter of the motor control thread.
+
+    Web drive commands are set the way the /api/drive handler sets them, at
+    uneven intervals so they land at different points in the simulated
+    gamepad's report cycle, and timed until hardware_loop hands each one to
+    the control scheduler.
+    """
+
+    app = diamond.create_app(diamond.parse_args(list(APP_ARGS)))
+    with TestClient(app):
+        state = app.state.diamond
+        deadline = time.monotonic() + READY_TIMEOUT
+        while not all(getattr(state, name).available for name in MEDIA_DEVICES):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"media devices not ready after {READY_TIMEOUT:.0f}s")
+            time.sleep(0.1)
+
+        wanted = [None]
+        applied = [0.0]
+        arrived = threading.Event()
+        drive = state.control.drive
+
+        def traced(x, y, received=None):
+            if y == wanted[0] and not arrived.is_set():
+                applied[0] = time.perf_counter()
+                arrived.set()
+            drive(x, y, received)
+
+        state.control.drive = traced
+        state.control.stats.reset()
+        latencies = []
+        try:
+            for index in range(WAKE_SAMPLES):
+                # Always different from the last target, so every command changes the drive.
+                wanted[0] = (index % 100 + 1) / 100
+                arrived.clear()
+                started = time.perf_counter()
+                diamond.set_web_drive(state, 0.0, wanted[0])
+                if not arrived.wait(WAKE_TIMEOUT):
+                    raise RuntimeError("hardware_loop did not apply a drive command")
+                latencies.append((applied[0] - started) * 1000)
+                time.sleep(0.002 + index % 7 * 0.0015)
+        finally:
+            del state.control.drive
+            diamond.clear_web_drive(state)
+        control = state.control.stats.snapshot()
+
+    wake = percentiles(latencies)
+    return {
+        "hardware_loop.wake_p50_ms": metric(wake["p50"], "ms"),
+        "hardware_loop.wake_p99_ms": metric(wake["p99"], "ms", tolerance=NOISY_TOLERANCE),
+        "control.jitter_mean_ms": metric(control["jitter_mean_ms"], "ms", tolerance=NOISY_TOLERANCE),
+    }
@@ -0,0 +1,185 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+
+from benchmarks import components, server
+
+
+BENCHMARKS = {
+    "http": server.http,
+    "hardware_loop": server.hardware_loop,
+    "lcd": components.lcd,
+    "tone": components.tone,
+    "captures": components.captures,
+    "gamepad": components.gamepad,
+}
+DEFAULT_CLIENTS = 8
+DEFAULT_SECONDS = 5.0
+FORMAT_VERSION = 1
+
+
+def run_suite(names=None, options=None):
+    """Run the named benchmarks, or all of them, and return a results document."""
+
+    options = options or argparse.Namespace(clients=DEFAULT_CLIENTS, seconds=DEFAULT_SECONDS)
+    metrics = {}
+    for name in names or BENCHMARKS:
+        print(f"Running {name}...", file=sys.stderr, flush=True)
+        metrics.update(BENCHMARKS[name](options))
+
+    return {
+        "version": FORMAT_VERSION,
+        "created": time.time(),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "options": {"clients": options.clients, "seconds": options.seconds},
+        "metrics": metrics,
+    }
+
+
+def load_results(path):
+    with open(path) as file:
+        results = json.load(file)
+    if results.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a version {FORMAT_VERSION} benchmark result")
+    return results
+
+
+def save_results(results, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+
+
+def compare(baseline, current, tolerance=None, overrides=None):
+    """Compare two results documents metric by metric.
+
+    A metric regresses when it is worse than the baseline by more than its
+    tolerance: the fraction stored with the baseline metric, unless
+    tolerance or a per-metric override replaces it. Returns one row per
+    baseline metric; metrics missing from current are reported, not failed.
+    """
+
+    overrides = overrides or {}
+    rows = []
+    for name, old in sorted(baseline["metrics"].items()):
+        new = current["metrics"].get(name)
+        allowed = overrides.get(name, old["tolerance"] if tolerance is None else tolerance)
+        row = {"name": name, "unit": old["unit"], "baseline": old["value"], "tolerance": allowed}
+        if new is None:
+            rows.append({**row, "current": None, "change": None, "regressed": False})
+            continue
+
+        change = (new["value"] - old["value"]) / old["value"] if old["value"] else 0.0
+        if old["better"] == "lower":
+            regressed = new["value"] > old["value"] * (1 + allowed)
+        else:
+            regressed = new["value"] < old["value"] * (1 - allowed)
+        if not old["value"]:
+            change = None if new["value"] else 0.0
+        rows.append({**row, "current": new["value"], "change": change, "regressed": regressed})
+    return rows
+
+
+def print_results(results):
+    for name, item in sorted(results["metrics"].items()):
+        print(f"{name:<32} {item['value']:>12.3f} {item['unit']}")
+
+
+def print_comparison(rows):
+    for row in rows:
+        if row["current"] is None:
+            print(f"{row['name']:<32} {row['baseline']:>12.3f} {'missing':>12}")
+            continue
+        change = "new" if row["change"] is None else f"{row['change'] * 100:+.1f}%"
+        verdict = "REGRESSED" if row["regressed"] else "ok"
+        print(
+            f"{row['name']:<32} {row['baseline']:>12.3f} {row['current']:>12.3f} {row['unit']:<9} "
+            f"{change:>8} (allowed {row['tolerance'] * 100:.0f}%) {verdict}"
+        )
+
+
+def parse_override(text):
+    name, separator, value = text.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError("expected METRIC=FRACTION")
+    return name, float(value)
+
+
+def add_run_options(parser):
+    parser.add_argument(
+        "--only",
+        action="append",
+        choices=BENCHMARKS,
+        help="run just this benchmark; repeatable",
+    )
+    parser.add_argument("--clients", type=int, default=DEFAULT_CLIENTS, help="concurrent HTTP clients")
+    parser.add_argument(
+        "--seconds",
+        type=float,
+        default=DEFAULT_SECONDS,
+        help="measured seconds per endpoint",
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark Diamond's server, control loop and devices against simulated hardware, "
+            "and compare results with a saved baseline. "
+            "Import API: benchmarks.suite.run_suite(names), benchmarks.suite.compare(baseline, current)."
+        )
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the suite and print, or save, the results")
+    add_run_options(run)
+    run.add_argument("--output", metavar="PATH", help="save the results as JSON, for use as a baseline")
+
+    check = commands.add_parser(
+        "compare",
+        help="exit non-zero if results regressed from a baseline; runs the suite when no results are given",
+    )
+    check.add_argument("baseline")
+    check.add_argument("results", nargs="?")
+    add_run_options(check)
+    check.add_argument("--tolerance", type=float, help="allowed fraction for every metric")
+    check.add_argument(
+        "--tolerance-for",
+        action="append",
+        type=parse_override,
+        metavar="METRIC=FRACTION",
+        help="allowed fraction for one metric; repeatable",
+    )
+    check.add_argument("--output", metavar="PATH", help="save the fresh results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.command == "run":
+        results = run_suite(args.only, args)
+        print_results(results)
+        if args.output:
+            save_results(results, args.output)
+        return
+
+    baseline = load_results(args.baseline)
+    if args.results:
+        results = load_results(args.results)
+    else:
+        results = run_suite(args.only or None, args)
+        if args.output:
+            save_results(results, args.output)
+
+    rows = compare(baseline, results, args.tolerance, dict(args.tolerance_for or []))
+    print_comparison(rows)
+    regressed = [row["name"] for row in rows if row["regressed"]]
+    if regressed:
+        print(f"{len(regressed)} metrics regressed: {', '.join(regressed)}", flush=True)
+        sys.exit(1)
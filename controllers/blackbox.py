@@ -0,0 +1,438 @@
+import argparse
+import asyncio
+import bisect
+import io
+import math
+import os
+import struct
+import threading
+import time
+from collections import Counter, deque
+from time import monotonic
+
+from controllers.xbox_controller import ControllerState
+
+
+MAGIC = b"DIAMONDBB2\n"
+# Version 1 logs stored only x, y, changed and the pressed buttons for each controller state.
+MAGIC_V1 = b"DIAMONDBB1\n"
+BUFFER_BYTES = 64 * 1024
+# Buffered records reach the file at least this often, so a crash loses at most this much.
+FLUSH_INTERVAL = 1.0
+# Virtual seconds a replay keeps ticking after its last record, so ramps finish.
+REPLAY_TAIL = 1.0
+
+# Every record starts with its kind byte and a monotonic timestamp in seconds.
+SESSION = 0
+CONTROLLER = 1
+WEB_DRIVE = 2
+WEB_CLEAR = 3
+MIX = 4
+TELEMETRY = 5
+RECORDS = {
+    # Wall-clock time the session started.
+    SESSION: struct.Struct("<Bdd"),
+    # x, y, rx, ry, lt, rt, hat_x, hat_y, changed, then this many bytes of
+    # newline-separated pressed button names and this many of held button names.
+    CONTROLLER: struct.Struct("<Bd8f?HH"),
+    WEB_DRIVE: struct.Struct("<Bdff"),
+    WEB_CLEAR: struct.Struct("<Bd"),
+    # Drive target x and y, mixed left and right targets, slew-limited left and right output.
+    MIX: struct.Struct("<Bdffffff"),
+    # Wall-clock sample time, voltage, current, power, percent.
+    TELEMETRY: struct.Struct("<Bddffff"),
+}
+CONTROLLER_V1 = struct.Struct("<Bdff?H")
+NAMES = {
+    SESSION: "session",
+    CONTROLLER: "controller",
+    WEB_DRIVE: "web_drive",
+    WEB_CLEAR: "web_clear",
+    MIX: "mix",
+    TELEMETRY: "telemetry",
+}
+
+
+class BlackBox:
+    """Append-only binary log of everything that decides what the motors do.
+
+    Each record is one fixed struct, at most a few dozen bytes, written through
+    a buffer under a lock, so recording costs a couple of microseconds on the
+    control path. Every start appends a session marker to the same file. A
+    write error, such as a full card, turns recording off rather than failing
+    the caller.
+    """
+
+    def __init__(self, target, clock=monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        if isinstance(target, io.IOBase):
+            self.file = target
+            self.owned = False
+        else:
+            set_aside(target)
+            self.file = open(target, "ab", buffering=BUFFER_BYTES)
+            self.owned = True
+        self.records = 0
+        self.flushed_at = clock()
+
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self._write(RECORDS[SESSION].pack(SESSION, clock(), time.time()))
+
+    def _write(self, data):
+        with self.lock:
+            if self.file is None:
+                return
+            try:
+                self.file.write(data)
+                self.records += 1
+                now = self.clock()
+                if now - self.flushed_at >= FLUSH_INTERVAL:
+                    self.file.flush()
+                    self.flushed_at = now
+            except OSError as error:
+                print(f"Black box recording stopped: {error}", flush=True)
+                self.file = None
+
+    def controller(self, now, state):
+        buttons = "\n".join(state.buttons).encode()
+        held = "\n".join(sorted(state.held)).encode()
+        record = RECORDS[CONTROLLER].pack(
+            CONTROLLER,
+            now,
+            state.x,
+            state.y,
+            state.rx,
+            state.ry,
+            state.lt,
+            state.rt,
+            state.hat_x,
+            state.hat_y,
+            state.changed,
+            len(buttons),
+            len(held),
+        )
+        self._write(record + buttons + held)
+
+    def web_drive(self, now, x, y):
+        self._write(RECORDS[WEB_DRIVE].pack(WEB_DRIVE, now, x, y))
+
+    def web_clear(self, now):
+        self._write(RECORDS[WEB_CLEAR].pack(WEB_CLEAR, now))
+
+    def mix(self, now, target, mixed, output):
+        self._write(RECORDS[MIX].pack(MIX, now, *target, *mixed, *output))
+
+    def telemetry(self, now, battery):
+        self._write(
+            RECORDS[TELEMETRY].pack(
+                TELEMETRY,
+                now,
+                battery["time"],
+                battery["voltage"],
+                battery["current"],
+                battery["power"],
+                battery["percent"],
+            )
+        )
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is None:
+                return
+            try:
+                self.file.flush()
+                if self.owned:
+                    self.file.close()
+            except OSError as error:
+                print(f"Black box close failed: {error}", flush=True)
+            self.file = None
+
+
+def set_aside(path):
+    """Rename a log written in another format, so new records never land after its header."""
+
+    try:
+        with open(path, "rb") as file:
+            header = file.read(len(MAGIC))
+    except FileNotFoundError:
+        return
+    if header and header != MAGIC:
+        os.replace(path, f"{path}.old")
+        print(f"Black box log {path} is in an older format; moved it to {path}.old", flush=True)
+
+
+def split_names(data):
+    text = data.decode(errors="replace")
+    return text.split("\n") if text else []
+
+
+class Session:
+    """One recorded run: its start times and its records as (kind, time, *values) tuples."""
+
+    def __init__(self, started, wall_time):
+        self.started = started
+        self.wall_time = wall_time
+        self.records = []
+        self.truncated = False
+
+    @property
+    def duration(self):
+        return self.records[-1][1] - self.started if self.records else 0.0
+
+    def counts(self):
+        return Counter(NAMES[record[0]] for record in self.records)
+
+
+def parse_log(data):
+    """Split a black box log into Sessions; a record cut off by a crash ends the last one.
+
+    Controller records come back as (kind, time, x, y, rx, ry, lt, rt, hat_x,
+    hat_y, changed, buttons, held), with version 1 records filled in as a
+    centred pad with nothing held.
+    """
+
+    if data.startswith(MAGIC):
+        records = RECORDS
+    elif data.startswith(MAGIC_V1):
+        records = {**RECORDS, CONTROLLER: CONTROLLER_V1}
+    else:
+        raise ValueError("not a Diamond black box log")
+
+    sessions = []
+    offset = len(MAGIC)
+    while offset < len(data):
+        kind = data[offset]
+        record = records.get(kind)
+        if record is None:
+            raise ValueError(f"unknown record kind {kind} at byte {offset}")
+        if offset + record.size > len(data):
+            break
+
+        values = record.unpack_from(data, offset)
+        if kind == CONTROLLER:
+            if record is CONTROLLER_V1:
+                kind, at, x, y, changed, length = values
+                values = (kind, at, x, y, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, changed, length, 0)
+            lengths = values[-2:]
+            end = offset + record.size + sum(lengths)
+            if end > len(data):
+                break
+            names = data[offset + record.size : end]
+            values = (*values[:-2], split_names(names[: lengths[0]]), split_names(names[lengths[0] :]))
+            offset = end
+        else:
+            offset += record.size
+
+        if kind == SESSION:
+            sessions.append(Session(values[1], values[2]))
+        elif sessions:
+            sessions[-1].records.append(values)
+        else:
+            raise ValueError("log has records before its first session marker")
+
+    if offset < len(data) and sessions:
+        sessions[-1].truncated = True
+    return sessions
+
+
+def read_sessions(path):
+    with open(path, "rb") as file:
+        return parse_log(file.read())
+
+
+class SystemClock:
+    """Real monotonic time, for the live server."""
+
+    def __call__(self):
+        return monotonic()
+
+    async def wait(self, event, timeout):
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class ReplayClock:
+    """Virtual monotonic time that replays a session's records faster than real time.
+
+    wait() jumps straight to the next record or to the caller's timeout,
+    whichever comes first, and calls tick(period) at every control period it
+    passes on the way, starting from the session's first recorded tick so the
+    two line up. apply(record) feeds each record to the code under test.
+    Nothing waits on the wall clock, so a replay takes as long as the work it
+    does and gives the same result every run.
+    """
+
+    def __init__(self, session, apply, tick=None, period=0.005, tail=REPLAY_TAIL, on_finished=None):
+        self.records = session.records
+        self.apply = apply
+        self.tick = tick
+        self.period = period
+        self.time = session.started
+        self.origin = next((record[1] for record in self.records if record[0] == MIX), session.started)
+        self.end = session.started + session.duration + tail
+        self.ticks = 0
+        self.index = 0
+        self.finished = False
+        self.on_finished = on_finished
+
+    def __call__(self):
+        return self.time
+
+    def advance(self, until):
+        while self.tick is not None:
+            tick_time = self.origin + self.ticks * self.period
+            if tick_time > until:
+                break
+            self.time = tick_time
+            self.ticks += 1
+            self.tick(self.period)
+        self.time = max(self.time, until)
+
+    async def wait(self, event, timeout):
+        deadline = self.time + timeout
+        while not event.is_set():
+            if self.index < len(self.records) and self.records[self.index][1] <= deadline:
+                record = self.records[self.index]
+                self.index += 1
+                self.advance(record[1])
+                self.apply(record)
+                continue
+
+            self.advance(min(deadline, self.end))
+            if self.index >= len(self.records) and self.time >= self.end and not self.finished:
+                self.finished = True
+                if self.on_finished:
+                    self.on_finished()
+            break
+        # Let other tasks, such as a cancelled hardware_loop, run between steps.
+        await asyncio.sleep(0)
+
+
+class ReplayController:
+    """Stands in for XboxController, handing hardware_loop recorded states in order."""
+
+    name = "Black box replay"
+
+    def __init__(self):
+        self.pending = deque()
+        self.state = ControllerState()
+
+    def fileno(self):
+        return None
+
+    def push(self, x, y, rx, ry, lt, rt, hat_x, hat_y, changed, buttons, held):
+        self.pending.append(
+            ControllerState(
+                x=x,
+                y=y,
+                rx=rx,
+                ry=ry,
+                lt=lt,
+                rt=rt,
+                hat_x=hat_x,
+                hat_y=hat_y,
+                held=held,
+                buttons=buttons,
+                changed=changed,
+            )
+        )
+
+    def read(self):
+        if self.pending:
+            self.state = self.pending.popleft()
+            return self.state
+        # Between records the pad holds still: same axes and held buttons, nothing newly pressed.
+        state = self.state
+        return ControllerState(
+            x=state.x,
+            y=state.y,
+            rx=state.rx,
+            ry=state.ry,
+            lt=state.lt,
+            rt=state.rt,
+            hat_x=state.hat_x,
+            hat_y=state.hat_y,
+            held=state.held,
+        )
+
+    def close(self):
+        pass
+
+
+def compare_mix(recorded, replayed, lag=0.005):
+    """Largest differences between two sessions' mixed targets and motor outputs.
+
+    Each recorded mix record is compared with the replayed values in force
+    lag seconds before, at, and lag seconds after the same moment, taking the
+    closest, so an input that reached one run's tick a period before the
+    other's is not counted as a difference. Both sessions hold their last
+    value between records.
+    """
+
+    ours = [record for record in replayed if record[0] == MIX]
+    times = [record[1] for record in ours]
+    target_error = 0.0
+    output_error = 0.0
+    for record in recorded:
+        if record[0] != MIX:
+            continue
+        target = output = math.inf
+        for at in (record[1] - lag, record[1], record[1] + lag):
+            index = bisect.bisect_right(times, at) - 1
+            values = ours[index][4:] if index >= 0 else (0.0,) * 4
+            target = min(target, max(abs(a - b) for a, b in zip(record[4:6], values[:2])))
+            output = min(output, max(abs(a - b) for a, b in zip(record[6:8], values[2:])))
+        target_error = max(target_error, target)
+        output_error = max(output_error, output)
+    return {"target_error": target_error, "output_error": output_error}
+
+
+def describe(record):
+    kind, at, *values = record
+    fields = []
+    for value in values:
+        if isinstance(value, list):
+            fields.append(",".join(value) or "-")
+        elif isinstance(value, float):
+            fields.append(f"{value:.4f}")
+        else:
+            fields.append(str(value))
+    text = " ".join(fields)
+    return f"{at:12.4f} {NAMES[kind]:<10} {text}"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Summarize or dump a Diamond black box log; replay one with diamond.py --replay. "
+            "Import API: controllers.blackbox.read_sessions(path)."
+        )
+    )
+    parser.add_argument("log")
+    parser.add_argument("--dump", action="store_true", help="print every record")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for number, session in enumerate(read_sessions(args.log)):
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(session.wall_time))
+        counts = ", ".join(f"{name}={count}" for name, count in sorted(session.counts().items()))
+        note = " (truncated)" if session.truncated else ""
+        print(f"session {number}: {started}, {session.duration:.1f}s, {counts or 'no records'}{note}")
+        if args.dump:
+            for record in session.records:
+                print(describe(record))
+
+
+if __name__ == "__main__":
+    main()
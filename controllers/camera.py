@@ -1,7 +1,11 @@
 import argparse
 import subprocess
+import threading
+from collections import deque
 from pathlib import Path
+from time import monotonic, sleep
 
+from controllers.mp4 import Fragmenter, H264Sample, write_samples
 from controllers.utils import capture_path
 
 
@@ -10,6 +14,10 @@ DEFAULT_WIDTH = 1280
 DEFAULT_HEIGHT = 720
 DEFAULT_TIMEOUT_MS = 1000
 DEFAULT_VIDEO_CODEC = "h264"
+DEFAULT_FRAMERATE = 30
+DEFAULT_BITRATE = 4_000_000
+DEFAULT_INTRA_PERIOD = 15
+DEFAULT_PREROLL_BYTES = 32 * 1024 * 1024
 
 
 def default_image_path():
@@ -33,19 +41,334 @@ def list_cameras():
     return result.stdout.strip()
 
 
-def capture_image(
+class EncodedFrameFanout:
+    """picamera2 encoder output that hands each encoded frame to every subscriber.
+
+    picamera2 only needs start(), stop() and outputframe() from an output, so this
+    duck-types its Output class instead of importing picamera2 at module load.
+    Each frame is parsed into an H264Sample once, and subscribers are called with
+    (sample, frame), frame being the original Annex B bytes. Subscribers are
+    called on the encoder thread and must not block.
+    """
+
+    def __init__(self):
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self.lock:
+            self.subscribers = [*self.subscribers, callback]
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            self.subscribers = [item for item in self.subscribers if item is not callback]
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, *args, **kwargs):
+        subscribers = self.subscribers
+        if not subscribers:
+            return
+
+        frame = bytes(frame)
+        if timestamp is None:
+            timestamp = int(monotonic() * 1_000_000)
+        sample = H264Sample.from_annexb(frame, keyframe, timestamp)
+        for callback in subscribers:
+            try:
+                callback(sample, frame)
+            except Exception as error:
+                print(f"Camera frame subscriber failed: {error}", flush=True)
+
+
+class H264FileSink:
+    """Append Annex B H.264 to a file, starting at the first keyframe."""
+
+    def __init__(self, output_path):
+        self.output = Path(output_path)
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.output, "wb")
+        self.started = False
+
+    def __call__(self, sample, frame):
+        if not self.started and not sample.keyframe:
+            return
+
+        self.started = True
+        self.file.write(frame)
+
+    def close(self):
+        self.file.close()
+
+
+class Mp4FileSink:
+    """Mux H.264 straight into a fragmented MP4 file, one fragment per GOP.
+
+    The file is playable up to the last flushed GOP even if recording is cut
+    short, and nothing is written twice or remuxed afterwards.
+    """
+
+    def __init__(self, output_path, width, height, framerate):
+        self.output = Path(output_path)
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.output, "wb")
+        self.fragmenter = Fragmenter(width, height, framerate)
+        self.gop = []
+        self.started = False
+        self.lock = threading.Lock()
+
+    def __call__(self, sample, frame):
+        with self.lock:
+            if self.file.closed:
+                return
+
+            self.fragmenter.update_parameters(sample)
+            if not self.started:
+                if not sample.keyframe or self.fragmenter.init is None:
+                    return
+                self.file.write(self.fragmenter.init)
+                self.started = True
+
+            if sample.keyframe and self.gop:
+                self._flush()
+            self.gop.append(sample)
+
+    def _flush(self):
+        self.file.write(self.fragmenter.fragment(self.gop))
+        self.gop = []
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            if self.gop:
+                self._flush()
+            self.file.close()
+
+
+class Gop:
+    __slots__ = ("start", "samples", "size")
+
+    def __init__(self, start):
+        self.start = start
+        self.samples = []
+        self.size = 0
+
+
+class GopRing:
+    """Bounded in-memory history of encoded video, kept as whole GOPs.
+
+    The encoder thread only appends under a short lock; snapshots copy sample
+    references, so muxing a clip never holds up encoding. The oldest complete
+    GOP is evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_PREROLL_BYTES):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be greater than 0")
+
+        self.max_bytes = int(max_bytes)
+        self.gops = deque()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, sample, frame):
+        with self.lock:
+            if sample.keyframe:
+                self.gops.append(Gop(sample.timestamp))
+            elif not self.gops:
+                return
+
+            gop = self.gops[-1]
+            gop.samples.append(sample)
+            gop.size += len(sample.data)
+            self.size += len(sample.data)
+
+            while self.size > self.max_bytes and len(self.gops) > 1:
+                self.size -= self.gops.popleft().size
+
+    def seconds(self):
+        with self.lock:
+            if not self.gops:
+                return 0
+            return (self.gops[-1].samples[-1].timestamp - self.gops[0].start) / 1_000_000
+
+    def snapshot(self, seconds):
+        """Return samples covering at least the last seconds, starting on a keyframe."""
+
+        with self.lock:
+            if not self.gops:
+                return []
+
+            cutoff = self.gops[-1].samples[-1].timestamp - float(seconds) * 1_000_000
+            gops = list(self.gops)
+            first = 0
+            for index, gop in enumerate(gops):
+                if gop.start <= cutoff:
+                    first = index
+            return [sample for gop in gops[first:] for sample in gop.samples]
+
+    def since(self, timestamp):
+        """Return samples newer than timestamp, oldest first."""
+
+        with self.lock:
+            return [
+                sample
+                for gop in self.gops
+                for sample in gop.samples
+                if sample.timestamp > timestamp
+            ]
+
+
+class CameraService:
+    """Long-lived picamera2 owner that keeps the sensor and H.264 encoder warm.
+
+    Stills are taken from the running stream, so they skip rpicam-still's sensor
+    bring-up and warmup. Encoded video is fanned out to subscribers, which start
+    and stop without restarting the camera. picam2 takes a stand-in for
+    Picamera2, such as controllers.simulation.SyntheticCamera, that is already
+    configured and encodes its own frames.
+    """
+
+    def __init__(
+        self,
+        camera=DEFAULT_CAMERA,
+        width=DEFAULT_WIDTH,
+        height=DEFAULT_HEIGHT,
+        framerate=DEFAULT_FRAMERATE,
+        bitrate=DEFAULT_BITRATE,
+        intra_period=DEFAULT_INTRA_PERIOD,
+        preroll_bytes=DEFAULT_PREROLL_BYTES,
+        picam2=None,
+    ):
+        self.width = int(width)
+        self.height = int(height)
+        self.framerate = float(framerate)
+        if picam2 is None:
+            from picamera2 import Picamera2
+            from picamera2.encoders import H264Encoder
+
+            self.picam2 = Picamera2(camera)
+            self.picam2.configure(
+                self.picam2.create_video_configuration(
+                    main={"size": (self.width, self.height), "format": "RGB888"},
+                    controls={"FrameRate": self.framerate},
+                )
+            )
+            # Repeat SPS/PPS before every keyframe so any subscriber can start at one.
+            self.encoder = H264Encoder(bitrate=int(bitrate), repeat=True, iperiod=int(intra_period))
+        else:
+            self.picam2 = picam2
+            self.encoder = None
+        self.frames = EncodedFrameFanout()
+        self.subscribers = 0
+        self.lock = threading.Lock()
+        self.picam2.start()
+        # A pre-roll ring keeps the encoder running permanently.
+        self.preroll = GopRing(preroll_bytes) if preroll_bytes else None
+        if self.preroll is not None:
+            self.subscribe(self.preroll)
+
+    def close(self):
+        with self.lock:
+            if self.subscribers:
+                self.picam2.stop_encoder()
+                self.subscribers = 0
+        self.picam2.stop()
+        self.picam2.close()
+
+    def capture_still(self, output_path):
+        """Encode the newest frame from the running stream as a JPEG."""
+
+        output = Path(output_path)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        request = self.picam2.capture_request()
+        try:
+            request.save("main", str(output))
+        finally:
+            request.release()
+        return output
+
+    def subscribe(self, callback):
+        """Receive (sample, frame) for each encoded H.264 frame; see EncodedFrameFanout."""
+
+        with self.lock:
+            self.frames.subscribe(callback)
+            self.subscribers += 1
+            if self.subscribers == 1:
+                self.picam2.start_encoder(self.encoder, self.frames)
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            self.frames.unsubscribe(callback)
+            self.subscribers = max(0, self.subscribers - 1)
+            if self.subscribers == 0:
+                self.picam2.stop_encoder()
+
+    def start_recording(self, output_path):
+        """Start recording to .mp4 (muxed as captured) or raw .h264; returns the sink."""
+
+        if Path(output_path).suffix.lower() == ".mp4":
+            sink = Mp4FileSink(output_path, self.width, self.height, self.framerate)
+        else:
+            sink = H264FileSink(output_path)
+        self.subscribe(sink)
+        return sink
+
+    def stop_recording(self, sink):
+        self.unsubscribe(sink)
+        sink.close()
+        return sink.output
+
+    def save_clip(self, output_path, samples):
+        """Mux samples taken from the pre-roll ring into an MP4 file."""
+
+        output = Path(output_path)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        write_samples(output, samples, self.width, self.height, self.framerate)
+        return output
+
+    def record(self, output_path, seconds):
+        sink = self.start_recording(output_path)
+        try:
+            sleep(float(seconds))
+        finally:
+            self.stop_recording(sink)
+        return sink.output
+
+
+def connect_camera(
+    camera=DEFAULT_CAMERA,
+    width=DEFAULT_WIDTH,
+    height=DEFAULT_HEIGHT,
+    framerate=DEFAULT_FRAMERATE,
+    preroll_bytes=DEFAULT_PREROLL_BYTES,
+):
+    """Start a persistent camera pipeline or raise if picamera2 or the sensor is unavailable."""
+
+    return CameraService(
+        camera=camera,
+        width=width,
+        height=height,
+        framerate=framerate,
+        preroll_bytes=preroll_bytes,
+    )
+
+
+def still_command(
     output_path,
     camera=DEFAULT_CAMERA,
     width=DEFAULT_WIDTH,
     height=DEFAULT_HEIGHT,
     timeout_ms=DEFAULT_TIMEOUT_MS,
 ):
-    """Capture a still image from the Raspberry Pi camera."""
+    """Return the rpicam-still command line that captures one image."""
 
-    output = Path(output_path)
-    output.parent.mkdir(parents=True, exist_ok=True)
-
-    command = [
+    return [
         "rpicam-still",
         "--camera",
         str(camera),
@@ -56,14 +379,12 @@ def capture_image(
         "--timeout",
         str(int(timeout_ms)),
         "--output",
-        str(output),
+        str(output_path),
         "--nopreview",
     ]
-    subprocess.run(command, check=True, timeout=(int(timeout_ms) / 1000) + 10)
-    return output
 
 
-def record_video(
+def video_command(
     output_path,
     seconds=5,
     camera=DEFAULT_CAMERA,
@@ -71,16 +392,17 @@ def record_video(
     height=DEFAULT_HEIGHT,
     codec=DEFAULT_VIDEO_CODEC,
 ):
-    """Record video from the Raspberry Pi camera."""
+    """Return the rpicam-vid command line that records seconds of video."""
 
     duration_ms = int(float(seconds) * 1000)
     if duration_ms <= 0:
         raise ValueError("seconds must be greater than 0")
 
-    output = Path(output_path)
-    output.parent.mkdir(parents=True, exist_ok=True)
+    if Path(output_path).suffix.lower() == ".mp4" and codec == "h264":
+        # rpicam-vid's libav backend muxes H.264 into MP4 in one pass.
+        codec = "libav"
 
-    command = [
+    return [
         "rpicam-vid",
         "--camera",
         str(camera),
@@ -93,9 +415,54 @@ def record_video(
         "--codec",
         codec,
         "--output",
-        str(output),
+        str(output_path),
         "--nopreview",
     ]
+
+
+def capture_image(
+    output_path,
+    camera=DEFAULT_CAMERA,
+    width=DEFAULT_WIDTH,
+    height=DEFAULT_HEIGHT,
+    timeout_ms=DEFAULT_TIMEOUT_MS,
+    service=None,
+):
+    """Capture a still image, from a running CameraService when one is given."""
+
+    if service is not None:
+        return service.capture_still(output_path)
+
+    output = Path(output_path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    command = still_command(output, camera=camera, width=width, height=height, timeout_ms=timeout_ms)
+    subprocess.run(command, check=True, timeout=(int(timeout_ms) / 1000) + 10)
+    return output
+
+
+def record_video(
+    output_path,
+    seconds=5,
+    camera=DEFAULT_CAMERA,
+    width=DEFAULT_WIDTH,
+    height=DEFAULT_HEIGHT,
+    codec=DEFAULT_VIDEO_CODEC,
+    service=None,
+):
+    """Record video, from a running CameraService's H.264 encoder when one is given."""
+
+    duration_ms = int(float(seconds) * 1000)
+    if duration_ms <= 0:
+        raise ValueError("seconds must be greater than 0")
+
+    if service is not None:
+        if codec not in ("h264", "libav"):
+            raise ValueError("the camera service only records h264")
+        return service.record(output_path, seconds)
+
+    output = Path(output_path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    command = video_command(output, seconds, camera=camera, width=width, height=height, codec=codec)
     subprocess.run(command, check=True, timeout=(duration_ms / 1000) + 10)
     return output
 
@@ -104,7 +471,8 @@ def parse_args():
     parser = argparse.ArgumentParser(
         description=(
             "Capture images or video from Diamond's Raspberry Pi camera. "
-            "Import APIs: controllers.camera.capture_image(), record_video(), list_cameras()."
+            "Import APIs: controllers.camera.capture_image(), record_video(), list_cameras(), "
+            "connect_camera()."
         )
     )
     parser.add_argument("output", nargs="?")
@@ -0,0 +1,498 @@
+import argparse
+import bisect
+import os
+import queue
+import shutil
+import threading
+from pathlib import Path
+
+from controllers.utils import CAPTURE_DIR, claim_capture_path
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+KINDS = ("image", "video", "audio", "file")
+# Raw H.264 is an intermediate format, not something to browse.
+HIDDEN_SUFFIXES = (".h264",)
+
+MB = 1024 * 1024
+DEFAULT_QUOTAS = {"image": 2048 * MB, "video": 16384 * MB, "audio": 2048 * MB, "file": 1024 * MB}
+# Retention keeps at least this much of the card free for the OS and logs.
+DEFAULT_MIN_FREE_BYTES = 1024 * MB
+
+# tmpfs on Raspberry Pi OS; half of RAM by default and cleared at boot.
+STAGING_DIR = Path("/dev/shm/diamond-captures")
+# New captures go straight to the card when tmpfs has less room than this.
+STAGING_MIN_FREE_BYTES = 128 * MB
+FLUSH_CHUNK_BYTES = 4 * MB
+
+
+def capture_kind(path):
+    suffix = Path(path).suffix.lower()
+    if suffix in (".jpg", ".jpeg", ".png"):
+        return "image"
+    if suffix in (".mp4", ".webm"):
+        return "video"
+    if suffix in (".wav", ".raw", ".mp3"):
+        return "audio"
+    return "file"
+
+
+def listed(name):
+    # Dotfiles are .gitkeep, the preview cache and flushes still in progress.
+    return not name.startswith(".") and not name.endswith(HIDDEN_SUFFIXES)
+
+
+def snapshot(entries):
+    return {name: (entry.size, entry.mtime_ns) for name, entry in entries.items()}
+
+
+def encode_cursor(entry):
+    return f"{entry.mtime_ns}:{entry.name}"
+
+
+def decode_cursor(cursor):
+    mtime_ns, separator, name = str(cursor).partition(":")
+    if not separator or not mtime_ns.isdigit():
+        raise ValueError("invalid cursor")
+    return (-int(mtime_ns), name)
+
+
+class CaptureEntry:
+    __slots__ = ("name", "size", "mtime_ns", "kind")
+
+    def __init__(self, name, size, mtime_ns):
+        self.name = name
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.kind = capture_kind(name)
+
+    @property
+    def order(self):
+        """Sort key: newest first, then by name."""
+
+        return (-self.mtime_ns, self.name)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "size": self.size,
+            "url": f"/captures/{self.name}",
+            "kind": self.kind,
+            "modified": self.mtime_ns / 1e9,
+        }
+
+
+class CaptureCatalog:
+    """In-memory index of CAPTURE_DIR, kept in step without rescanning per request.
+
+    Writers call update(path) when a capture is finished, which records its final
+    size and the directory mtime its write left behind. Files created or
+    removed behind the catalog's back change the directory mtime, so every
+    read stats the directory once and rescans only when that has moved.
+    version increases whenever the listing changes.
+
+    enforce() applies retention: the oldest captures of a kind go once that
+    kind is over its quota, and the oldest of any kind go while the card has
+    less than min_free_bytes free. They are moved to archive if one is set,
+    otherwise deleted.
+    """
+
+    def __init__(
+        self,
+        directory=CAPTURE_DIR,
+        quotas=DEFAULT_QUOTAS,
+        min_free_bytes=DEFAULT_MIN_FREE_BYTES,
+        archive=None,
+    ):
+        self.directory = Path(directory)
+        self.quotas = dict(quotas or {})
+        self.min_free_bytes = min_free_bytes
+        self.archive = Path(archive) if archive else None
+        self.entries = {}
+        self.ordered = None
+        self.version = 0
+        self.scanned_mtime = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Rescan the directory if its mtime changed since the last scan."""
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        mtime = self.directory.stat().st_mtime_ns
+        if mtime == self.scanned_mtime:
+            return False
+
+        with self.lock:
+            entries = {}
+            with os.scandir(self.directory) as items:
+                for item in items:
+                    if not listed(item.name) or not item.is_file():
+                        continue
+                    stat = item.stat()
+                    entries[item.name] = CaptureEntry(item.name, stat.st_size, stat.st_mtime_ns)
+
+            self.scanned_mtime = mtime
+            changed = snapshot(entries) != snapshot(self.entries)
+            if changed:
+                self.entries = entries
+                self.ordered = None
+                self.version += 1
+        return changed
+
+    def update(self, path):
+        """Record a capture that was just written, or drop one that was deleted."""
+
+        path = Path(path)
+        if path.parent.resolve() != self.directory.resolve() or not listed(path.name):
+            return
+
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            stat = None
+
+        with self.lock:
+            # Writing or removing the file moved the directory mtime; adopt it so the
+            # next refresh() does not rescan for a change already recorded here.
+            if self.scanned_mtime is not None:
+                self.scanned_mtime = self.directory.stat().st_mtime_ns
+            current = self.entries.get(path.name)
+            if stat is None:
+                if current is None:
+                    return
+                added = None
+                del self.entries[path.name]
+            else:
+                if current and (current.size, current.mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+                    return
+                added = CaptureEntry(path.name, stat.st_size, stat.st_mtime_ns)
+                self.entries[path.name] = added
+            self._reorder(current, added)
+            self.version += 1
+
+    def _reorder(self, removed, added):
+        """Patch the listing order for one changed entry instead of sorting every entry again.
+
+        Readers may be walking the current lists, so the patch goes into copies.
+        """
+
+        if self.ordered is None:
+            return
+
+        entries, keys = list(self.ordered[0]), list(self.ordered[1])
+        if removed is not None:
+            index = bisect.bisect_left(keys, removed.order)
+            if index == len(keys) or keys[index] != removed.order:
+                self.ordered = None
+                return
+            del entries[index]
+            del keys[index]
+        if added is not None:
+            index = bisect.bisect_left(keys, added.order)
+            entries.insert(index, added)
+            keys.insert(index, added.order)
+        self.ordered = (entries, keys)
+
+    def _ordered(self):
+        """Return (entries, sort keys) in listing order; rebuilt only after a change."""
+
+        with self.lock:
+            if self.ordered is None:
+                entries = sorted(self.entries.values(), key=lambda entry: entry.order)
+                self.ordered = (entries, [entry.order for entry in entries])
+            return self.ordered
+
+    def summary(self):
+        self.refresh()
+        with self.lock:
+            return {"count": len(self.entries), "version": self.version}
+
+    def usage(self):
+        """Return the count and bytes of each kind, with its quota."""
+
+        self.refresh()
+        usage = {kind: {"count": 0, "bytes": 0, "quota": self.quotas.get(kind)} for kind in KINDS}
+        with self.lock:
+            for entry in self.entries.values():
+                usage[entry.kind]["count"] += 1
+                usage[entry.kind]["bytes"] += entry.size
+        return usage
+
+    def enforce(self):
+        """Retire the oldest captures until every kind fits its quota and the card has room.
+
+        The newest capture is always kept. Returns the names that were retired.
+        """
+
+        usage = {kind: item["bytes"] for kind, item in self.usage().items()}
+        free = shutil.disk_usage(self.directory).free
+        ordered, _ = self._ordered()
+        retired = []
+
+        for entry in reversed(ordered[1:]):
+            over_quota = {kind for kind, used in usage.items() if used > self.quotas.get(kind, used)}
+            low_space = free < self.min_free_bytes
+            if not over_quota and not low_space:
+                break
+            if not low_space and entry.kind not in over_quota:
+                continue
+
+            try:
+                self._retire(entry.name)
+            except OSError as error:
+                print(f"Could not retire capture {entry.name}: {error}", flush=True)
+                break
+
+            usage[entry.kind] -= entry.size
+            free += entry.size
+            retired.append(entry.name)
+            self.update(self.directory / entry.name)
+
+        return retired
+
+    def _retire(self, name):
+        path = self.directory / name
+        if self.archive is None:
+            path.unlink(missing_ok=True)
+            return
+
+        self.archive.mkdir(parents=True, exist_ok=True)
+        shutil.move(path, self.archive / name)
+
+    def page(self, kind=None, since=None, until=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Return one page of captures, newest first, and the cursor for the next page."""
+
+        self.refresh()
+        ordered, keys = self._ordered()
+        start = bisect.bisect_right(keys, decode_cursor(cursor)) if cursor else 0
+        if until is not None:
+            start = max(start, bisect.bisect_left(keys, (-int(until * 1e9), "")))
+
+        items = []
+        next_cursor = None
+        for entry in ordered[start:]:
+            if since is not None and entry.mtime_ns < since * 1e9:
+                break
+            if kind and entry.kind != kind:
+                continue
+            if len(items) == limit:
+                next_cursor = encode_cursor(items[-1])
+                break
+            items.append(entry)
+
+        return {
+            "captures": [entry.as_dict() for entry in items],
+            "next": next_cursor,
+            "version": self.version,
+        }
+
+
+class CaptureWriter:
+    """Stage new captures on tmpfs and copy them to the card from one background thread.
+
+    path() names a new capture in the staging directory. Recorders write there,
+    so their many small writes never reach the SD card. commit() queues the
+    finished file. The writer copies it to the capture directory in large
+    sequential chunks, syncs it once, and renames it into place. It then adds
+    the file to the catalog and applies retention. The capture is listed, and
+    served, only once that flush is done.
+    """
+
+    def __init__(
+        self,
+        catalog,
+        staging=STAGING_DIR,
+        on_flushed=None,
+        min_staging_free=STAGING_MIN_FREE_BYTES,
+        chunk_bytes=FLUSH_CHUNK_BYTES,
+    ):
+        self.catalog = catalog
+        self.directory = catalog.directory
+        self.staging = Path(staging) if staging else None
+        self.on_flushed = on_flushed
+        self.min_staging_free = min_staging_free
+        self.chunk_bytes = chunk_bytes
+        self.queue = queue.Queue()
+        self.pending = 0
+        self.flushed = 0
+        self.flushed_bytes = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+
+        self.thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+        self.thread.start()
+        # Anything still staged was left by a previous run; tmpfs survives a service restart.
+        if self.staging is not None and self.staging.is_dir():
+            for path in sorted(self.staging.iterdir()):
+                # An empty file is a name claimed by a capture that never started.
+                if path.is_file() and path.stat().st_size:
+                    self.commit(path)
+                elif path.is_file():
+                    self.discard(path)
+
+    def staging_ready(self):
+        if self.staging is None:
+            return False
+        try:
+            self.staging.mkdir(parents=True, exist_ok=True)
+            return shutil.disk_usage(self.staging).free >= self.min_staging_free
+        except OSError:
+            return False
+
+    def path(self, prefix, extension, bounded=True):
+        """Claim a new capture file: on tmpfs while it has room, else on the card.
+
+        Only bounded captures, such as stills, fixed-length videos and clips, are
+        staged. Open-ended recordings go straight to the card, since nothing
+        would stop them from filling tmpfs and with it the Pi's RAM. The file
+        is created empty under a unique name, so captures started together
+        never overwrite each other; discard() removes it if nothing is recorded.
+        """
+
+        if bounded and self.staging_ready():
+            return claim_capture_path(self.staging, prefix, extension, also=(self.directory,))
+        staging = (self.staging,) if self.staging is not None else ()
+        return claim_capture_path(self.directory, prefix, extension, also=staging)
+
+    def discard(self, path):
+        """Remove a claimed capture that was never written to."""
+
+        try:
+            if path.stat().st_size == 0:
+                path.unlink()
+        except OSError:
+            pass
+
+    def commit(self, path):
+        """Queue a finished capture for the card and return its final path."""
+
+        path = Path(path)
+        if self.staging is None or path.parent != self.staging:
+            self._finished(path)
+            return path
+
+        with self.lock:
+            self.pending += 1
+        self.queue.put(path)
+        return self.directory / path.name
+
+    def flush(self, source):
+        target = self.directory / source.name
+        partial = self.directory / f".{source.name}.partial"
+        buffer = bytearray(self.chunk_bytes)
+        view = memoryview(buffer)
+
+        with open(source, "rb") as reader, open(partial, "wb", buffering=0) as writer:
+            while True:
+                count = reader.readinto(buffer)
+                if not count:
+                    break
+                writer.write(view[:count])
+            os.fsync(writer.fileno())
+
+        os.replace(partial, target)
+        source.unlink()
+        size = target.stat().st_size
+        with self.lock:
+            self.flushed += 1
+            self.flushed_bytes += size
+        self._finished(target)
+
+    def _finished(self, path):
+        self.catalog.update(path)
+        if self.on_flushed:
+            self.on_flushed(path)
+
+    def _run(self):
+        self._enforce()
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            try:
+                self.flush(item)
+            except OSError as error:
+                # The staged copy is kept, so the next start retries it.
+                print(f"Capture flush failed for {item.name}: {error}", flush=True)
+            finally:
+                with self.lock:
+                    self.pending -= 1
+            self._enforce()
+
+    def _enforce(self):
+        try:
+            retired = self.catalog.enforce()
+        except OSError as error:
+            print(f"Capture retention failed: {error}", flush=True)
+            return
+        if retired:
+            print(f"Retired {len(retired)} old captures: {', '.join(retired)}", flush=True)
+            if self.on_flushed:
+                self.on_flushed(None)
+
+    def stats(self):
+        with self.lock:
+            return {"pending": self.pending, "flushed": self.flushed, "flushed_bytes": self.flushed_bytes}
+
+    def close(self):
+        """Flush everything queued so far, then stop the writer thread."""
+
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+
+def parse_quota(text):
+    kind, separator, megabytes = str(text).partition("=")
+    if not separator or kind not in KINDS:
+        raise argparse.ArgumentTypeError(f"quota must be KIND=MB with KIND one of {', '.join(KINDS)}")
+    return kind, int(float(megabytes) * MB)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "List Diamond's captures through the capture catalog. "
+            "Import API: controllers.captures.CaptureCatalog().page(kind='image')."
+        )
+    )
+    parser.add_argument("--kind", choices=KINDS)
+    parser.add_argument("--limit", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--usage", action="store_true", help="show bytes used against each kind's quota")
+    parser.add_argument(
+        "--enforce",
+        action="store_true",
+        help="retire the oldest captures that are over quota or below the free-space floor",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    catalog = CaptureCatalog()
+
+    if args.enforce:
+        for name in catalog.enforce():
+            print(f"retired {name}")
+    if args.usage:
+        for kind, usage in catalog.usage().items():
+            quota = f"{usage['quota'] / MB:.0f}" if usage["quota"] else "-"
+            print(f"{kind:5} {usage['count']:>6} files {usage['bytes'] / MB:>10.1f} MB of {quota} MB")
+    if args.usage or args.enforce:
+        return
+
+    page = catalog.page(kind=args.kind, limit=args.limit)
+    for capture in page["captures"]:
+        print(f"{capture['kind']:5} {capture['size']:>10} {capture['name']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import argparse
+import math
+import threading
+from time import monotonic, sleep
+
+from controllers.metrics import counter, histogram
+from controllers.motor_driver import BACKENDS, DEFAULT_BACKEND
+from controllers.rover import clamp, connect_rover, validate_speed
+
+
+DEFAULT_RATE = 200
+MIN_RATE = 100
+MAX_RATE = 500
+
+PERIOD_BUCKETS = (0.001, 0.002, 0.003, 0.004, 0.005, 0.006, 0.0075, 0.01, 0.015, 0.02, 0.05, 0.1)
+CONTROL_PERIOD = histogram(
+    "diamond_control_period_seconds",
+    "Time between motor control ticks",
+    buckets=PERIOD_BUCKETS,
+)
+INPUT_TO_MOTOR = histogram(
+    "diamond_input_to_motor_seconds",
+    "Time from a new drive command reaching the server to its first motor update",
+)
+MISSED_DEADLINES = counter("diamond_control_missed_deadlines_total", "Motor control periods skipped")
+# Power units per second: full scale in 0.25 s.
+DEFAULT_MAX_SLEW = 4.0
+# Power units per second squared: reaches full slew in 0.1 s.
+DEFAULT_MAX_ACCEL = 40.0
+
+
+def validate_rate(value):
+    rate = float(value)
+    if not MIN_RATE <= rate <= MAX_RATE:
+        raise ValueError(f"rate must be between {MIN_RATE} and {MAX_RATE} Hz")
+    return rate
+
+
+class SlewLimiter:
+    """Follow a target power with bounded rate of change and bounded acceleration."""
+
+    def __init__(self, max_slew=DEFAULT_MAX_SLEW, max_accel=DEFAULT_MAX_ACCEL):
+        if max_slew <= 0 or max_accel <= 0:
+            raise ValueError("max_slew and max_accel must be greater than 0")
+
+        self.max_slew = float(max_slew)
+        self.max_accel = float(max_accel)
+        self.value = 0.0
+        self.rate = 0.0
+
+    def reset(self, value=0.0):
+        self.value = float(value)
+        self.rate = 0.0
+
+    def step(self, target, dt):
+        error = float(target) - self.value
+        if error == 0 and self.rate == 0:
+            return self.value
+
+        # Fastest approach that can still decelerate onto the target within max_accel.
+        braking_rate = math.sqrt(2 * self.max_accel * abs(error))
+        desired = math.copysign(min(self.max_slew, braking_rate), error)
+        max_change = self.max_accel * dt
+        self.rate = clamp(desired, self.rate - max_change, self.rate + max_change)
+
+        step = self.rate * dt
+        if (step > 0) == (error > 0) and abs(step) >= abs(error):
+            self.value = float(target)
+            self.rate = 0.0
+            return self.value
+
+        self.value = clamp(self.value + step)
+        return self.value
+
+
+class ControlStats:
+    """Period jitter and missed-deadline counters for a fixed-rate loop."""
+
+    def __init__(self, period):
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self.ticks = 0
+        self.missed = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.last_jitter = 0.0
+
+    def record(self, lateness, missed=0):
+        self.ticks += 1
+        self.missed += missed
+        self.last_jitter = lateness
+        self.jitter_sum += lateness
+        self.jitter_max = max(self.jitter_max, lateness)
+
+    def snapshot(self):
+        mean = self.jitter_sum / self.ticks if self.ticks else 0
+        return {
+            "rate": 1 / self.period,
+            "ticks": self.ticks,
+            "missed_deadlines": self.missed,
+            "jitter_mean_ms": mean * 1000,
+            "jitter_max_ms": self.jitter_max * 1000,
+            "jitter_last_ms": self.last_jitter * 1000,
+        }
+
+
+class ControlScheduler:
+    """Fixed-rate motor output thread that slew-limits mixed drive commands.
+
+    Callers set a drive target from any thread; the scheduler thread wakes on an
+    absolute deadline every period, mixes the target for the connected rover, and
+    ramps each side toward it so the L298 supply never sees a step in current.
+    A recorder, such as a BlackBox, is given every change in the mixed output;
+    clock can be swapped for a ReplayClock to run ticks on virtual time.
+    """
+
+    def __init__(
+        self,
+        rover,
+        rate=DEFAULT_RATE,
+        max_slew=DEFAULT_MAX_SLEW,
+        max_accel=DEFAULT_MAX_ACCEL,
+        clock=monotonic,
+        recorder=None,
+    ):
+        self.rover = rover
+        self.clock = clock
+        self.recorder = recorder
+        self.recorded = None
+        self.period = 1 / validate_rate(rate)
+        self.left = SlewLimiter(max_slew, max_accel)
+        self.right = SlewLimiter(max_slew, max_accel)
+        self.stats = ControlStats(self.period)
+        self.target = (0.0, 0.0)
+        # When the current target arrived, until a tick has applied it.
+        self.target_received = None
+        self.output = {"left": 0.0, "right": 0.0}
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="diamond-control", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+        self.stop()
+
+    def drive(self, x, y, received=None):
+        """Set the drive target; received is the monotonic time the command arrived."""
+
+        target = (float(x), float(y))
+        if target != self.target:
+            self.target_received = self.clock() if received is None else received
+        self.target = target
+
+    def halt(self):
+        """Ramp both sides down to zero."""
+
+        self.target = (0.0, 0.0)
+
+    def stop(self):
+        """Stop immediately, bypassing the slew limits."""
+
+        with self.lock:
+            self.target = (0.0, 0.0)
+            self.left.reset()
+            self.right.reset()
+            self.output = {"left": 0.0, "right": 0.0}
+            if self.rover.device:
+                self.rover.device.stop()
+
+    def tick(self, dt):
+        with self.lock:
+            device = self.rover.device
+            if device is None:
+                self.left.reset()
+                self.right.reset()
+                return None
+
+            x, y = self.target
+            left_target, right_target = device.mix(x, y)
+            left_power = self.left.step(left_target, dt)
+            right_power = self.right.step(right_target, dt)
+            if left_power or right_power:
+                device.move(left_power, right_power)
+            elif self.output["left"] or self.output["right"]:
+                # The ramp just landed on zero, as after halt(): stop outright so no
+                # backend is left with a residual duty cycle or direction bits set.
+                device.stop()
+            self.output = {"left": left_power, "right": right_power}
+
+            if self.recorder is not None:
+                mix = ((x, y), (left_target, right_target), (left_power, right_power))
+                # Only changes are logged; a steady output holds until the next record.
+                if mix != self.recorded:
+                    self.recorder.mix(self.clock(), *mix)
+                    self.recorded = mix
+
+            received = self.target_received
+            if received is not None:
+                self.target_received = None
+                INPUT_TO_MOTOR.observe(self.clock() - received)
+            return self.output
+
+    def _run(self):
+        deadline = monotonic()
+        previous = None
+
+        while self.running:
+            deadline += self.period
+            delay = deadline - monotonic()
+            if delay > 0:
+                sleep(delay)
+
+            now = monotonic()
+            lateness = max(0.0, now - deadline)
+            missed = int(lateness // self.period)
+            if missed:
+                # Skip the periods we slept through instead of bursting to catch up.
+                deadline += missed * self.period
+
+            self.stats.record(lateness - missed * self.period, missed)
+            if missed:
+                MISSED_DEADLINES.inc(missed)
+            if previous is not None:
+                CONTROL_PERIOD.observe(now - previous)
+            previous = now
+
+            try:
+                self.tick(self.period)
+            except Exception as error:
+                print(f"Control tick failed: {error}", flush=True)
+                self.stop()
+
+
+class _FixedRover:
+    def __init__(self, device):
+        self.device = device
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Run Diamond's fixed-rate motor control loop and report timing jitter. "
+            "Import API: controllers.control.ControlScheduler(rover_controller)."
+        )
+    )
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="control rate in Hz")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--throttle", type=float, default=0.5, help="forward command to ramp toward")
+    parser.add_argument("--max-speed", type=float, default=0.5)
+    parser.add_argument("--max-slew", type=float, default=DEFAULT_MAX_SLEW)
+    parser.add_argument("--max-accel", type=float, default=DEFAULT_MAX_ACCEL)
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="motor driver backend")
+    parser.add_argument("--dry-run", action="store_true", help="measure timing without motor output")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    device = None if args.dry_run else connect_rover(validate_speed(args.max_speed), backend=args.backend)
+    scheduler = ControlScheduler(
+        _FixedRover(device),
+        rate=args.rate,
+        max_slew=args.max_slew,
+        max_accel=args.max_accel,
+    )
+    scheduler.start()
+    try:
+        scheduler.drive(0, args.throttle)
+        sleep(args.seconds)
+    finally:
+        scheduler.close()
+
+    stats = scheduler.stats.snapshot()
+    print(
+        f"rate={stats['rate']:.0f}Hz ticks={stats['ticks']} missed={stats['missed_deadlines']} "
+        f"jitter_mean={stats['jitter_mean_ms']:.3f}ms jitter_max={stats['jitter_max_ms']:.3f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
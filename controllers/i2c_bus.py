@@ -0,0 +1,270 @@
+import argparse
+import heapq
+import itertools
+import threading
+from time import perf_counter
+
+from controllers.metrics import histogram
+
+try:
+    from smbus2 import SMBus
+except ImportError:
+    from smbus import SMBus
+
+
+DEFAULT_BUS = 1
+# Lower numbers run first.
+PRIORITY_TELEMETRY = 0
+PRIORITY_DEFAULT = 5
+PRIORITY_DISPLAY = 10
+# Addresses probed by --scan; 0x00-0x02 and 0x78-0x7F are reserved.
+SCAN_ADDRESSES = range(0x03, 0x78)
+
+TRANSACTION_SECONDS = histogram(
+    "diamond_i2c_transaction_seconds",
+    "Time the I2C bus spent on one transaction",
+    labels=("device",),
+)
+WAIT_SECONDS = histogram(
+    "diamond_i2c_wait_seconds",
+    "Time an I2C transaction waited in the queue",
+    labels=("device",),
+)
+
+
+class Transaction:
+    """A queued unit of bus work and, once run, its result."""
+
+    def __init__(self, device, function, priority, key):
+        self.device = device
+        self.function = function
+        self.priority = priority
+        self.key = key
+        self.queued_at = perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.superseded_by = None
+        self.callbacks = []
+
+    def add_done_callback(self, callback):
+        """Call callback(transaction) on the bus thread once this finishes."""
+
+        self.callbacks.append(callback)
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+        for callback in self.callbacks:
+            try:
+                callback(self)
+            except Exception as callback_error:
+                print(f"I2C callback for {self.device} failed: {callback_error}", flush=True)
+
+    def wait(self, timeout=None):
+        """Return the result, following coalesced writes to the one that actually ran."""
+
+        transaction = self
+        while True:
+            if not transaction.done.wait(timeout):
+                raise TimeoutError(f"I2C transaction for {self.device} timed out")
+            if transaction.superseded_by is None:
+                break
+            transaction = transaction.superseded_by
+
+        if transaction.error is not None:
+            raise transaction.error
+        return transaction.result
+
+
+class DeviceStats:
+    def __init__(self):
+        self.transactions = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.busy_sum = 0.0
+        self.busy_max = 0.0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited, busy, failed):
+        self.transactions += 1
+        self.errors += int(failed)
+        self.busy_sum += busy
+        self.busy_max = max(self.busy_max, busy)
+        self.wait_sum += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def snapshot(self):
+        count = self.transactions or 1
+        return {
+            "transactions": self.transactions,
+            "errors": self.errors,
+            "coalesced": self.coalesced,
+            "latency_mean_ms": self.busy_sum / count * 1000,
+            "latency_max_ms": self.busy_max * 1000,
+            "wait_mean_ms": self.wait_sum / count * 1000,
+            "wait_max_ms": self.wait_max * 1000,
+        }
+
+
+class I2CBus:
+    """Single owner of one /dev/i2c-N, running device work from a priority queue.
+
+    Every transaction is a function called with the SMBus on the bus thread, so
+    devices never interleave transfers. Equal priorities run in submit order. A
+    transaction submitted with a key replaces any queued one with the same key,
+    so a burst of display writes collapses to the newest. The bus is opened on
+    first use and then kept open, since devices hold on to the SMBus object.
+    An int opens that bus; anything else is an SMBus-like object owned by the
+    caller, such as the simulated bus in controllers.simulation.
+    """
+
+    def __init__(self, bus=DEFAULT_BUS):
+        self.owns_bus = isinstance(bus, int)
+        self.bus_number = bus if self.owns_bus else None
+        self.smbus = None if self.owns_bus else bus
+        self.queue = []
+        self.pending = {}
+        self.order = itertools.count()
+        self.stats = {}
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="diamond-i2c", daemon=True)
+        self.thread.start()
+
+    def submit(self, device, function, priority=PRIORITY_DEFAULT, key=None):
+        """Queue function(smbus) and return its Transaction without waiting."""
+
+        transaction = Transaction(device, function, priority, key)
+
+        with self.condition:
+            if not self.running:
+                raise RuntimeError("I2C bus is closed")
+
+            if key is not None:
+                previous = self.pending.get(key)
+                if previous is not None:
+                    previous.superseded_by = transaction
+                    previous.done.set()
+                    self._stats(device).coalesced += 1
+                self.pending[key] = transaction
+
+            heapq.heappush(self.queue, (priority, next(self.order), transaction))
+            self.condition.notify()
+
+        return transaction
+
+    def run(self, device, function, priority=PRIORITY_DEFAULT, key=None, timeout=None):
+        """Queue function(smbus), wait for it and return its result."""
+
+        return self.submit(device, function, priority, key).wait(timeout)
+
+    def snapshot(self):
+        with self.condition:
+            return {device: stats.snapshot() for device, stats in self.stats.items()}
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(timeout=2)
+
+    def _stats(self, device):
+        stats = self.stats.get(device)
+        if stats is None:
+            stats = self.stats[device] = DeviceStats()
+        return stats
+
+    def _next(self):
+        with self.condition:
+            while self.running or self.queue:
+                while self.queue:
+                    _, _, transaction = heapq.heappop(self.queue)
+                    if transaction.superseded_by is not None:
+                        continue
+                    if self.pending.get(transaction.key) is transaction:
+                        del self.pending[transaction.key]
+                    return transaction
+                if not self.running:
+                    break
+                self.condition.wait()
+        return None
+
+    def _execute(self, transaction):
+        started = perf_counter()
+        result = None
+        error = None
+
+        try:
+            if self.smbus is None:
+                self.smbus = SMBus(self.bus_number)
+            result = transaction.function(self.smbus)
+        except Exception as exception:
+            error = exception
+
+        finished = perf_counter()
+        TRANSACTION_SECONDS.labels(transaction.device).observe(finished - started)
+        WAIT_SECONDS.labels(transaction.device).observe(started - transaction.queued_at)
+        with self.condition:
+            self._stats(transaction.device).record(
+                started - transaction.queued_at,
+                finished - started,
+                error is not None,
+            )
+        transaction.finish(result, error)
+
+    def _run(self):
+        while True:
+            transaction = self._next()
+            if transaction is None:
+                break
+            self._execute(transaction)
+
+        if self.smbus is not None and self.owns_bus:
+            self.smbus.close()
+            self.smbus = None
+
+
+def probe(smbus, address):
+    try:
+        smbus.read_byte(address)
+    except OSError:
+        return False
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Scan Diamond's I2C bus through the shared bus manager and report timing. "
+            "Import API: controllers.i2c_bus.I2CBus().run(device, function, priority)."
+        )
+    )
+    parser.add_argument("--bus", type=int, default=DEFAULT_BUS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    bus = I2CBus(args.bus)
+    try:
+        found = [
+            address
+            for address in SCAN_ADDRESSES
+            if bus.run("scan", lambda smbus, address=address: probe(smbus, address))
+        ]
+    finally:
+        bus.close()
+
+    print("devices: " + (" ".join(f"0x{address:02x}" for address in found) or "none"))
+    stats = bus.snapshot()["scan"]
+    print(
+        f"transactions={stats['transactions']} latency_mean={stats['latency_mean_ms']:.3f}ms "
+        f"latency_max={stats['latency_max_ms']:.3f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import functools
+import itertools
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import monotonic
+
+from controllers.metrics import DURATION_BUCKETS, counter, histogram
+
+
+# Jobs sharing a resource run one after another; each resource gets this many slots.
+DEFAULT_LIMITS = {"camera": 1, "speaker": 1, "media": 1}
+DEFAULT_WORKERS = 2
+JOB_HISTORY = 50
+# How long a cancelled subprocess gets to exit after SIGTERM before SIGKILL.
+TERMINATE_GRACE = 2.0
+ERROR_TAIL = 400
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+FINISHED = (DONE, FAILED, CANCELLED, TIMEOUT)
+
+SUBPROCESS_SECONDS = histogram(
+    "diamond_subprocess_seconds",
+    "Run time of subprocesses started by jobs",
+    labels=("command",),
+    buckets=DURATION_BUCKETS,
+)
+JOBS_TOTAL = counter("diamond_jobs_total", "Jobs finished, by kind and final state", labels=("kind", "state"))
+
+
+class Job:
+    """One unit of media work and its progress, as reported by /api/jobs."""
+
+    def __init__(self, id, kind, resource, timeout=None, expected_seconds=None):
+        self.id = id
+        self.kind = kind
+        self.resource = resource
+        self.timeout = timeout
+        self.expected_seconds = expected_seconds
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.created = monotonic()
+        self.started = None
+        self.finished = None
+        self.task = None
+        self.cancel_requested = False
+
+    @property
+    def done(self):
+        return self.state in FINISHED
+
+    @property
+    def progress(self):
+        """Fraction complete; estimated from elapsed time when the work has a known length."""
+
+        if self.state == DONE:
+            return 1.0
+        if self.started is None:
+            return 0.0
+        if self.expected_seconds:
+            end = self.finished or monotonic()
+            return min(0.99, (end - self.started) / self.expected_seconds)
+        return 0.0
+
+    async def wait(self):
+        await asyncio.wait({self.task})
+        return self
+
+    def as_dict(self):
+        now = monotonic()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "resource": self.resource,
+            "state": self.state,
+            "progress": round(self.progress, 2),
+            "result": self.result,
+            "error": self.error,
+            "age": round(now - self.created, 1),
+            "runtime": round((self.finished or now) - self.started, 1) if self.started else None,
+        }
+
+
+class JobRunner:
+    """Run media work off the control path, with per-resource limits, timeouts and cancellation.
+
+    submit() starts a job on the event loop and returns it at once. The work
+    coroutine waits for a slot on its resource, then runs under the job's
+    timeout. Subprocesses go through run_process(), which uses asyncio
+    subprocesses rather than threads and terminates the process when the job
+    is cancelled or times out. Blocking library calls go through
+    run_blocking(), which uses the runner's own small thread pool, so media
+    work never takes the default executor slots that hardware_loop uses.
+    """
+
+    def __init__(self, limits=DEFAULT_LIMITS, workers=DEFAULT_WORKERS, history=JOB_HISTORY, on_change=None):
+        self.limits = dict(limits)
+        self.history = history
+        self.on_change = on_change
+        self.semaphores = {}
+        self.jobs = OrderedDict()
+        self.ids = itertools.count(1)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def submit(self, kind, resource, work, timeout=None, expected_seconds=None):
+        """Schedule work(job) and return the Job without waiting for it."""
+
+        job = Job(next(self.ids), kind, resource, timeout=timeout, expected_seconds=expected_seconds)
+        job.task = asyncio.create_task(self._run(job, work))
+        self.jobs[job.id] = job
+        self._trim()
+        self._changed()
+        return job
+
+    def _semaphore(self, resource):
+        if resource not in self.semaphores:
+            self.semaphores[resource] = asyncio.Semaphore(self.limits.get(resource, 1))
+        return self.semaphores[resource]
+
+    async def _run(self, job, work):
+        try:
+            async with self._semaphore(job.resource):
+                job.state = RUNNING
+                job.started = monotonic()
+                self._changed()
+                job.result = await asyncio.wait_for(work(job), job.timeout)
+                job.state = DONE
+        except asyncio.TimeoutError:
+            job.state = TIMEOUT
+            job.error = f"timed out after {job.timeout:g}s"
+        except asyncio.CancelledError:
+            job.state = CANCELLED
+        except Exception as error:
+            job.state = FAILED
+            job.error = str(error) or repr(error)
+        finally:
+            job.finished = monotonic()
+            JOBS_TOTAL.labels(job.kind, job.state).inc()
+            self._changed()
+
+        if job.state == FAILED:
+            print(f"Job {job.id} ({job.kind}) failed: {job.error}", flush=True)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[: max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job_id]
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    async def run_process(self, command, timeout=None):
+        """Run a command as an asyncio subprocess, killing it if the caller is cancelled."""
+
+        started = monotonic()
+        process = await asyncio.create_subprocess_exec(
+            *[str(part) for part in command],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except BaseException:
+            await stop_process(process)
+            raise
+        finally:
+            SUBPROCESS_SECONDS.labels(Path(str(command[0])).name).observe(monotonic() - started)
+
+        if process.returncode != 0:
+            message = stderr.decode(errors="replace").strip()[-ERROR_TAIL:]
+            raise RuntimeError(f"{command[0]} exited with {process.returncode}: {message}")
+
+    async def run_blocking(self, function, *args, **kwargs):
+        """Run a blocking call on the runner's thread pool."""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it had already finished."""
+
+        job = self.jobs.get(job_id)
+        if job is None or job.done:
+            return False
+        # A second cancel would interrupt the first one's cleanup, such as waiting for a process to exit.
+        if not job.cancel_requested:
+            job.cancel_requested = True
+            job.task.cancel()
+        return True
+
+    def list(self):
+        return [job.as_dict() for job in reversed(self.jobs.values())]
+
+    def active(self):
+        return [job.as_dict() for job in self.jobs.values() if not job.done]
+
+    async def close(self):
+        tasks = [job.task for job in self.jobs.values() if not job.done]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def stop_process(process):
+    if process.returncode is not None:
+        return
+
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), TERMINATE_GRACE)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Run a command as a job, with a timeout and Ctrl-C cancellation. "
+            "Import API: controllers.jobs.JobRunner().submit(kind, resource, work)."
+        )
+    )
+    parser.add_argument("command", nargs="+")
+    parser.add_argument("--timeout", type=float)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    async def run():
+        runner = JobRunner()
+        job = runner.submit(
+            "command",
+            "media",
+            lambda job: runner.run_process(args.command),
+            timeout=args.timeout,
+        )
+        try:
+            await job.wait()
+        finally:
+            await runner.close()
+        print(f"{job.state}{': ' + job.error if job.error else ''} in {job.as_dict()['runtime']}s")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,12 @@ import argparse
 import time
 
 try:
-    from smbus2 import SMBus
+    from smbus2 import SMBus, i2c_msg
 except ImportError:
     from smbus import SMBus
 
+    i2c_msg = None
+
 
 DEFAULT_BUS = 1
 DEFAULT_ADDRESS = 0x27
@@ -16,9 +18,28 @@ BACKLIGHT = 0x08
 ENABLE = 0x04
 REGISTER_SELECT = 0x01
 
+SET_DDRAM_ADDRESS = 0x80
+LINE_ADDRESSES = (0x00, 0x40)
+# Largest SMBus block write when smbus2's combined transfers are unavailable.
+BLOCK_LIMIT = 32
+
+# HD44780 datasheet waits. Everything else (450 ns enable pulse, 37 us command
+# time) is shorter than one PCF8574 byte on the I2C bus, even at 400 kHz, so
+# batched writes need no sleeps between bytes.
+POWER_ON_DELAY = 0.05
+INIT_DELAY = 0.0045
+INIT_SHORT_DELAY = 0.00015
+CLEAR_DELAY = 0.002
+
 
 class LedDisplay:
-    """HD44780 character LCD connected through a PCF8574 I2C backpack."""
+    """HD44780 character LCD connected through a PCF8574 I2C backpack.
+
+    The display keeps a shadow copy of what is on screen. write() and
+    write_line() send only the cells that changed, move the cursor past runs
+    of unchanged cells, and push the whole update to the backpack as one I2C
+    transfer.
+    """
 
     def __init__(
         self,
@@ -31,49 +52,95 @@ class LedDisplay:
         self.address = address
         self.columns = columns
         self.backlight = backlight
-        self.bus = SMBus(bus)
+        # An int opens that bus; anything else is an SMBus-like object owned by the caller.
+        self.owns_bus = isinstance(bus, int)
+        self.bus = SMBus(bus) if self.owns_bus else bus
+        self.shadow = None
+        self.cursor = None
+        self.output = 0
         self.initialize()
 
     def close(self):
-        self.bus.close()
+        if self.owns_bus:
+            self.bus.close()
 
     def _backlight_bit(self):
         return BACKLIGHT if self.backlight else 0
 
     def _write_raw(self, value):
-        self.bus.write_byte(self.address, value | self._backlight_bit())
-        time.sleep(0.0002)
-
-    def _pulse(self, value):
-        self._write_raw(value | ENABLE)
-        time.sleep(0.001)
-        self._write_raw(value & ~ENABLE)
-        time.sleep(0.001)
+        self._send([value | self._backlight_bit()])
+
+    def _send(self, data):
+        """Write PCF8574 output bytes in order; the backpack latches each one as it arrives."""
+
+        if not data:
+            return
+
+        try:
+            if i2c_msg is not None:
+                self.bus.i2c_rdwr(i2c_msg.write(self.address, data))
+            elif len(data) == 1:
+                self.bus.write_byte(self.address, data[0])
+            else:
+                # The "register" byte of a block write is latched like any other output byte.
+                for start in range(0, len(data), BLOCK_LIMIT + 1):
+                    chunk = data[start : start + BLOCK_LIMIT + 1]
+                    self.bus.write_i2c_block_data(self.address, chunk[0], list(chunk[1:]))
+        except OSError:
+            self.invalidate()
+            raise
+
+        self.output = data[-1]
+
+    def _nibble_bytes(self, data, value, mode):
+        backlight = self._backlight_bit()
+        bits = ((value & 0x0F) << 4) | mode | backlight
+        previous = data[-1] if data else self.output
+
+        if (previous ^ bits) & REGISTER_SELECT:
+            # RS must settle before enable rises; data lines only need to be valid at the fall.
+            data.append(bits)
+        data.append(bits | ENABLE)
+        data.append(bits)
+
+    def _byte_bytes(self, data, value, mode):
+        self._nibble_bytes(data, value >> 4, mode)
+        self._nibble_bytes(data, value, mode)
 
     def _write_nibble(self, value, mode=0):
-        self._pulse(((value & 0x0F) << 4) | mode)
+        data = []
+        self._nibble_bytes(data, value, mode)
+        self._send(data)
 
     def _write_byte(self, value, mode=0):
-        self._write_nibble(value >> 4, mode)
-        self._write_nibble(value, mode)
-        time.sleep(0.003)
+        data = []
+        self._byte_bytes(data, value, mode)
+        self._send(data)
 
     def command(self, value):
         self._write_byte(value, 0)
+        self.cursor = None
 
     def character(self, value):
         self._write_byte(ord(value), REGISTER_SELECT)
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget the screen contents so the next write redraws every cell."""
+
+        self.shadow = None
+        self.cursor = None
 
     def initialize(self):
+        self.invalidate()
         self._write_raw(0)
-        time.sleep(0.05)
+        time.sleep(POWER_ON_DELAY)
 
-        for _ in range(3):
+        for delay in (INIT_DELAY, INIT_SHORT_DELAY, INIT_SHORT_DELAY):
             self._write_nibble(0x03)
-            time.sleep(0.01)
+            time.sleep(delay)
 
         self._write_nibble(0x02)
-        time.sleep(0.01)
 
         self.command(0x28)
         self.command(0x08)
@@ -83,25 +150,99 @@ class LedDisplay:
 
     def clear(self):
         self.command(0x01)
-        time.sleep(0.01)
+        time.sleep(CLEAR_DELAY)
+        self.shadow = [" " * self.columns for _ in LINE_ADDRESSES]
+        self.cursor = LINE_ADDRESSES[0]
 
     def set_backlight(self, enabled):
         self.backlight = bool(enabled)
         self._write_raw(0)
 
+    def _line_bytes(self, data, line, text):
+        padded = str(text)[: self.columns].ljust(self.columns)
+        shown = self.shadow[line] if self.shadow else None
+        base = LINE_ADDRESSES[line]
+        column = 0
+
+        while column < self.columns:
+            if shown is not None and padded[column] == shown[column]:
+                column += 1
+                continue
+
+            # Extend the run while the next change is close enough that rewriting
+            # one unchanged cell is cheaper than a cursor move.
+            end = column + 1
+            while end < self.columns:
+                if shown is None or padded[end] != shown[end]:
+                    end += 1
+                elif end + 1 < self.columns and padded[end + 1] != shown[end + 1]:
+                    end += 2
+                else:
+                    break
+
+            if self.cursor != base + column:
+                self._byte_bytes(data, SET_DDRAM_ADDRESS | (base + column), 0)
+            for character in padded[column:end]:
+                self._byte_bytes(data, ord(character), REGISTER_SELECT)
+            self.cursor = base + end
+            column = end
+
+        return padded
+
+    def _render(self, lines):
+        data = []
+        shadow = list(self.shadow) if self.shadow else [None] * len(LINE_ADDRESSES)
+
+        try:
+            for line, text in lines:
+                shadow[line] = self._line_bytes(data, line, text)
+            self._send(data)
+        except Exception:
+            self.invalidate()
+            raise
+
+        # Until both lines have been drawn the other line's contents are unknown.
+        self.shadow = shadow if None not in shadow else None
+
     def write_line(self, line, text):
         if line not in (0, 1):
             raise ValueError("line must be 0 or 1")
 
-        self.command(0x80 if line == 0 else 0xC0)
-        padded = str(text)[: self.columns].ljust(self.columns)
-
-        for character in padded:
-            self.character(character)
+        self._render([(line, text)])
 
     def write(self, line1="", line2=""):
-        self.write_line(0, line1)
-        self.write_line(1, line2)
+        self._render([(0, line1), (1, line2)])
+
+
+class CountingBus:
+    """SMBus wrapper that counts transfers and bytes, or swallows them when dry."""
+
+    def __init__(self, bus=None):
+        self.bus = bus
+        self.transactions = 0
+        self.bytes = 0
+
+    def write_byte(self, address, value):
+        self.transactions += 1
+        self.bytes += 1
+        if self.bus is not None:
+            self.bus.write_byte(address, value)
+
+    def write_i2c_block_data(self, address, register, data):
+        self.transactions += 1
+        self.bytes += 1 + len(data)
+        if self.bus is not None:
+            self.bus.write_i2c_block_data(address, register, data)
+
+    def i2c_rdwr(self, *messages):
+        self.transactions += 1
+        self.bytes += sum(message.len for message in messages)
+        if self.bus is not None:
+            self.bus.i2c_rdwr(*messages)
+
+    def close(self):
+        if self.bus is not None:
+            self.bus.close()
 
 
 def write_display(
@@ -124,6 +265,33 @@ def write_display(
         display.close()
 
 
+def benchmark(display, updates=50):
+    """Time full redraws against diff updates of a status line whose battery digit changes."""
+
+    counter = display.bus
+    results = {}
+
+    for mode in ("full", "diff"):
+        display.clear()
+        transactions = counter.transactions
+        sent = counter.bytes
+        started = time.perf_counter()
+
+        for index in range(updates):
+            if mode == "full":
+                display.invalidate()
+            display.write(f"BAT {80 - index % 10}% WIFI 3/4", "Diamond online")
+
+        elapsed = time.perf_counter() - started
+        results[mode] = {
+            "transactions": (counter.transactions - transactions) / updates,
+            "bytes": (counter.bytes - sent) / updates,
+            "ms": elapsed / updates * 1000,
+        }
+
+    return results
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description=(
@@ -138,11 +306,31 @@ def parse_args():
     parser.add_argument("--columns", type=int, default=DEFAULT_COLUMNS)
     parser.add_argument("--no-backlight", action="store_true")
     parser.add_argument("--no-clear", action="store_true")
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="report bus transactions, bytes and wall time per update for full and diff redraws",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="benchmark without an LCD attached")
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
+
+    if args.benchmark:
+        counter = CountingBus(None if args.dry_run else SMBus(args.bus))
+        display = LedDisplay(bus=counter, address=args.address, columns=args.columns)
+        try:
+            for mode, result in benchmark(display).items():
+                print(
+                    f"{mode}: transactions={result['transactions']:.1f} "
+                    f"bytes={result['bytes']:.1f} time={result['ms']:.2f}ms per update"
+                )
+        finally:
+            counter.close()
+        return
+
     write_display(
         args.line1,
         args.line2,
@@ -156,4 +344,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,315 @@
+import argparse
+import bisect
+import math
+import threading
+from array import array
+from itertools import accumulate
+from time import perf_counter
+
+
+# Seconds; spans one I2C byte to a slow HTTP request.
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+# Seconds; subprocesses and other media work.
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class CounterValue:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class GaugeValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class HistogramValue:
+    """Fixed buckets in one preallocated array; observe() allocates nothing."""
+
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # The last slot is the +Inf bucket.
+        self.counts = array("Q", bytes(8 * (len(bounds) + 1)))
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self.lock:
+            return list(accumulate(self.counts)), self.sum
+
+
+class Metric:
+    """One metric family; labels() returns the child that holds each label combination's value."""
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.children = {}
+        self.lock = threading.Lock()
+        self.default = None if self.label_names else self.labels()
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {', '.join(self.label_names) or 'none'}")
+            with self.lock:
+                child = self.children.setdefault(key, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """Yield (suffix, label text, value) for the exposition format."""
+
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {escape(self.help)}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _child(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.default.inc(amount)
+
+    def samples(self):
+        for key, child in list(self.children.items()):
+            yield "", format_labels(self.label_names, key), child.value
+
+
+class Gauge(Metric):
+    """A value that is set as it changes, or read from function() at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), function=None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def _child(self):
+        return GaugeValue()
+
+    def set(self, value):
+        self.default.set(value)
+
+    def inc(self, amount=1):
+        self.default.inc(amount)
+
+    def samples(self):
+        if self.function is not None:
+            value = self.function()
+            if value is not None:
+                yield "", "", value
+            return
+
+        for key, child in list(self.children.items()):
+            yield "", format_labels(self.label_names, key), child.value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(float(bound) for bound in buckets))
+        super().__init__(name, help, labels)
+
+    def _child(self):
+        return HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self.default.observe(value)
+
+    def samples(self):
+        for key, child in list(self.children.items()):
+            cumulative, total = child.snapshot()
+            for bound, count in zip((*self.bounds, math.inf), cumulative):
+                labels = format_labels(self.label_names, key, f'le="{format_value(bound)}"')
+                yield "_bucket", labels, count
+            labels = format_labels(self.label_names, key)
+            yield "_sum", labels, total
+            yield "_count", labels, cumulative[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric, or return the one already registered under its name.
+
+        A function gauge registered again takes the new function, so a fresh
+        app instance reports its own state.
+        """
+
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is None:
+                self.metrics[metric.name] = metric
+                return metric
+
+        if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+            raise ValueError(f"metric {metric.name} is already registered differently")
+        if isinstance(metric, Gauge) and metric.function is not None:
+            existing.function = metric.function
+        return existing
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as error:
+                lines.append(f"# {metric.name} unavailable: {escape(error)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labels=()):
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def gauge(name, help, labels=(), function=None):
+    return REGISTRY.register(Gauge(name, help, labels, function=function))
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+REQUEST_SECONDS = histogram(
+    "diamond_http_request_seconds",
+    "Time from an HTTP request arriving to its response starting",
+    labels=("method", "route", "status"),
+)
+
+
+class RequestMetrics:
+    """ASGI middleware that times each HTTP request to the start of its response.
+
+    Requests are labelled with the route's path template rather than the raw
+    path, so capture names and job ids do not each create a series.
+    Streaming responses are timed to their first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                path = getattr(route, "path", None) or "unmatched"
+                REQUEST_SECONDS.labels(scope["method"], path, message["status"]).observe(
+                    perf_counter() - started
+                )
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Measure the cost of Diamond's metrics and print a sample scrape. "
+            "Import API: controllers.metrics.histogram(name, help).observe(seconds)."
+        )
+    )
+    parser.add_argument("--observations", type=int, default=200_000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    example = histogram("diamond_example_seconds", "Example latency histogram")
+    values = [(index % 1000) / 100_000 for index in range(args.observations)]
+
+    started = perf_counter()
+    for value in values:
+        example.observe(value)
+    elapsed = perf_counter() - started
+
+    print(REGISTRY.render(), end="")
+    print(f"# observe: {elapsed / args.observations * 1e9:.0f} ns per call")
+
+
+if __name__ == "__main__":
+    main()
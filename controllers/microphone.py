@@ -1,16 +1,45 @@
 import argparse
 import math
+import queue
 import subprocess
+import threading
+import time
+import wave
 from pathlib import Path
 
+import numpy as np
+
 from controllers.utils import capture_path
 
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
 
 DEFAULT_DEVICE = "plughw:CARD=Device,DEV=0"
 DEFAULT_RATE = 16000
 DEFAULT_CHANNELS = 1
 DEFAULT_FORMAT = "S16_LE"
 DEFAULT_CONTAINER = "wav"
+# 20 ms chunks at 16 kHz.
+DEFAULT_CHUNK_FRAMES = 320
+DEFAULT_RING_SECONDS = 30
+DEFAULT_PREROLL_SECONDS = 0.5
+# Voice activity analysis works on 20 ms frames.
+VAD_FRAME_SECONDS = 0.02
+VAD_THRESHOLD_DB = 12.0
+VAD_MIN_SPEECH_DB = -50.0
+VAD_ONSET_FRAMES = 3
+VAD_HANGOVER_FRAMES = 25
+# Per-frame floor adaptation: down fast, up slowly in silence, and up very slowly
+# during speech, so a lasting rise in background noise (the motors starting) is
+# absorbed within about six seconds instead of counting as speech forever.
+NOISE_FALL_RATE = 0.2
+NOISE_RISE_RATE = 0.01
+NOISE_VOICED_RISE_RATE = 0.001
+VOICE_MAX_SECONDS = 60.0
+SILENCE_DB = -100.0
 
 
 def default_audio_path(container=DEFAULT_CONTAINER):
@@ -69,13 +98,469 @@ def record_audio(
     return output
 
 
+class PcmRing:
+    """Fixed-size ring of S16 frames addressed by absolute frame offsets."""
+
+    def __init__(self, capacity_frames, channels=DEFAULT_CHANNELS):
+        self.capacity = int(capacity_frames)
+        self.channels = int(channels)
+        self.buffer = np.zeros((self.capacity, self.channels), dtype="<i2")
+        self.written = 0
+        self.lock = threading.Lock()
+
+    @property
+    def oldest(self):
+        return max(0, self.written - self.capacity)
+
+    def write(self, frames):
+        frames = frames.reshape(-1, self.channels)
+        total = len(frames)
+        frames = frames[-self.capacity :]
+        count = len(frames)
+
+        with self.lock:
+            start = (self.written + total - count) % self.capacity
+            first = min(count, self.capacity - start)
+            self.buffer[start : start + first] = frames[:first]
+            self.buffer[: count - first] = frames[first:]
+            self.written += total
+            return self.written
+
+    def read(self, start, end=None):
+        """Copy frames [start, end); frames already overwritten are skipped."""
+
+        with self.lock:
+            end = self.written if end is None else min(end, self.written)
+            start = max(start, self.oldest)
+            if start >= end:
+                return np.zeros((0, self.channels), dtype="<i2")
+
+            first = start % self.capacity
+            count = end - start
+            if first + count <= self.capacity:
+                return self.buffer[first : first + count].copy()
+            return np.concatenate((self.buffer[first:], self.buffer[: count - (self.capacity - first)]))
+
+
+class MicRecording:
+    """WAV file written from the microphone ring, from a start offset onward.
+
+    The capture thread only queues the end offset of each chunk. A writer thread
+    copies frames from the ring to the file, folding whatever queued up while
+    the card was busy into one write, so a slow card never holds up capture.
+    The ring holds DEFAULT_RING_SECONDS, which is how far the writer may fall
+    behind before audio is lost.
+    """
+
+    def __init__(self, stream, output_path, start):
+        self.stream = stream
+        self.output = Path(output_path)
+        self.position = start
+        self.queue = queue.Queue()
+        self.finished = False
+        self.thread = threading.Thread(target=self._run, name="diamond-mic-writer", daemon=True)
+        self.thread.start()
+
+    def __call__(self, frames, end):
+        self.queue.put(end)
+
+    def close(self, end):
+        """Write everything up to end, close the file and return its path."""
+
+        self.queue.put(end)
+        self.queue.put(None)
+        self.thread.join()
+        return self.output
+
+    def _run(self):
+        try:
+            self.output.parent.mkdir(parents=True, exist_ok=True)
+            with wave.open(str(self.output), "wb") as file:
+                file.setnchannels(self.stream.channels)
+                file.setsampwidth(2)
+                file.setframerate(self.stream.rate)
+                self._write(file)
+        except Exception as error:
+            print(f"Microphone recording to {self.output.name} failed: {error}", flush=True)
+            # Keep draining, so close() still returns.
+            while not self.finished:
+                self.finished = self.queue.get() is None
+
+    def _write(self, file):
+        while True:
+            items = [self.queue.get()]
+            while not self.queue.empty():
+                items.append(self.queue.get_nowait())
+
+            ends = [item for item in items if item is not None]
+            if ends:
+                frames = self.stream.ring.read(self.position, ends[-1])
+                file.writeframes(frames.tobytes())
+                self.position = ends[-1]
+            if None in items:
+                self.finished = True
+                return
+
+
+def level_db(value):
+    return 20 * math.log10(value) if value > 0 else SILENCE_DB
+
+
+class LevelAnalyzer:
+    """Streaming RMS/peak meter and energy-based voice activity detector.
+
+    Each chunk is cut into fixed frames and measured with one vectorized pass.
+    A frame counts as speech when it rises VAD_THRESHOLD_DB above an adaptive
+    noise floor, which creeps up even during speech so that a lasting change
+    in background level stops counting as speech. Speech starts after
+    VAD_ONSET_FRAMES such frames in a row and ends after VAD_HANGOVER_FRAMES
+    without one. Listeners are called with (speaking, frame_offset) on every
+    transition.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, frame_seconds=VAD_FRAME_SECONDS):
+        self.rate = int(rate)
+        self.frame_length = max(1, int(self.rate * frame_seconds))
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.listeners = []
+        self.noise = None
+        self.speaking = False
+        self.onset = 0
+        self.hangover = 0
+        self.rms_db = SILENCE_DB
+        self.peak_db = SILENCE_DB
+        self.busy_seconds = 0.0
+        self.audio_seconds = 0.0
+
+    def __call__(self, frames, end):
+        started = time.thread_time()
+        samples = frames.mean(axis=1) if frames.shape[1] > 1 else frames[:, 0]
+        samples = np.concatenate((self.pending, samples.astype(np.float32) / 32768))
+        count = len(samples) // self.frame_length
+        self.pending = samples[count * self.frame_length :]
+
+        if count:
+            blocks = samples[: count * self.frame_length].reshape(count, self.frame_length)
+            rms = np.sqrt(np.mean(blocks * blocks, axis=1))
+            peak = np.max(np.abs(blocks), axis=1)
+            first = end - len(self.pending) - count * self.frame_length
+            self._update(rms, peak, first)
+
+        self.busy_seconds += time.thread_time() - started
+        self.audio_seconds += len(frames) / self.rate
+
+    def _update(self, rms, peak, first):
+        self.rms_db = level_db(float(rms[-1]))
+        self.peak_db = level_db(float(peak.max()))
+
+        if self.noise is None:
+            self.noise = float(rms.min())
+
+        for index, value in enumerate(rms.tolist()):
+            noise_db = level_db(self.noise)
+            value_db = level_db(value)
+            voiced = value_db > max(noise_db + VAD_THRESHOLD_DB, VAD_MIN_SPEECH_DB)
+
+            if voiced:
+                self.onset += 1
+                self.hangover = VAD_HANGOVER_FRAMES
+                rate = NOISE_VOICED_RISE_RATE
+            else:
+                self.onset = 0
+                self.hangover = max(0, self.hangover - 1)
+                rate = NOISE_FALL_RATE if value < self.noise else NOISE_RISE_RATE
+            self.noise += (value - self.noise) * rate
+
+            if not self.speaking and self.onset >= VAD_ONSET_FRAMES:
+                self._notify(True, first + index * self.frame_length)
+            elif self.speaking and self.hangover == 0:
+                self._notify(False, first + (index + 1) * self.frame_length)
+
+    def _notify(self, speaking, offset):
+        self.speaking = speaking
+        for listener in list(self.listeners):
+            try:
+                listener(speaking, offset)
+            except Exception as error:
+                print(f"Voice activity listener failed: {error}", flush=True)
+
+    def levels(self):
+        return {
+            "rms_db": round(self.rms_db, 1),
+            "peak_db": round(self.peak_db, 1),
+            "noise_db": round(level_db(self.noise or 0), 1),
+            "speech": self.speaking,
+            "cpu_load": self.busy_seconds / self.audio_seconds if self.audio_seconds else 0,
+        }
+
+
+class VoiceTrigger:
+    """Record automatically whenever the microphone analyzer hears speech.
+
+    A recording ends when the speech does, or after max_seconds. Once capped,
+    the trigger waits for the analyzer to hear silence before it records again.
+    Speech transitions arrive on the capture thread, so finished recordings are
+    closed, and handed to on_capture, from a thread of their own.
+    """
+
+    def __init__(
+        self,
+        stream,
+        preroll=DEFAULT_PREROLL_SECONDS,
+        on_capture=None,
+        output_path=None,
+        max_seconds=VOICE_MAX_SECONDS,
+    ):
+        self.stream = stream
+        self.preroll = float(preroll)
+        self.on_capture = on_capture
+        self.output_path = output_path or (lambda: default_audio_path("wav"))
+        self.max_seconds = float(max_seconds)
+        self.recording = None
+        self.timer = None
+        self.capped = False
+        self.saving = []
+        self.lock = threading.Lock()
+        stream.analyzer.listeners.append(self)
+
+    def __call__(self, speaking, offset):
+        with self.lock:
+            if speaking and self.recording is None and not self.capped:
+                # Onset frames were already spoken, so reach back past them too.
+                preroll = self.preroll + VAD_ONSET_FRAMES * VAD_FRAME_SECONDS
+                self.recording = self.stream.start_recording(self.output_path(), preroll=preroll)
+                self.timer = threading.Timer(self.max_seconds, self._expire, args=(self.recording,))
+                self.timer.daemon = True
+                self.timer.start()
+            elif not speaking:
+                self.capped = False
+                if self.recording is not None:
+                    self._finish()
+
+    def _expire(self, recording):
+        with self.lock:
+            if self.recording is recording:
+                self.capped = True
+                self._finish()
+
+    def _finish(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        recording = self.recording
+        self.recording = None
+        self.stream.unsubscribe(recording)
+        thread = threading.Thread(
+            target=self._save,
+            args=(recording, self.stream.position),
+            name="diamond-voice-save",
+            daemon=True,
+        )
+        self.saving = [item for item in self.saving if item.is_alive()] + [thread]
+        thread.start()
+
+    def _save(self, recording, end):
+        output = recording.close(end)
+        if self.on_capture:
+            self.on_capture(output)
+
+    @property
+    def recording_active(self):
+        return self.recording is not None
+
+    def close(self):
+        if self in self.stream.analyzer.listeners:
+            self.stream.analyzer.listeners.remove(self)
+        with self.lock:
+            if self.recording is not None:
+                self._finish()
+            saving = self.saving
+        for thread in saving:
+            thread.join()
+
+
+class MicrophoneStream:
+    """One persistent capture stream from the USB microphone.
+
+    A reader thread keeps the last ring_seconds of audio in a PcmRing and hands
+    every chunk to subscribers, so recordings start instantly (with pre-roll)
+    and other consumers share the device instead of opening it again.
+    """
+
+    def __init__(
+        self,
+        device=DEFAULT_DEVICE,
+        rate=DEFAULT_RATE,
+        channels=DEFAULT_CHANNELS,
+        ring_seconds=DEFAULT_RING_SECONDS,
+        chunk_frames=DEFAULT_CHUNK_FRAMES,
+        source=None,
+    ):
+        self.device = device
+        self.rate = int(rate)
+        self.channels = int(channels)
+        self.chunk_frames = int(chunk_frames)
+        self.ring = PcmRing(int(self.rate * ring_seconds), self.channels)
+        self.analyzer = LevelAnalyzer(self.rate)
+        self.subscribers = [self.analyzer]
+        self.lock = threading.Lock()
+        self.pcm = None
+        self.process = None
+        # Anything with read(frames) and close(), such as a simulated microphone.
+        self.source = source
+
+        if source is None and alsaaudio is not None:
+            self.pcm = alsaaudio.PCM(
+                type=alsaaudio.PCM_CAPTURE,
+                mode=alsaaudio.PCM_NORMAL,
+                rate=self.rate,
+                channels=self.channels,
+                format=alsaaudio.PCM_FORMAT_S16_LE,
+                periodsize=self.chunk_frames,
+                device=device,
+            )
+        elif source is None:
+            self.process = subprocess.Popen(
+                [
+                    "arecord",
+                    "-q",
+                    "-D",
+                    device,
+                    "-f",
+                    "S16_LE",
+                    "-r",
+                    str(self.rate),
+                    "-c",
+                    str(self.channels),
+                    "-t",
+                    "raw",
+                    f"--period-size={self.chunk_frames}",
+                ],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="diamond-microphone", daemon=True)
+        self.thread.start()
+
+    @property
+    def position(self):
+        return self.ring.written
+
+    def subscribe(self, callback):
+        """Call callback(frames, end_offset) on the capture thread for every chunk."""
+
+        with self.lock:
+            self.subscribers = [*self.subscribers, callback]
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            self.subscribers = [item for item in self.subscribers if item is not callback]
+
+    def start_recording(self, output_path, preroll=DEFAULT_PREROLL_SECONDS):
+        start = max(self.ring.oldest, self.position - int(float(preroll) * self.rate))
+        recording = MicRecording(self, output_path, start)
+        self.subscribe(recording)
+        return recording
+
+    def stop_recording(self, recording):
+        self.unsubscribe(recording)
+        return recording.close(self.position)
+
+    def close(self):
+        self.running = False
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.thread.join(timeout=1)
+        if self.pcm is not None:
+            self.pcm.close()
+        if self.source is not None:
+            self.source.close()
+
+    def _read_chunk(self):
+        if self.source is not None:
+            return self.source.read(self.chunk_frames)
+        if self.pcm is not None:
+            length, data = self.pcm.read()
+            if length < 0:
+                return b""
+            return data
+
+        data = self.process.stdout.read(self.chunk_frames * self.channels * 2)
+        if not data:
+            raise OSError("arecord stopped")
+        return data
+
+    def _run(self):
+        pending = b""
+
+        try:
+            while self.running:
+                pending += self._read_chunk()
+                usable = len(pending) - len(pending) % (2 * self.channels)
+                if not usable:
+                    continue
+
+                frames = np.frombuffer(pending[:usable], dtype="<i2").reshape(-1, self.channels)
+                pending = pending[usable:]
+                end = self.ring.write(frames)
+
+                for callback in self.subscribers:
+                    try:
+                        callback(frames, end)
+                    except Exception as error:
+                        print(f"Microphone subscriber failed: {error}", flush=True)
+        except Exception as error:
+            if self.running:
+                print(f"Microphone capture failed: {error}", flush=True)
+        finally:
+            self.running = False
+
+
+def connect_microphone(device=DEFAULT_DEVICE, rate=DEFAULT_RATE, channels=DEFAULT_CHANNELS):
+    """Open the persistent microphone stream or raise if the device is unavailable."""
+
+    return MicrophoneStream(device=device, rate=rate, channels=channels)
+
+
+def monitor_levels(seconds, device=DEFAULT_DEVICE, rate=DEFAULT_RATE, channels=DEFAULT_CHANNELS):
+    stream = connect_microphone(device=device, rate=rate, channels=channels)
+
+    def report(speaking, offset):
+        print(f"{offset / stream.rate:8.2f}s speech {'start' if speaking else 'end'}")
+
+    stream.analyzer.listeners.append(report)
+    deadline = time.monotonic() + float(seconds)
+    try:
+        while time.monotonic() < deadline and stream.running:
+            time.sleep(0.5)
+            levels = stream.analyzer.levels()
+            print(
+                f"rms={levels['rms_db']:6.1f}dBFS peak={levels['peak_db']:6.1f}dBFS "
+                f"noise={levels['noise_db']:6.1f}dBFS cpu={levels['cpu_load'] * 100:.2f}%"
+            )
+    finally:
+        stream.close()
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description=(
             "Record audio from Diamond's USB microphone. "
-            "Import API: controllers.microphone.record_audio(output_path, seconds=3)."
+            "Import APIs: controllers.microphone.record_audio(output_path, seconds=3), "
+            "connect_microphone()."
         )
     )
+    parser.add_argument(
+        "--monitor",
+        action="store_true",
+        help="print live levels and voice activity for --seconds instead of recording",
+    )
     parser.add_argument("output", nargs="?")
     parser.add_argument("--seconds", type=float, default=3)
     parser.add_argument("--device", default=DEFAULT_DEVICE)
@@ -99,6 +584,10 @@ def main():
         print(list_microphones())
         return
 
+    if args.monitor:
+        monitor_levels(args.seconds, device=args.device, rate=args.rate, channels=args.channels)
+        return
+
     output_path = args.output or default_audio_path(args.container)
     output = record_audio(
         output_path,
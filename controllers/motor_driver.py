@@ -0,0 +1,315 @@
+import argparse
+import os
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+
+PINS = {
+    "left": {"forward": 5, "reverse": 6, "enable": 12},
+    "right": {"forward": 20, "reverse": 16, "enable": 13},
+}
+SIDES = ("left", "right")
+BACKENDS = ("gpiozero", "hardware", "fake")
+DEFAULT_BACKEND = "gpiozero"
+
+# /dev/gpiochip0 on the Pi 4 and on Pi 5 kernels from 6.6.45; older Pi 5 kernels use 4.
+DEFAULT_GPIO_CHIP = 0
+DEFAULT_PWM_CHIP = 0
+PWM_ROOT = Path("/sys/class/pwm")
+# PWM channel behind each PWM-capable header pin (pwm-2chan overlay).
+PWM_CHANNELS = {12: 0, 13: 1, 18: 0, 19: 1}
+DEFAULT_PWM_FREQUENCY = 1000
+EXPORT_TIMEOUT = 1.0
+
+FAKE_HISTORY = 1024
+
+
+def direction_bits(power):
+    """Return the (forward, reverse) pin levels for a signed power; zero coasts."""
+
+    if power > 0:
+        return 1, 0
+    if power < 0:
+        return 0, 1
+    return 0, 0
+
+
+class GpiozeroDriver:
+    """Both motor sides through gpiozero Motor and PWMOutputDevice objects."""
+
+    name = "gpiozero"
+
+    def __init__(self, pins=PINS):
+        from gpiozero import Motor, PWMOutputDevice
+
+        self.motors = [Motor(forward=pins[side]["forward"], backward=pins[side]["reverse"]) for side in SIDES]
+        self.enables = [PWMOutputDevice(pins[side]["enable"]) for side in SIDES]
+
+    def write(self, left, right):
+        for motor, enable, power in zip(self.motors, self.enables, (left, right)):
+            enable.value = abs(power)
+            if power > 0:
+                motor.forward()
+            elif power < 0:
+                motor.backward()
+            else:
+                motor.stop()
+
+    def stop(self):
+        for motor, enable in zip(self.motors, self.enables):
+            motor.stop()
+            enable.value = 0
+
+    def close(self):
+        for device in (*self.motors, *self.enables):
+            device.close()
+
+
+class HardwarePwmDriver:
+    """Both motor sides through the Pi's PWM peripheral and one lgpio group for direction.
+
+    Speed comes from the kernel PWM driver on the enable pins (GPIO12/13 need
+    dtoverlay=pwm-2chan in config.txt), so the duty cycle is timed in hardware
+    and stays steady whatever Python is doing. The four direction pins are
+    claimed as one lgpio group, so both sides change direction in a single
+    register write and never pass through a brake or coast state. Duty cycles
+    go straight to already-open sysfs files and are skipped when unchanged.
+    """
+
+    name = "hardware"
+
+    def __init__(
+        self,
+        pins=PINS,
+        frequency=DEFAULT_PWM_FREQUENCY,
+        gpio_chip=DEFAULT_GPIO_CHIP,
+        pwm_chip=DEFAULT_PWM_CHIP,
+        pwm_root=PWM_ROOT,
+    ):
+        import lgpio
+
+        self.lgpio = lgpio
+        self.period_ns = int(1e9 / frequency)
+        self.direction_pins = [pins[side][name] for side in SIDES for name in ("forward", "reverse")]
+        self.handle = lgpio.gpiochip_open(gpio_chip)
+        self.duty_files = []
+        self.duty = [None, None]
+        self.bits = None
+
+        try:
+            lgpio.group_claim_output(self.handle, self.direction_pins, [0] * len(self.direction_pins))
+            chip = Path(pwm_root) / f"pwmchip{pwm_chip}"
+            for side in SIDES:
+                pin = pins[side]["enable"]
+                if pin not in PWM_CHANNELS:
+                    raise ValueError(f"GPIO{pin} has no hardware PWM channel")
+                self.duty_files.append(self._open_channel(chip, PWM_CHANNELS[pin]))
+        except Exception:
+            self.close()
+            raise
+
+    def _open_channel(self, chip, channel):
+        directory = chip / f"pwm{channel}"
+        if not directory.exists():
+            (chip / "export").write_text(str(channel))
+
+        # udev fixes the attribute permissions a moment after export.
+        deadline = time.monotonic() + EXPORT_TIMEOUT
+        while True:
+            try:
+                (directory / "duty_cycle").write_text("0")
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.01)
+
+        (directory / "period").write_text(str(self.period_ns))
+        (directory / "enable").write_text("1")
+        return os.open(directory / "duty_cycle", os.O_WRONLY)
+
+    def write(self, left, right):
+        bits = 0
+        for index, power in enumerate((left, right)):
+            forward, reverse = direction_bits(power)
+            bits |= (forward << (2 * index)) | (reverse << (2 * index + 1))
+
+        if bits != self.bits:
+            self.lgpio.group_write(self.handle, self.direction_pins[0], bits)
+            self.bits = bits
+
+        for index, power in enumerate((left, right)):
+            duty = int(abs(power) * self.period_ns)
+            if duty != self.duty[index]:
+                os.pwrite(self.duty_files[index], b"%d" % duty, 0)
+                self.duty[index] = duty
+
+    def stop(self):
+        self.write(0, 0)
+
+    def close(self):
+        for index, descriptor in enumerate(self.duty_files):
+            try:
+                os.pwrite(descriptor, b"0", 0)
+            finally:
+                os.close(descriptor)
+        self.duty_files = []
+
+        if self.handle is not None:
+            try:
+                self.lgpio.group_write(self.handle, self.direction_pins[0], 0)
+                self.lgpio.group_free(self.handle, self.direction_pins[0])
+            except Exception:
+                pass
+            self.lgpio.gpiochip_close(self.handle)
+            self.handle = None
+
+
+class FakeDriver:
+    """In-memory motor driver that records every write, for tests and dry runs."""
+
+    name = "fake"
+
+    def __init__(self, pins=PINS, history=FAKE_HISTORY):
+        self.pins = pins
+        self.output = (0.0, 0.0)
+        self.directions = (direction_bits(0), direction_bits(0))
+        self.writes = 0
+        self.history = deque(maxlen=history)
+        self.closed = False
+
+    def write(self, left, right):
+        self.output = (float(left), float(right))
+        self.directions = (direction_bits(left), direction_bits(right))
+        self.writes += 1
+        self.history.append((time.monotonic(), *self.output))
+
+    def stop(self):
+        self.write(0.0, 0.0)
+
+    def close(self):
+        self.closed = True
+
+
+def connect_driver(backend=DEFAULT_BACKEND, pins=PINS, **options):
+    if backend == "gpiozero":
+        return GpiozeroDriver(pins)
+    if backend == "hardware":
+        return HardwarePwmDriver(pins, **options)
+    if backend == "fake":
+        return FakeDriver(pins)
+    raise ValueError(f"backend must be one of {', '.join(BACKENDS)}")
+
+
+def benchmark(driver, updates=2000, seed=0):
+    """Time driver.write() over random drive updates that often flip direction."""
+
+    rng = np.random.default_rng(seed)
+    powers = np.round(rng.uniform(-1, 1, size=(updates, 2)), 2)
+    elapsed = np.empty(updates)
+
+    for index, (left, right) in enumerate(powers):
+        started = time.perf_counter_ns()
+        driver.write(float(left), float(right))
+        elapsed[index] = time.perf_counter_ns() - started
+    driver.stop()
+
+    elapsed /= 1000
+    return {
+        "updates": updates,
+        "mean_us": float(elapsed.mean()),
+        "p50_us": float(np.percentile(elapsed, 50)),
+        "p99_us": float(np.percentile(elapsed, 99)),
+        "max_us": float(elapsed.max()),
+    }
+
+
+def measure_pwm(probe_pin, seconds=2.0, gpio_chip=DEFAULT_GPIO_CHIP):
+    """Measure PWM period jitter from kernel edge timestamps on a pin wired to an enable pin."""
+
+    import lgpio
+
+    handle = lgpio.gpiochip_open(gpio_chip)
+    rising = []
+    try:
+        lgpio.gpio_claim_alert(handle, probe_pin, lgpio.RISING_EDGE)
+        callback = lgpio.callback(handle, probe_pin, lgpio.RISING_EDGE, lambda *edge: rising.append(edge[3]))
+        time.sleep(seconds)
+        callback.cancel()
+    finally:
+        lgpio.gpiochip_close(handle)
+
+    if len(rising) < 3:
+        return None
+
+    periods = np.diff(np.array(rising, dtype=np.int64)) / 1000
+    return {
+        "edges": len(rising),
+        "period_us": float(np.median(periods)),
+        "jitter_std_us": float(periods.std()),
+        "jitter_max_us": float(np.abs(periods - np.median(periods)).max()),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark Diamond's motor driver backends. "
+            "Import API: controllers.motor_driver.connect_driver('hardware').write(left, right)."
+        )
+    )
+    parser.add_argument("--backend", choices=BACKENDS, action="append", help="repeat to compare; default all")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--frequency", type=int, default=DEFAULT_PWM_FREQUENCY, help="hardware PWM Hz")
+    parser.add_argument("--gpio-chip", type=int, default=DEFAULT_GPIO_CHIP)
+    parser.add_argument("--pwm-chip", type=int, default=DEFAULT_PWM_CHIP)
+    parser.add_argument(
+        "--probe-pin",
+        type=int,
+        help="spare GPIO wired to GPIO12; measures PWM jitter at 50%% duty, motors disconnected",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="use gpiozero's mock pins instead of GPIO")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    backends = args.backend or (["gpiozero", "fake"] if args.dry_run else list(BACKENDS))
+
+    if args.dry_run:
+        from gpiozero import Device
+        from gpiozero.pins.mock import MockFactory, MockPWMPin
+
+        Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+
+    for backend in backends:
+        options = {}
+        if backend == "hardware":
+            options = {"frequency": args.frequency, "gpio_chip": args.gpio_chip, "pwm_chip": args.pwm_chip}
+        driver = connect_driver(backend, **options)
+        try:
+            result = benchmark(driver, args.updates)
+            print(
+                f"{backend}: mean={result['mean_us']:.1f}us p50={result['p50_us']:.1f}us "
+                f"p99={result['p99_us']:.1f}us max={result['max_us']:.1f}us per update"
+            )
+            if args.probe_pin is not None and backend != "fake":
+                driver.write(0.5, 0)
+                pwm = measure_pwm(args.probe_pin, gpio_chip=args.gpio_chip)
+                driver.stop()
+                if pwm is None:
+                    print(f"{backend}: no PWM edges on GPIO{args.probe_pin}")
+                else:
+                    print(
+                        f"{backend}: PWM period={pwm['period_us']:.1f}us "
+                        f"jitter std={pwm['jitter_std_us']:.2f}us max={pwm['jitter_max_us']:.2f}us"
+                    )
+        finally:
+            driver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import struct
+
+
+"""
+Minimal ISO BMFF (MP4) writer for one H.264 video track.
+
+It produces fragmented MP4: an init segment (ftyp + moov) followed by media
+segments (moof + mdat). Browsers can feed those straight into Media Source
+Extensions, and the same bytes concatenated form a playable .mp4 file, so live
+streaming, recording and clip export all share one muxer without ffmpeg.
+"""
+
+TIMESCALE = 90000
+NAL_SLICE_IDR = 5
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+HIGH_PROFILES = (100, 110, 122, 144)
+
+SAMPLE_FLAGS_KEYFRAME = 0x02000000
+SAMPLE_FLAGS_DELTA = 0x01010000
+UNITY_MATRIX = struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+
+
+def box(kind, *payloads):
+    body = b"".join(payloads)
+    return struct.pack(">I4s", len(body) + 8, kind) + body
+
+
+def full_box(kind, version, flags, *payloads):
+    return box(kind, struct.pack(">I", (version << 24) | flags), *payloads)
+
+
+def split_nal_units(data):
+    """Split an Annex B byte stream into NAL unit payloads without start codes.
+
+    Start codes are found with bytes.find, so the scan runs in C rather than a
+    byte at a time; this runs on the encoder thread for every frame.
+    """
+
+    data = bytes(data)
+    units = []
+    start = None
+    index = data.find(b"\x00\x00\x01")
+
+    while index >= 0:
+        if start is not None:
+            units.append(data[start:index].rstrip(b"\x00"))
+        start = index + 3
+        index = data.find(b"\x00\x00\x01", start)
+
+    if start is not None and start < len(data):
+        units.append(data[start:])
+
+    return [unit for unit in units if unit]
+
+
+def nal_type(unit):
+    return unit[0] & 0x1F
+
+
+def codec_string(sps):
+    return f"avc1.{sps[1]:02X}{sps[2]:02X}{sps[3]:02X}"
+
+
+class H264Sample:
+    """One access unit converted to length-prefixed NAL units."""
+
+    __slots__ = ("data", "keyframe", "timestamp", "sps", "pps")
+
+    def __init__(self, data, keyframe, timestamp, sps=None, pps=None):
+        self.data = data
+        self.keyframe = keyframe
+        self.timestamp = timestamp
+        self.sps = sps
+        self.pps = pps
+
+    @classmethod
+    def from_annexb(cls, frame, keyframe, timestamp):
+        sps = None
+        pps = None
+        parts = []
+
+        for unit in split_nal_units(frame):
+            kind = nal_type(unit)
+            if kind == NAL_SPS:
+                sps = unit
+            elif kind == NAL_PPS:
+                pps = unit
+            elif kind == NAL_AUD:
+                continue
+            else:
+                keyframe = keyframe or kind == NAL_SLICE_IDR
+                parts.append(struct.pack(">I", len(unit)))
+                parts.append(unit)
+
+        return cls(b"".join(parts), keyframe, timestamp, sps=sps, pps=pps)
+
+
+def avcc_box(sps, pps):
+    config = bytearray([1, sps[1], sps[2], sps[3], 0xFF, 0xE1])
+    config += struct.pack(">H", len(sps)) + sps
+    config += bytes([1]) + struct.pack(">H", len(pps)) + pps
+
+    if sps[1] in HIGH_PROFILES:
+        # 4:2:0, 8-bit luma and chroma, no SPS extensions; what the Pi encoder emits.
+        config += bytes([0xFC | 1, 0xF8, 0xF8, 0])
+
+    return box(b"avcC", bytes(config))
+
+
+def init_segment(sps, pps, width, height, timescale=TIMESCALE, track_id=1):
+    """Return ftyp + moov for a fragmented single-track H.264 stream."""
+
+    ftyp = box(b"ftyp", b"isom", struct.pack(">I", 0x200), b"isom", b"iso5", b"avc1", b"mp41")
+
+    mvhd = full_box(
+        b"mvhd",
+        0,
+        0,
+        struct.pack(">IIII", 0, 0, timescale, 0),
+        struct.pack(">IH", 0x00010000, 0x0100),
+        bytes(10),
+        UNITY_MATRIX,
+        bytes(24),
+        struct.pack(">I", track_id + 1),
+    )
+    tkhd = full_box(
+        b"tkhd",
+        0,
+        0x000003,
+        struct.pack(">IIIII", 0, 0, track_id, 0, 0),
+        bytes(8),
+        struct.pack(">hhhH", 0, 0, 0, 0),
+        UNITY_MATRIX,
+        struct.pack(">II", int(width) << 16, int(height) << 16),
+    )
+    mdhd = full_box(b"mdhd", 0, 0, struct.pack(">IIIIHH", 0, 0, timescale, 0, 0x55C4, 0))
+    hdlr = full_box(b"hdlr", 0, 0, struct.pack(">I4s", 0, b"vide"), bytes(12), b"VideoHandler\x00")
+    vmhd = full_box(b"vmhd", 0, 1, bytes(8))
+    dinf = box(b"dinf", full_box(b"dref", 0, 0, struct.pack(">I", 1), full_box(b"url ", 0, 1)))
+    avc1 = box(
+        b"avc1",
+        bytes(6),
+        struct.pack(">H", 1),
+        bytes(16),
+        struct.pack(">HHIIIH", int(width), int(height), 0x00480000, 0x00480000, 0, 1),
+        bytes(32),
+        struct.pack(">Hh", 0x0018, -1),
+        avcc_box(sps, pps),
+    )
+    stbl = box(
+        b"stbl",
+        full_box(b"stsd", 0, 0, struct.pack(">I", 1), avc1),
+        full_box(b"stts", 0, 0, struct.pack(">I", 0)),
+        full_box(b"stsc", 0, 0, struct.pack(">I", 0)),
+        full_box(b"stsz", 0, 0, struct.pack(">II", 0, 0)),
+        full_box(b"stco", 0, 0, struct.pack(">I", 0)),
+    )
+    mdia = box(b"mdia", mdhd, hdlr, box(b"minf", vmhd, dinf, stbl))
+    mvex = box(b"mvex", full_box(b"trex", 0, 0, struct.pack(">IIIII", track_id, 1, 0, 0, 0)))
+    moov = box(b"moov", mvhd, box(b"trak", tkhd, mdia), mvex)
+    return ftyp + moov
+
+
+def media_segment(sequence, base_decode_time, samples, track_id=1):
+    """Return moof + mdat for samples given as (data, duration, keyframe) tuples."""
+
+    entries = b"".join(
+        struct.pack(
+            ">III",
+            duration,
+            len(data),
+            SAMPLE_FLAGS_KEYFRAME if keyframe else SAMPLE_FLAGS_DELTA,
+        )
+        for data, duration, keyframe in samples
+    )
+
+    def moof(data_offset):
+        trun = full_box(b"trun", 0, 0x000701, struct.pack(">Ii", len(samples), data_offset), entries)
+        traf = box(
+            b"traf",
+            full_box(b"tfhd", 0, 0x020000, struct.pack(">I", track_id)),
+            full_box(b"tfdt", 1, 0, struct.pack(">Q", int(base_decode_time))),
+            trun,
+        )
+        return box(b"moof", full_box(b"mfhd", 0, 0, struct.pack(">I", sequence)), traf)
+
+    size = len(moof(0))
+    payload = b"".join(data for data, _, _ in samples)
+    return moof(size + 8) + box(b"mdat", payload)
+
+
+class Fragmenter:
+    """Turn encoder output into an init segment plus one media segment per call.
+
+    Decode times come from the encoder timestamps (microseconds) so skipped or
+    dropped frames leave a gap instead of drifting. Sample durations use the
+    nominal frame period because the next frame's time is not known yet, which
+    keeps every frame flushable with no added latency.
+    """
+
+    def __init__(self, width, height, framerate, timescale=TIMESCALE):
+        self.width = int(width)
+        self.height = int(height)
+        self.timescale = timescale
+        self.frame_duration = max(1, round(timescale / float(framerate)))
+        self.sequence = 0
+        self.first_timestamp = None
+        self.last_decode_time = None
+        self.sps = None
+        self.pps = None
+        self.init = None
+        self.codec = None
+
+    def decode_time(self, timestamp):
+        if timestamp is None or self.first_timestamp is None:
+            if self.last_decode_time is None:
+                return 0
+            return self.last_decode_time + self.frame_duration
+
+        decode_time = round((timestamp - self.first_timestamp) * self.timescale / 1_000_000)
+        if self.last_decode_time is not None and decode_time <= self.last_decode_time:
+            decode_time = self.last_decode_time + 1
+        return decode_time
+
+    def update_parameters(self, sample):
+        """Update the init segment when a parsed sample carries new SPS/PPS."""
+
+        if sample.sps and sample.pps and (sample.sps, sample.pps) != (self.sps, self.pps):
+            self.sps = sample.sps
+            self.pps = sample.pps
+            self.init = init_segment(self.sps, self.pps, self.width, self.height, self.timescale)
+            self.codec = codec_string(self.sps)
+
+        return sample
+
+    def fragment(self, samples):
+        """Return a media segment for consecutive H264Sample objects."""
+
+        if not samples:
+            return b""
+
+        if self.first_timestamp is None and samples[0].timestamp is not None:
+            self.first_timestamp = samples[0].timestamp
+
+        times = []
+        for sample in samples:
+            self.last_decode_time = self.decode_time(sample.timestamp)
+            times.append(self.last_decode_time)
+
+        entries = []
+        for index, sample in enumerate(samples):
+            if index + 1 < len(samples):
+                duration = times[index + 1] - times[index]
+            else:
+                duration = self.frame_duration
+            entries.append((sample.data, duration, sample.keyframe))
+
+        self.sequence += 1
+        return media_segment(self.sequence, times[0], entries)
+
+
+def write_samples(output_path, samples, width, height, framerate):
+    """Write already-parsed H264Sample objects to an MP4 file, one fragment per GOP.
+
+    Samples before the first keyframe carrying SPS/PPS are skipped. Returns the
+    number of samples written.
+    """
+
+    fragmenter = Fragmenter(width, height, framerate)
+    started = False
+    written = 0
+    gop = []
+
+    with open(output_path, "wb") as file:
+        for sample in samples:
+            if not started:
+                fragmenter.update_parameters(sample)
+                if fragmenter.init is None or not sample.keyframe:
+                    continue
+                file.write(fragmenter.init)
+                started = True
+
+            if sample.keyframe and gop:
+                file.write(fragmenter.fragment(gop))
+                written += len(gop)
+                gop = []
+            gop.append(sample)
+
+        if gop:
+            file.write(fragmenter.fragment(gop))
+            written += len(gop)
+
+    return written
@@ -1,7 +1,4 @@
-PINS = {
-    "left": {"forward": 5, "reverse": 6, "enable": 12},
-    "right": {"forward": 20, "reverse": 16, "enable": 13},
-}
+from controllers.motor_driver import DEFAULT_BACKEND, PINS, connect_driver
 
 
 def clamp(value, minimum=-1, maximum=1):
@@ -34,69 +31,47 @@ def mix_differential(y, x, max_speed=1):
     )
 
 
-class MotorSide:
-    def __init__(self, forward_pin, reverse_pin, enable_pin):
-        from gpiozero import Motor, PWMOutputDevice
-
-        self.motor = Motor(forward=forward_pin, backward=reverse_pin)
-        self.enable = PWMOutputDevice(enable_pin)
-        self.power = None
-
-    def move(self, power):
-        power = clamp(float(power))
-
-        if self.power is not None and abs(power - self.power) < 0.01:
-            return
-
-        self.power = power
-        self.enable.value = abs(power)
-
-        if power > 0:
-            self.motor.forward()
-        elif power < 0:
-            self.motor.backward()
-        else:
-            self.motor.stop()
-
-    def stop(self):
-        self.power = 0
-        self.motor.stop()
-        self.enable.value = 0
-
-
 class Rover:
-    """Skid-steer rover controller."""
+    """Skid-steer rover controller.
+
+    Motor output goes through a driver backend from controllers.motor_driver;
+    an update identical to the last one written is dropped. Anything smaller
+    would swallow the last steps of a slew ramp, which are below any fixed
+    threshold, and leave the motors short of their target.
+    """
 
     available = True
 
-    def __init__(self, pins=PINS, max_speed=1):
+    def __init__(self, pins=PINS, max_speed=1, driver=None):
         self.max_speed = validate_speed(max_speed, "max_speed")
-        self.left = MotorSide(
-            forward_pin=pins["left"]["forward"],
-            reverse_pin=pins["left"]["reverse"],
-            enable_pin=pins["left"]["enable"],
-        )
-        self.right = MotorSide(
-            forward_pin=pins["right"]["forward"],
-            reverse_pin=pins["right"]["reverse"],
-            enable_pin=pins["right"]["enable"],
-        )
+        self.driver = driver if driver is not None else connect_driver(DEFAULT_BACKEND, pins)
+        self.output = None
+
+    def mix(self, x, y):
+        return mix_differential(y, x, max_speed=self.max_speed)
 
     def drive(self, x, y):
-        left_power, right_power = mix_differential(y, x, max_speed=self.max_speed)
+        left_power, right_power = self.mix(x, y)
         self.move(left_power, right_power)
         return {"left": left_power, "right": right_power}
 
     def move(self, left_power, right_power):
-        self.left.move(validate_power(left_power, "left"))
-        self.right.move(validate_power(right_power, "right"))
+        output = (validate_power(left_power, "left"), validate_power(right_power, "right"))
+        if output == self.output:
+            return
+
+        self.output = output
+        self.driver.write(*output)
 
     def stop(self):
-        self.left.stop()
-        self.right.stop()
+        self.output = (0.0, 0.0)
+        self.driver.stop()
+
+    def close(self):
+        self.driver.close()
 
 
-def connect_rover(max_speed=1, pins=PINS):
+def connect_rover(max_speed=1, pins=PINS, backend=DEFAULT_BACKEND):
     """Create a real rover controller or raise if GPIO setup is unavailable."""
 
-    return Rover(pins=pins, max_speed=max_speed)
+    return Rover(pins=pins, max_speed=max_speed, driver=connect_driver(backend, pins))
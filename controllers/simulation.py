@@ -0,0 +1,750 @@
+import argparse
+import ctypes
+import errno
+import os
+import threading
+import wave
+from collections import deque
+from fractions import Fraction
+from time import monotonic, sleep
+
+import numpy as np
+from evdev import AbsInfo, InputEvent, ecodes
+
+from controllers.camera import (
+    DEFAULT_BITRATE,
+    DEFAULT_FRAMERATE,
+    DEFAULT_HEIGHT,
+    DEFAULT_INTRA_PERIOD,
+    DEFAULT_PREROLL_BYTES,
+    DEFAULT_WIDTH,
+    CameraService,
+)
+from controllers.led_display import DEFAULT_ADDRESS as LCD_ADDRESS, ENABLE, REGISTER_SELECT
+from controllers.microphone import (
+    DEFAULT_CHANNELS as MIC_CHANNELS,
+    DEFAULT_RATE as MIC_RATE,
+    MicrophoneStream,
+)
+from controllers.speaker import (
+    DEFAULT_PERIOD_FRAMES,
+    DEFAULT_PERIODS,
+    DEFAULT_RATE as SPEAKER_RATE,
+    AudioEngine,
+    load_wav,
+)
+from controllers.waveshare_hat import (
+    CALIBRATION_VALUE,
+    CONFIG_32V_2A,
+    CURRENT_LSB_MA,
+    DEFAULT_ADDRESS as HAT_ADDRESS,
+    POWER_LSB_MW,
+    REG_BUS_VOLTAGE,
+    REG_CALIBRATION,
+    REG_CONFIG,
+    REG_CURRENT,
+    REG_POWER,
+    REG_SHUNT_VOLTAGE,
+)
+from controllers.xbox_controller import XboxController
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+"""
+Stand-ins for Diamond's hardware, so diamond.py --simulate runs on any Linux box.
+
+Each fake sits at the lowest level the real code talks to and keeps the real
+device's timing: the gamepad is an evdev device with a readable file
+descriptor, the UPS HAT and LCD are register models behind an SMBus that takes
+as long as a 100 kHz bus, the camera streams H.264 at its frame rate, and the
+audio devices consume and produce samples at their sample rates. Everything
+above them, from XboxController and LedDisplay to the FastAPI app, is the
+production code.
+"""
+
+# Virtual gamepad: xpadneo axis ranges and a report rate typical of Bluetooth pads.
+STICK_RANGE = (0, 65535)
+TRIGGER_RANGE = (0, 1023)
+HAT_RANGE = (-1, 1)
+ABS_RANGES = {
+    ecodes.ABS_X: STICK_RANGE,
+    ecodes.ABS_Y: STICK_RANGE,
+    ecodes.ABS_RX: STICK_RANGE,
+    ecodes.ABS_RY: STICK_RANGE,
+    ecodes.ABS_Z: TRIGGER_RANGE,
+    ecodes.ABS_RZ: TRIGGER_RANGE,
+    ecodes.ABS_HAT0X: HAT_RANGE,
+    ecodes.ABS_HAT0Y: HAT_RANGE,
+}
+GAMEPAD_REPORT_RATE = 125
+BUTTON_PRESS_SECONDS = 0.1
+# (seconds, x, y, button): move the left stick to x, y over seconds, pressing button first. Loops.
+DEFAULT_GAMEPAD_SCRIPT = (
+    (2.0, 0.0, 0.0, None),
+    (1.0, 0.0, 0.7, None),
+    (3.0, 0.0, 0.7, None),
+    (1.0, 0.6, 0.5, None),
+    (2.0, 0.6, 0.5, None),
+    (0.5, 0.0, 0.0, None),
+    (2.0, 0.0, 0.0, "BTN_SOUTH"),
+    (1.0, 0.0, -0.5, None),
+    (2.0, 0.0, -0.5, None),
+    (0.5, 0.0, 0.0, None),
+)
+
+# I2C at the Pi's default 100 kHz: nine clocks per byte, plus the address byte per message.
+I2C_CLOCK_HZ = 100_000
+
+# Two-cell Li-ion pack behind the UPS HAT.
+EMPTY_VOLTAGE = 6.4
+FULL_VOLTAGE = 8.4
+DEFAULT_CAPACITY_AH = 2.6
+DEFAULT_CHARGE = 0.9
+IDLE_AMPS = 0.45
+MOTOR_AMPS = 1.2
+INTERNAL_RESISTANCE = 0.15
+SHUNT_OHMS = 0.01
+SHUNT_LSB_VOLTS = 0.00001
+# Conversion-ready flag in the INA219 bus voltage register.
+CONVERSION_READY = 0x02
+CONFIG_RESET = 0x8000
+
+# HD44780 DDRAM behind the LCD backpack.
+DDRAM_BYTES = 0x80
+LCD_LINES = (0x00, 0x40)
+LCD_COLUMNS = 16
+
+LOOP_SECONDS = 2
+
+
+def load_gamepad_script(path):
+    """Read a gamepad script: one "seconds x y [button]" step per line, # for comments."""
+
+    steps = []
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            fields = line.split("#", 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) not in (3, 4):
+                raise ValueError(f"{path}:{number}: expected seconds x y [button]")
+            seconds, x, y = (float(field) for field in fields[:3])
+            if seconds < 0 or not (-1 <= x <= 1 and -1 <= y <= 1):
+                raise ValueError(f"{path}:{number}: seconds must be positive and x, y within -1..1")
+            steps.append((seconds, x, y, fields[3] if len(fields) == 4 else None))
+    if not steps:
+        raise ValueError(f"{path} has no steps")
+    return tuple(steps)
+
+
+def stick_value(position):
+    low, high = STICK_RANGE
+    return int(round((low + high) / 2 + position * (high - low) / 2))
+
+
+class VirtualGamepad:
+    """evdev InputDevice stand-in that plays a script on the left stick.
+
+    A thread moves the stick along the script at the pad's report rate and
+    queues the events evdev would deliver, waking a pipe so fileno() polls
+    readable exactly when a real device would. read() drains the queue and
+    raises BlockingIOError when it is empty, like InputDevice.read().
+    """
+
+    name = "Simulated Xbox Wireless Controller"
+    path = "/dev/input/simulated"
+
+    def __init__(self, script=DEFAULT_GAMEPAD_SCRIPT, rate=GAMEPAD_REPORT_RATE, loop=True):
+        self.script = tuple(script)
+        self.period = 1 / rate
+        self.loop = loop
+        # Sticks rest centred; triggers and the hat rest at zero.
+        self.values = {
+            code: stick_value(0) if span == STICK_RANGE else 0 for code, span in ABS_RANGES.items()
+        }
+        self.events = deque()
+        self.lock = threading.Lock()
+        self.fd, self.wake_fd = os.pipe()
+        os.set_blocking(self.fd, False)
+        os.set_blocking(self.wake_fd, False)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="diamond-sim-gamepad", daemon=True)
+        self.thread.start()
+
+    def absinfo(self, code):
+        if code not in ABS_RANGES:
+            raise OSError(errno.EINVAL, f"no absolute axis {code}")
+        low, high = ABS_RANGES[code]
+        fuzz, flat = (16, 128) if ABS_RANGES[code] == STICK_RANGE else (0, 0)
+        return AbsInfo(value=self.values[code], min=low, max=high, fuzz=fuzz, flat=flat, resolution=0)
+
+    def read(self):
+        try:
+            os.read(self.fd, 4096)
+        except BlockingIOError:
+            pass
+        with self.lock:
+            if not self.events:
+                raise BlockingIOError(errno.EAGAIN, "no events queued")
+            events = list(self.events)
+            self.events.clear()
+        return events
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=1)
+        for fd in (self.fd, self.wake_fd):
+            os.close(fd)
+
+    def _emit(self, changes):
+        now = monotonic()
+        seconds, fraction = divmod(now, 1)
+        usec = int(fraction * 1_000_000)
+        with self.lock:
+            for kind, code, value in changes:
+                if kind == ecodes.EV_ABS:
+                    self.values[code] = value
+                self.events.append(InputEvent(int(seconds), usec, kind, code, value))
+            self.events.append(InputEvent(int(seconds), usec, ecodes.EV_SYN, ecodes.SYN_REPORT, 0))
+        try:
+            os.write(self.wake_fd, b"\0")
+        except BlockingIOError:
+            pass
+
+    def _run(self):
+        x = y = 0.0
+        released_at = None
+        button = None
+        deadline = monotonic()
+
+        while self.running:
+            for seconds, target_x, target_y, press in self.script:
+                if press:
+                    button = ecodes.ecodes[press]
+                    self._emit([(ecodes.EV_KEY, button, 1)])
+                    released_at = monotonic() + BUTTON_PRESS_SECONDS
+
+                steps = max(1, int(round(seconds / self.period)))
+                start_x, start_y = x, y
+                for step in range(1, steps + 1):
+                    if not self.running:
+                        return
+                    share = step / steps
+                    x = start_x + (target_x - start_x) * share
+                    y = start_y + (target_y - start_y) * share
+                    changes = []
+                    raw_x = stick_value(x)
+                    # evdev's Y axis grows downward; XboxController flips it back.
+                    raw_y = stick_value(-y)
+                    if raw_x != self.values[ecodes.ABS_X]:
+                        changes.append((ecodes.EV_ABS, ecodes.ABS_X, raw_x))
+                    if raw_y != self.values[ecodes.ABS_Y]:
+                        changes.append((ecodes.EV_ABS, ecodes.ABS_Y, raw_y))
+                    if released_at is not None and monotonic() >= released_at:
+                        changes.append((ecodes.EV_KEY, button, 0))
+                        released_at = None
+                    if changes:
+                        self._emit(changes)
+
+                    deadline += self.period
+                    delay = deadline - monotonic()
+                    if delay > 0:
+                        sleep(delay)
+                    else:
+                        deadline = monotonic()
+            if not self.loop:
+                return
+
+
+def connect_gamepad(script=None, deadzone=0.08):
+    steps = load_gamepad_script(script) if script else DEFAULT_GAMEPAD_SCRIPT
+    return XboxController(deadzone=deadzone, device=VirtualGamepad(steps))
+
+
+class SimulatedBattery:
+    """Two-cell Li-ion pack that drains with the idle draw plus load() amps."""
+
+    def __init__(self, capacity_ah=DEFAULT_CAPACITY_AH, charge=DEFAULT_CHARGE, load=None):
+        self.capacity_ah = capacity_ah
+        self.charge = charge
+        self.load = load
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def sample(self):
+        """Return (volts at the terminals, amps drawn) now."""
+
+        amps = IDLE_AMPS + (self.load() if self.load else 0.0)
+        with self.lock:
+            now = monotonic()
+            self.charge = max(0.0, self.charge - amps * (now - self.updated) / 3600 / self.capacity_ah)
+            self.updated = now
+            charge = self.charge
+        return EMPTY_VOLTAGE + (FULL_VOLTAGE - EMPTY_VOLTAGE) * charge - amps * INTERNAL_RESISTANCE, amps
+
+
+def motor_amps(output):
+    """Current the motors draw for a control output such as {"left": 0.5, "right": 0.5}."""
+
+    return sum(abs(power) for power in output.values()) * MOTOR_AMPS
+
+
+def to_register(value):
+    return int(round(value)) & 0xFFFF
+
+
+class Ina219Model:
+    """INA219 register file as the UPS HAT presents it, measuring a SimulatedBattery.
+
+    Writes set the register pointer and, with two data bytes, a register.
+    Current and power read zero until the calibration register is set, and a
+    config write with the reset bit clears calibration, as on the chip.
+    """
+
+    def __init__(self, battery):
+        self.battery = battery
+        self.pointer = REG_CONFIG
+        self.registers = {REG_CONFIG: CONFIG_32V_2A, REG_CALIBRATION: 0}
+
+    def write(self, data):
+        if not data:
+            return
+        self.pointer = data[0]
+        if len(data) >= 3:
+            value = (data[1] << 8) | data[2]
+            if self.pointer == REG_CONFIG and value & CONFIG_RESET:
+                self.registers = {REG_CONFIG: CONFIG_32V_2A, REG_CALIBRATION: 0}
+            elif self.pointer in (REG_CONFIG, REG_CALIBRATION):
+                self.registers[self.pointer] = value
+
+    def read(self, length):
+        value = self._register(self.pointer)
+        return bytes([(value >> 8) & 0xFF, value & 0xFF] * ((length + 1) // 2))[:length]
+
+    def _register(self, register):
+        if register in self.registers:
+            return self.registers[register]
+
+        volts, amps = self.battery.sample()
+        calibrated = self.registers[REG_CALIBRATION] == CALIBRATION_VALUE
+        # The HAT reports discharge as negative current.
+        if register == REG_SHUNT_VOLTAGE:
+            return to_register(-amps * SHUNT_OHMS / SHUNT_LSB_VOLTS)
+        if register == REG_BUS_VOLTAGE:
+            return (int(volts * 1000 / 4) << 3) | CONVERSION_READY
+        if register == REG_CURRENT:
+            return to_register(-amps * 1000 / CURRENT_LSB_MA) if calibrated else 0
+        if register == REG_POWER:
+            return to_register(volts * amps * 1000 / POWER_LSB_MW) if calibrated else 0
+        return 0
+
+
+class Pcf8574Model:
+    """PCF8574 backpack driving an HD44780 in 4-bit mode, decoded into display memory.
+
+    Each byte written sets the eight output pins. A falling edge on the enable
+    pin latches the data nibble, so the model sees exactly what the LCD would,
+    including the 8-bit start-up sequence LedDisplay.initialize() sends.
+    """
+
+    def __init__(self, columns=LCD_COLUMNS):
+        self.columns = columns
+        self.output = 0xFF
+        self.eight_bit = True
+        self.high = None
+        self.address = 0
+        self.ddram = bytearray(b" " * DDRAM_BYTES)
+
+    def write(self, data):
+        for value in data:
+            if self.output & ENABLE and not value & ENABLE:
+                self._latch(value >> 4, value & REGISTER_SELECT)
+            self.output = value
+
+    def read(self, length):
+        return bytes([self.output] * length)
+
+    def _latch(self, nibble, data):
+        if self.eight_bit:
+            # Only the upper four data lines are wired, so an 8-bit instruction has a zero low nibble.
+            self._execute(nibble << 4, data)
+            return
+        if self.high is None:
+            self.high = nibble
+            return
+        value = (self.high << 4) | nibble
+        self.high = None
+        self._execute(value, data)
+
+    def _execute(self, value, data):
+        if data:
+            self.ddram[self.address] = value
+            self.address = (self.address + 1) % DDRAM_BYTES
+        elif value & 0x80:
+            self.address = value & 0x7F
+        elif value & 0x20:
+            # Function set; bit 4 selects the 8-bit interface.
+            self.eight_bit = bool(value & 0x10)
+            self.high = None
+        elif value == 0x01:
+            self.ddram[:] = b" " * DDRAM_BYTES
+            self.address = 0
+        elif value & 0xFE == 0x02:
+            self.address = 0
+
+    def lines(self):
+        return [
+            self.ddram[start : start + self.columns].decode("ascii", errors="replace")
+            for start in LCD_LINES
+        ]
+
+
+class SimulatedSMBus:
+    """smbus2.SMBus stand-in that routes transfers to register models at I2C speed.
+
+    Addresses without a model fail with ENXIO, as a missing device would.
+    """
+
+    def __init__(self, devices, clock_hz=I2C_CLOCK_HZ):
+        self.devices = dict(devices)
+        self.byte_seconds = 9 / clock_hz
+
+    def _device(self, address):
+        device = self.devices.get(address)
+        if device is None:
+            raise OSError(errno.ENXIO, f"no device at 0x{address:02x}")
+        return device
+
+    def _transfer(self, messages, data_bytes):
+        sleep((messages + data_bytes) * self.byte_seconds)
+
+    def read_byte(self, address):
+        device = self._device(address)
+        self._transfer(1, 1)
+        return device.read(1)[0]
+
+    def write_byte(self, address, value):
+        device = self._device(address)
+        self._transfer(1, 1)
+        device.write([value])
+
+    def read_i2c_block_data(self, address, register, length):
+        device = self._device(address)
+        self._transfer(2, 1 + length)
+        device.write([register])
+        return list(device.read(length))
+
+    def write_i2c_block_data(self, address, register, data):
+        device = self._device(address)
+        self._transfer(1, 1 + len(data))
+        device.write([register, *data])
+
+    def i2c_rdwr(self, *messages):
+        total = 0
+        for message in messages:
+            device = self._device(message.addr)
+            total += message.len
+            if message.flags & 1:
+                data = device.read(message.len)
+                ctypes.memmove(message.buf, bytes(data), message.len)
+            else:
+                device.write(list(message))
+        self._transfer(len(messages), total)
+
+    def close(self):
+        pass
+
+
+def simulated_bus(battery=None):
+    """An SMBus with the UPS HAT's INA219 and the LCD backpack on their usual addresses."""
+
+    return SimulatedSMBus(
+        {
+            HAT_ADDRESS: Ina219Model(battery or SimulatedBattery()),
+            LCD_ADDRESS: Pcf8574Model(),
+        }
+    )
+
+
+def test_pattern(index, width, height, period):
+    """RGB frame: a colour gradient with a bar that sweeps across once per period frames."""
+
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:, :, 0] = np.linspace(0, 255, width, dtype=np.uint8)
+    image[:, :, 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+    image[:, :, 2] = (index * 255 // max(1, period - 1)) & 0xFF
+    bar = index * width // period
+    image[:, bar : bar + max(1, width // 32)] = 255
+    return image
+
+
+def encode_loop(width, height, framerate, bitrate, intra_period, frames):
+    """Encode frames of test pattern as Annex B H.264, a keyframe with SPS/PPS every intra_period."""
+
+    import av
+
+    codec = av.CodecContext.create("libx264", "w")
+    codec.width = width
+    codec.height = height
+    codec.pix_fmt = "yuv420p"
+    codec.time_base = Fraction(1, int(round(framerate)))
+    codec.framerate = Fraction(int(round(framerate)))
+    codec.bit_rate = int(bitrate)
+    codec.gop_size = intra_period
+    codec.max_b_frames = 0
+    codec.options = {
+        "preset": "ultrafast",
+        "tune": "zerolatency",
+        "x264-params": f"keyint={intra_period}:min-keyint={intra_period}:scenecut=0:repeat-headers=1",
+    }
+
+    packets = []
+    for index in range(frames):
+        frame = av.VideoFrame.from_ndarray(test_pattern(index, width, height, frames), format="rgb24")
+        frame.pts = index
+        packets.extend(codec.encode(frame))
+    packets.extend(codec.encode(None))
+    return [(bytes(packet), packet.is_keyframe) for packet in packets]
+
+
+class SyntheticRequest:
+    def __init__(self, frame):
+        self.frame = frame
+
+    def save(self, name, path):
+        Image.fromarray(self.frame).save(path, "JPEG", quality=90)
+
+    def release(self):
+        pass
+
+
+class SyntheticCamera:
+    """Picamera2 stand-in for CameraService that streams a test pattern at the frame rate.
+
+    A short loop of the pattern is encoded once with PyAV's libx264, GOP for
+    GOP like the Pi's encoder, and then replayed with live timestamps, so the
+    stream costs no encoding time. Stills wait for the next frame boundary,
+    as capture_request() does, and render the frame as a JPEG.
+    """
+
+    def __init__(
+        self,
+        width=DEFAULT_WIDTH,
+        height=DEFAULT_HEIGHT,
+        framerate=DEFAULT_FRAMERATE,
+        bitrate=DEFAULT_BITRATE,
+        intra_period=DEFAULT_INTRA_PERIOD,
+        loop_seconds=LOOP_SECONDS,
+    ):
+        if Image is None:
+            raise RuntimeError("the synthetic camera needs Pillow")
+
+        self.width = int(width)
+        self.height = int(height)
+        self.period = 1 / float(framerate)
+        gops = max(1, int(round(loop_seconds * framerate / intra_period)))
+        self.length = gops * intra_period
+        self.packets = encode_loop(self.width, self.height, framerate, bitrate, intra_period, self.length)
+        self.started = None
+        self.output = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.started = monotonic()
+
+    def stop(self):
+        self.stop_encoder()
+
+    def close(self):
+        pass
+
+    def start_encoder(self, encoder, output):
+        self.output = output
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="diamond-sim-camera", daemon=True)
+        self.thread.start()
+
+    def stop_encoder(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)
+        self.thread = None
+
+    def _frame_index(self, now):
+        return int((now - self.started) / self.period) % self.length
+
+    def capture_request(self):
+        now = monotonic()
+        sleep(self.period - (now - self.started) % self.period)
+        index = self._frame_index(monotonic())
+        return SyntheticRequest(test_pattern(index, self.width, self.height, self.length))
+
+    def _run(self):
+        # A freshly started encoder opens with a keyframe.
+        position = 0
+        deadline = monotonic()
+        while self.running:
+            data, keyframe = self.packets[position]
+            self.output.outputframe(data, keyframe, int(monotonic() * 1_000_000))
+            position = (position + 1) % len(self.packets)
+
+            deadline += self.period
+            delay = deadline - monotonic()
+            if delay > 0:
+                sleep(delay)
+            else:
+                deadline = monotonic()
+
+
+def connect_camera(
+    width=DEFAULT_WIDTH,
+    height=DEFAULT_HEIGHT,
+    framerate=DEFAULT_FRAMERATE,
+    preroll_bytes=DEFAULT_PREROLL_BYTES,
+):
+    synthetic = SyntheticCamera(width=width, height=height, framerate=framerate)
+    return CameraService(
+        width=width,
+        height=height,
+        framerate=framerate,
+        preroll_bytes=preroll_bytes,
+        picam2=synthetic,
+    )
+
+
+class PacedAudioSink:
+    """Speaker stand-in that takes PCM at the playback rate, optionally saving it as a WAV file.
+
+    write() blocks once more than buffer_seconds of audio is waiting, as a
+    blocking ALSA write does when the device buffer is full.
+    """
+
+    def __init__(self, rate, buffer_seconds, output=None):
+        self.rate = rate
+        self.buffer_seconds = buffer_seconds
+        self.played_until = monotonic()
+        self.file = None
+        if output:
+            self.file = wave.open(str(output), "wb")
+            self.file.setnchannels(1)
+            self.file.setsampwidth(2)
+            self.file.setframerate(rate)
+
+    def write(self, data):
+        if self.file is not None:
+            self.file.writeframes(data)
+        now = monotonic()
+        self.played_until = max(self.played_until, now) + len(data) / 2 / self.rate
+        ahead = self.played_until - now - self.buffer_seconds
+        if ahead > 0:
+            sleep(ahead)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def connect_speaker(output=None):
+    """An AudioEngine that plays into silence, or into a WAV file at output."""
+
+    buffer_seconds = DEFAULT_PERIOD_FRAMES * DEFAULT_PERIODS / SPEAKER_RATE
+    return AudioEngine(device="simulated", sink=PacedAudioSink(SPEAKER_RATE, buffer_seconds, output))
+
+
+class SimulatedMicrophone:
+    """MicrophoneStream source that captures silence, or a WAV file on repeat, at the capture rate."""
+
+    def __init__(self, rate=MIC_RATE, channels=MIC_CHANNELS, path=None):
+        self.rate = rate
+        self.channels = channels
+        self.samples = None
+        if path:
+            samples = (np.clip(load_wav(path, rate=rate), -1, 1) * 32767).astype("<i2")
+            self.samples = samples if len(samples) else None
+        self.position = 0
+        self.next_time = None
+
+    def read(self, frames):
+        now = monotonic()
+        if self.next_time is None:
+            self.next_time = now
+        self.next_time += frames / self.rate
+        delay = self.next_time - now
+        if delay > 0:
+            sleep(delay)
+
+        if self.samples is None:
+            data = np.zeros(frames, dtype="<i2")
+        else:
+            data = np.take(self.samples, range(self.position, self.position + frames), mode="wrap")
+            self.position = (self.position + frames) % len(self.samples)
+        if self.channels > 1:
+            data = np.repeat(data[:, None], self.channels, axis=1)
+        return data.tobytes()
+
+    def close(self):
+        pass
+
+
+def connect_microphone(path=None, rate=MIC_RATE, channels=MIC_CHANNELS):
+    """A MicrophoneStream that hears silence, or the WAV file at path on repeat."""
+
+    return MicrophoneStream(
+        device="simulated",
+        rate=rate,
+        channels=channels,
+        source=SimulatedMicrophone(rate, channels, path),
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Exercise Diamond's simulated gamepad, UPS HAT, LCD and camera without hardware. "
+            "Import API: controllers.simulation.connect_gamepad(), simulated_bus(), connect_camera()."
+        )
+    )
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--script", help="gamepad script of 'seconds x y [button]' lines")
+    parser.add_argument("--still", help="save a synthetic camera still here")
+    return parser.parse_args()
+
+
+def main():
+    from controllers.led_display import LedDisplay
+    from controllers.waveshare_hat import WaveshareHat, format_battery
+
+    args = parse_args()
+    bus = simulated_bus()
+    display = LedDisplay(bus)
+    display.write_line(0, "Diamond")
+    display.write_line(1, "simulated")
+    print("LCD: " + " | ".join(bus.devices[LCD_ADDRESS].lines()))
+    print(format_battery(WaveshareHat(bus).battery()))
+
+    if args.still:
+        camera = connect_camera(preroll_bytes=0)
+        try:
+            print(f"Still: {camera.capture_still(args.still)}")
+        finally:
+            camera.close()
+
+    controller = connect_gamepad(args.script)
+    deadline = monotonic() + args.seconds
+    try:
+        while monotonic() < deadline:
+            state = controller.poll(timeout=0.1)
+            if state.changed:
+                print(f"x={state.x:+.2f} y={state.y:+.2f} buttons={','.join(state.buttons) or '-'}")
+    finally:
+        controller.device.close()
+
+
+if __name__ == "__main__":
+    main()
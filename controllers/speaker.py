@@ -1,10 +1,19 @@
 import argparse
-import math
+import itertools
 import tempfile
 import subprocess
+import threading
 import wave
+from collections import OrderedDict, deque
 from pathlib import Path
 
+import numpy as np
+
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
 
 """
 Persistent Raspberry Pi setup for the MAX98357A I2S amplifier lives in
@@ -21,6 +30,15 @@ DEFAULT_FREQUENCY = 880
 DEFAULT_SECONDS = 0.25
 DEFAULT_VOLUME = 0.10
 DEFAULT_RATE = 48000
+# 10 ms periods; four of them make the whole ALSA buffer 40 ms deep.
+DEFAULT_PERIOD_FRAMES = 480
+DEFAULT_PERIODS = 4
+DEFAULT_MAX_VOICES = 8
+# Stop feeding silence after this long so an idle engine sleeps instead of spinning.
+IDLE_SECONDS = 2.0
+# Raised-cosine attack and release that keep tones from clicking.
+DEFAULT_FADE_SECONDS = 0.005
+DEFAULT_SOUND_BANK_BYTES = 16 * 1024 * 1024
 
 
 def list_speakers():
@@ -35,33 +53,402 @@ def list_speakers():
     return result.stdout.strip()
 
 
-def play_file(path, device=DEFAULT_DEVICE):
-    """Play an audio file through the MAX98357A speaker output."""
+def aplay_command(path, device=DEFAULT_DEVICE):
+    return ["aplay", "-D", device, str(path)]
+
+
+def play_file(path, device=DEFAULT_DEVICE, engine=None):
+    """Play an audio file through the MAX98357A speaker output.
+
+    With an AudioEngine this queues the decoded file and returns its Voice at
+    once; without one it blocks on aplay until playback finishes.
+    """
 
     audio_path = Path(path)
-    subprocess.run(["aplay", "-D", device, str(audio_path)], check=True)
+    if engine is not None:
+        return engine.play(SOUND_BANK.sound(audio_path, rate=engine.rate))
+
+    subprocess.run(aplay_command(audio_path, device), check=True)
+    return None
+
+
+def load_wav(path, rate=DEFAULT_RATE):
+    """Decode a PCM WAV file to mono float32 samples at rate."""
+
+    with wave.open(str(path), "rb") as source:
+        channels = source.getnchannels()
+        width = source.getsampwidth()
+        source_rate = source.getframerate()
+        data = source.readframes(source.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768
+    elif width == 4:
+        samples = np.frombuffer(data, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"unsupported WAV sample width: {width * 8} bits")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+
+    return resample(samples, source_rate, rate)
+
+
+def resample(samples, source_rate, rate):
+    if source_rate == rate or len(samples) == 0:
+        return samples.astype(np.float32, copy=False)
+
+    count = int(round(len(samples) * rate / source_rate))
+    positions = np.arange(count, dtype=np.float64) * (source_rate / rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def load_sound(path, rate=DEFAULT_RATE):
+    """Decode any audio file to mono float32 samples, using ffmpeg for non-WAV input."""
+
+    path = Path(path)
+    if path.suffix.lower() == ".wav":
+        try:
+            return load_wav(path, rate=rate)
+        except (wave.Error, ValueError):
+            pass
+
+    result = subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-i", str(path), "-f", "s16le", "-ac", "1", "-ar", str(rate), "-"],
+        check=True,
+        capture_output=True,
+    )
+    return np.frombuffer(result.stdout, dtype="<i2").astype(np.float32) / 32768
+
+
+class Voice:
+    """Handle for one sound queued on an AudioEngine."""
+
+    def __init__(self, voice_id, samples, volume=1.0):
+        self.id = voice_id
+        self.samples = samples
+        self.volume = float(volume)
+        self.position = 0
+        self.stopped = False
+        self.done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.done.is_set()
+
+    def stop(self):
+        self.stopped = True
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+
+class AlsaSink:
+    """Blocking PCM writer on an ALSA device through pyalsaaudio."""
+
+    def __init__(self, device, rate, period_frames, periods):
+        self.pcm = alsaaudio.PCM(
+            type=alsaaudio.PCM_PLAYBACK,
+            mode=alsaaudio.PCM_NORMAL,
+            rate=rate,
+            channels=1,
+            format=alsaaudio.PCM_FORMAT_S16_LE,
+            periodsize=period_frames,
+            periods=periods,
+            device=device,
+        )
+
+    def write(self, data):
+        self.pcm.write(data)
+
+    def close(self):
+        self.pcm.close()
+
+
+class AplaySink:
+    """Blocking PCM writer feeding one long-lived aplay process over a pipe."""
+
+    def __init__(self, device, rate, period_frames, periods):
+        self.process = subprocess.Popen(
+            [
+                "aplay",
+                "-q",
+                "-D",
+                device,
+                "-t",
+                "raw",
+                "-f",
+                "S16_LE",
+                "-c",
+                "1",
+                "-r",
+                str(rate),
+                f"--period-size={period_frames}",
+                f"--buffer-size={period_frames * periods}",
+            ],
+            stdin=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            import fcntl
+
+            # Keep the pipe from holding more audio than the ALSA buffer itself.
+            fcntl.fcntl(self.process.stdin.fileno(), fcntl.F_SETPIPE_SZ, 4096)
+        except (ImportError, AttributeError, OSError):
+            pass
+
+    def write(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class AudioEngine:
+    """Long-lived speaker output with a software mixer and a queue of voices.
+
+    One thread owns the ALSA device and writes one period at a time, mixing up
+    to max_voices sounds; further sounds wait their turn. play() returns a Voice
+    immediately, so a new sound starts within about one period.
+    """
+
+    def __init__(
+        self,
+        device=DEFAULT_DEVICE,
+        rate=DEFAULT_RATE,
+        period_frames=DEFAULT_PERIOD_FRAMES,
+        periods=DEFAULT_PERIODS,
+        max_voices=DEFAULT_MAX_VOICES,
+        sink=None,
+    ):
+        self.device = device
+        self.rate = int(rate)
+        self.period_frames = int(period_frames)
+        self.max_voices = int(max_voices)
+        if sink is None:
+            sink_type = AlsaSink if alsaaudio is not None else AplaySink
+            sink = sink_type(device, self.rate, self.period_frames, int(periods))
+        self.sink = sink
+        self.active = []
+        self.pending = deque()
+        self.ids = itertools.count(1)
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="diamond-audio", daemon=True)
+        self.thread.start()
+
+    def play(self, samples, volume=1.0):
+        voice = Voice(next(self.ids), np.asarray(samples, dtype=np.float32), volume)
+        with self.condition:
+            if not self.running:
+                raise OSError("audio engine is not running")
+            self.pending.append(voice)
+            self.condition.notify()
+        return voice
+
+    def stop_all(self):
+        with self.condition:
+            for voice in [*self.active, *self.pending]:
+                voice.stop()
+
+    def voices(self):
+        with self.condition:
+            return [*self.active, *self.pending]
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(timeout=1)
+        self.sink.close()
+
+    def _take_voices(self, block):
+        with self.condition:
+            while block and self.running and not self.active and not self.pending:
+                self.condition.wait()
+
+            while self.pending and len(self.active) < self.max_voices:
+                self.active.append(self.pending.popleft())
+
+            return list(self.active)
+
+    def _mix(self, voices):
+        mix = np.zeros(self.period_frames, dtype=np.float32)
+        finished = []
+
+        for voice in voices:
+            if not voice.stopped:
+                chunk = voice.samples[voice.position : voice.position + self.period_frames]
+                mix[: len(chunk)] += chunk * voice.volume
+                voice.position += len(chunk)
+
+            if voice.stopped or voice.position >= len(voice.samples):
+                finished.append(voice)
+
+        if finished:
+            with self.condition:
+                self.active = [voice for voice in self.active if voice not in finished]
+            for voice in finished:
+                voice.done.set()
+
+        np.clip(mix, -1, 1, out=mix)
+        return (mix * 32767).astype("<i2").tobytes()
+
+    def _run(self):
+        silence = bytes(self.period_frames * 2)
+        idle_periods = int(IDLE_SECONDS * self.rate / self.period_frames)
+        quiet = idle_periods
+
+        try:
+            while self.running:
+                voices = self._take_voices(block=quiet >= idle_periods)
+                if not self.running:
+                    break
+
+                if voices:
+                    quiet = 0
+                    self.sink.write(self._mix(voices))
+                else:
+                    # Trail a little silence so the amplifier does not pop on every short sound.
+                    quiet += 1
+                    self.sink.write(silence)
+        except OSError as error:
+            print(f"Speaker output failed: {error}", flush=True)
+        finally:
+            with self.condition:
+                self.running = False
+                voices = [*self.active, *self.pending]
+                self.active = []
+                self.pending.clear()
+            for voice in voices:
+                voice.done.set()
+
+
+def connect_speaker(device=DEFAULT_DEVICE):
+    """Open a persistent speaker output engine or raise if the device is unavailable."""
+
+    return AudioEngine(device=device)
 
 
 def clamp(value, minimum=0, maximum=1):
     return max(minimum, min(maximum, value))
 
 
-def write_tone(path, frequency=DEFAULT_FREQUENCY, seconds=DEFAULT_SECONDS, volume=DEFAULT_VOLUME):
+def render_tone(
+    frequency=DEFAULT_FREQUENCY,
+    seconds=DEFAULT_SECONDS,
+    volume=DEFAULT_VOLUME,
+    rate=DEFAULT_RATE,
+    fade=DEFAULT_FADE_SECONDS,
+):
+    """Synthesize a sine tone as mono float32 samples in one vectorized pass."""
+
     duration = float(seconds)
     if duration <= 0:
         raise ValueError("seconds must be greater than 0")
 
-    amplitude = int(32767 * clamp(float(volume)))
-    frames = int(DEFAULT_RATE * duration)
+    frames = int(rate * duration)
+    phase = np.arange(frames, dtype=np.float64) * (2 * np.pi * float(frequency) / rate)
+    samples = np.sin(phase).astype(np.float32)
+    samples *= clamp(float(volume))
+
+    fade_frames = min(int(rate * fade), frames // 2)
+    if fade_frames:
+        ramp = (0.5 - 0.5 * np.cos(np.linspace(0, np.pi, fade_frames, dtype=np.float32))).astype(np.float32)
+        samples[:fade_frames] *= ramp
+        samples[frames - fade_frames :] *= ramp[::-1]
+
+    return samples
+
+
+def to_pcm16(samples):
+    return (np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def write_tone(path, frequency=DEFAULT_FREQUENCY, seconds=DEFAULT_SECONDS, volume=DEFAULT_VOLUME):
+    samples = SOUND_BANK.tone(frequency, seconds, volume, rate=DEFAULT_RATE)
 
     with wave.open(str(path), "wb") as output:
         output.setnchannels(1)
         output.setsampwidth(2)
         output.setframerate(DEFAULT_RATE)
+        output.writeframes(to_pcm16(samples))
+
+
+class SoundBank:
+    """LRU cache of decoded and synthesized PCM, bounded by total bytes.
 
-        for index in range(frames):
-            sample = int(amplitude * math.sin(2 * math.pi * frequency * index / DEFAULT_RATE))
-            output.writeframesraw(sample.to_bytes(2, "little", signed=True))
+    Cached arrays are read-only and shared between voices, so a repeated beep or
+    capture replays without touching disk or recomputing samples.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_SOUND_BANK_BYTES):
+        self.max_bytes = int(max_bytes)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, render):
+        with self.lock:
+            samples = self.entries.get(key)
+            if samples is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return samples
+            self.misses += 1
+
+        samples = np.ascontiguousarray(render(), dtype=np.float32)
+        samples.flags.writeable = False
+
+        with self.lock:
+            if key not in self.entries and samples.nbytes <= self.max_bytes:
+                self.entries[key] = samples
+                self.size += samples.nbytes
+                while self.size > self.max_bytes:
+                    _, evicted = self.entries.popitem(last=False)
+                    self.size -= evicted.nbytes
+        return samples
+
+    def tone(self, frequency, seconds, volume, rate=DEFAULT_RATE):
+        key = ("tone", float(frequency), float(seconds), round(clamp(float(volume)), 4), int(rate))
+        return self.get(key, lambda: render_tone(frequency, seconds, volume, rate=rate))
+
+    def sound(self, path, rate=DEFAULT_RATE):
+        path = Path(path)
+        stat = path.stat()
+        # Keyed by size and mtime so a rewritten capture is decoded again.
+        key = ("file", str(path.resolve()), stat.st_size, stat.st_mtime_ns, int(rate))
+        return self.get(key, lambda: load_sound(path, rate=rate))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+SOUND_BANK = SoundBank()
 
 
 def play_tone(
@@ -69,8 +456,12 @@ def play_tone(
     seconds=DEFAULT_SECONDS,
     volume=DEFAULT_VOLUME,
     device=DEFAULT_DEVICE,
+    engine=None,
 ):
-    """Play a short sine tone through the MAX98357A speaker output."""
+    """Play a short sine tone; returns a Voice at once when given an AudioEngine."""
+
+    if engine is not None:
+        return engine.play(SOUND_BANK.tone(frequency, seconds, volume, rate=engine.rate))
 
     with tempfile.NamedTemporaryFile(prefix="diamond-tone-", suffix=".wav", delete=True) as file:
         write_tone(file.name, frequency=frequency, seconds=seconds, volume=volume)
@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+
+# How often the status is rebuilt and checked for changes while anyone is listening.
+STATUS_INTERVAL = 0.5
+HEARTBEAT_SECONDS = 15
+# A subscriber this far behind is resynchronized with a fresh snapshot.
+MAX_QUEUED_EVENTS = 8
+
+
+def diff(old, new):
+    """Return the fields of new that differ from old, recursing into nested dicts."""
+
+    changes = {}
+    for key, value in new.items():
+        if key not in old:
+            changes[key] = value
+            continue
+
+        previous = old[key]
+        if isinstance(value, dict) and isinstance(previous, dict):
+            nested = diff(previous, value)
+            if nested:
+                changes[key] = nested
+        elif value != previous:
+            changes[key] = value
+    return changes
+
+
+def sse_message(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n".encode()
+
+
+class StatusBroadcast:
+    """Push status snapshots and deltas to Server-Sent Events subscribers.
+
+    New subscribers get a full "snapshot" event. After that, the status is
+    rebuilt every interval, or as soon as notify() is called, and only the
+    changed fields go out as one "delta" event. Nested objects in a delta merge
+    into the previous value. Each event is serialized once and the same bytes
+    are queued for every subscriber. build() runs in a worker thread, since it
+    may stat files or wait on locks and the loop also carries drive input.
+    """
+
+    def __init__(self, build, interval=STATUS_INTERVAL):
+        self.build = build
+        self.interval = interval
+        self.status = None
+        self.snapshot = None
+        self.subscribers = set()
+        self.loop = None
+        self.wake = None
+        self.closed = False
+
+    def notify(self):
+        """Publish soon instead of at the next interval; safe from any thread."""
+
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wake.set)
+
+    async def subscribe(self):
+        queue = asyncio.Queue(MAX_QUEUED_EVENTS)
+        if self.status is None:
+            await self.publish()
+        queue.put_nowait(self.snapshot_message())
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def snapshot_message(self):
+        if self.snapshot is None:
+            self.snapshot = sse_message("snapshot", self.status)
+        return self.snapshot
+
+    async def publish(self):
+        status = await asyncio.to_thread(self.build)
+        if self.status is None:
+            self.status = status
+            return
+
+        changes = diff(self.status, status)
+        if not changes:
+            return
+
+        self.status = status
+        self.snapshot = None
+        message = sse_message("delta", changes)
+
+        for queue in list(self.subscribers):
+            if queue.full():
+                # Too far behind for deltas to be useful; start it over from the current state.
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self.snapshot_message())
+            else:
+                queue.put_nowait(message)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.wake = asyncio.Event()
+
+        while not self.closed:
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+            if self.subscribers:
+                try:
+                    await self.publish()
+                except Exception as error:
+                    print(f"Status publish failed: {error!r}", flush=True)
+
+    def close(self):
+        """End every open stream so the server can shut down."""
+
+        self.closed = True
+        for queue in list(self.subscribers):
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    async def events(self):
+        """Yield encoded SSE messages for one client until the broadcast closes."""
+
+        queue = await self.subscribe()
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    message = b": keepalive\n\n"
+                if message is None:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(queue)
@@ -0,0 +1,209 @@
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from controllers.i2c_bus import PRIORITY_TELEMETRY
+from controllers.utils import OptionalController
+from controllers.waveshare_hat import WaveshareHat
+
+
+DEFAULT_RATE = 2.0
+MAX_RATE = 50.0
+DEFAULT_HISTORY_SECONDS = 3600
+DEFAULT_HISTORY_POINTS = 300
+FIELDS = ("time", "voltage", "current", "power", "percent")
+
+
+def validate_rate(value):
+    rate = float(value)
+    if not 0 < rate <= MAX_RATE:
+        raise ValueError(f"rate must be greater than 0 and at most {MAX_RATE:g} Hz")
+    return rate
+
+
+def downsample(rows, points):
+    """Average rows into at most points evenly sized buckets."""
+
+    if points <= 0 or len(rows) <= points:
+        return rows
+
+    edges = np.linspace(0, len(rows), points + 1).astype(int)
+    sums = np.add.reduceat(rows, edges[:-1], axis=0)
+    return sums / np.diff(edges)[:, None]
+
+
+class TelemetryHistory:
+    """Fixed-size ring of telemetry rows, one column per FIELDS entry.
+
+    The time column holds time.monotonic(), which only moves forward, so rows
+    stay sorted for since queries when NTP steps the wall clock of a Pi that
+    booted without a real-time clock.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(1, int(capacity))
+        self.rows = np.zeros((self.capacity, len(FIELDS)))
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, row):
+        with self.lock:
+            self.rows[self.count % self.capacity] = row
+            self.count += 1
+
+    def snapshot(self, since=None):
+        """Return rows in time order, optionally only those at or after monotonic time since."""
+
+        with self.lock:
+            if self.count <= self.capacity:
+                rows = self.rows[: self.count].copy()
+            else:
+                start = self.count % self.capacity
+                rows = np.concatenate((self.rows[start:], self.rows[:start]))
+
+        if since is not None:
+            rows = rows[np.searchsorted(rows[:, 0], since) :]
+        return rows
+
+
+class TelemetrySampler:
+    """Background thread that samples the UPS HAT at a fixed rate into a history ring.
+
+    The HAT is opened and configured once and kept open; each sample is a single
+    batched register read. A failed read drops the HAT so the OptionalController
+    retries the connection later. With an I2CBus, reads run as top-priority
+    transactions on the shared bus. A recorder, such as a BlackBox, gets every
+    sample.
+    """
+
+    def __init__(
+        self,
+        hat,
+        rate=DEFAULT_RATE,
+        history_seconds=DEFAULT_HISTORY_SECONDS,
+        bus=None,
+        recorder=None,
+    ):
+        self.hat = hat
+        self.bus = bus
+        self.recorder = recorder
+        self.period = 1 / validate_rate(rate)
+        self.history = TelemetryHistory(int(history_seconds * rate))
+        self.latest = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="diamond-telemetry", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+        if self.hat.device:
+            self.hat.device.close()
+            self.hat.device = None
+
+    def sample(self):
+        hat = self.hat.tick()
+        if hat is None:
+            self.latest = None
+            return None
+
+        try:
+            if self.bus is None:
+                battery = hat.battery()
+            else:
+                battery = self.bus.run("ups_hat", lambda smbus: hat.battery(), PRIORITY_TELEMETRY)
+        except OSError as error:
+            self.hat.clear(error)
+            self.latest = None
+            hat.close()
+            return None
+
+        now = time.monotonic()
+        battery["time"] = time.time()
+        self.history.append([now, *(battery[field] for field in FIELDS[1:])])
+        self.latest = battery
+        if self.recorder is not None:
+            self.recorder.telemetry(now, battery)
+        return battery
+
+    def history_json(self, seconds=None, points=DEFAULT_HISTORY_POINTS):
+        now = time.monotonic()
+        since = now - seconds if seconds else None
+        rows = downsample(self.history.snapshot(since), points)
+        # Stamp the results with the wall clock as it reads now.
+        rows[:, 0] += time.time() - now
+        return {
+            "rate": 1 / self.period,
+            "fields": list(FIELDS),
+            "samples": np.round(rows, 4).tolist(),
+        }
+
+    def _run(self):
+        deadline = time.monotonic()
+
+        while self.running:
+            self.sample()
+
+            deadline += self.period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.monotonic()
+
+
+def connect_sampler(rate=DEFAULT_RATE, history_seconds=DEFAULT_HISTORY_SECONDS, retry_interval=5):
+    hat = OptionalController("UPS HAT", WaveshareHat, retry_interval=retry_interval)
+    return TelemetrySampler(hat, rate=rate, history_seconds=history_seconds)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Sample Diamond's UPS HAT telemetry at a fixed rate and print a summary. "
+            "Import API: controllers.telemetry.connect_sampler(rate=2)."
+        )
+    )
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="samples per second")
+    parser.add_argument("--seconds", type=float, default=5)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sampler = connect_sampler(rate=args.rate, history_seconds=args.seconds)
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        time.sleep(args.seconds)
+    finally:
+        sampler.close()
+
+    rows = sampler.history.snapshot()
+    if not len(rows):
+        print("No samples read")
+        return
+
+    elapsed = time.perf_counter() - started
+    voltage = rows[:, FIELDS.index("voltage")]
+    current = rows[:, FIELDS.index("current")]
+    print(
+        f"samples={len(rows)} rate={len(rows) / elapsed:.1f}Hz "
+        f"voltage={voltage.mean():.3f}V ({voltage.min():.3f}-{voltage.max():.3f}) "
+        f"current={current.mean():.3f}A"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+from controllers.captures import capture_kind
+from controllers.utils import CAPTURE_DIR
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+    ImageDraw = None
+
+
+THUMBNAIL_DIR = CAPTURE_DIR / ".thumbnails"
+THUMBNAIL_SIZE = (320, 180)
+WAVEFORM_SIZE = (320, 64)
+WAVEFORM_RATE = 8000
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_WORKERS = 1
+# Bytes hashed from each end of a capture; enough to tell files apart without reading whole videos.
+FINGERPRINT_BYTES = 64 * 1024
+# Fingerprints remembered by (path, size, mtime); well past a full page of captures.
+MAX_DIGESTS = 4096
+RENDER_TIMEOUT = 30
+EXTENSIONS = {"image": "jpg", "video": "jpg", "audio": "png"}
+PLACEHOLDER_SVG = (
+    b'<svg xmlns="http://www.w3.org/2000/svg" width="320" height="180" viewBox="0 0 320 180">'
+    b'<rect width="320" height="180" fill="#e5e7eb"/></svg>'
+)
+
+
+def fingerprint(path):
+    """Hash a capture's size plus its first and last FINGERPRINT_BYTES."""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        digest.update(size.to_bytes(8, "little"))
+        digest.update(file.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            file.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            digest.update(file.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+
+def render_image(source, output):
+    with Image.open(source) as image:
+        # JPEG draft mode decodes at 1/2-1/8 scale, which skips most of the work.
+        image.draft("RGB", THUMBNAIL_SIZE)
+        image = image.convert("RGB")
+        image.thumbnail(THUMBNAIL_SIZE)
+        image.save(output, "JPEG", quality=80)
+
+
+def render_video_poster(source, output):
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-y",
+            "-i",
+            str(source),
+            "-frames:v",
+            "1",
+            "-vf",
+            f"scale={THUMBNAIL_SIZE[0]}:-2",
+            "-c:v",
+            "mjpeg",
+            "-f",
+            "image2",
+            str(output),
+        ],
+        check=True,
+        capture_output=True,
+        timeout=RENDER_TIMEOUT,
+    )
+
+
+def render_waveform(source, output):
+    from controllers.speaker import load_wav
+
+    width, height = WAVEFORM_SIZE
+    samples = load_wav(source, rate=WAVEFORM_RATE)
+    image = Image.new("RGB", WAVEFORM_SIZE, (17, 24, 39))
+    draw = ImageDraw.Draw(image)
+
+    if len(samples) >= width:
+        edges = np.linspace(0, len(samples), width + 1).astype(int)[:-1]
+        low = np.minimum.reduceat(samples, edges)
+        high = np.maximum.reduceat(samples, edges)
+        middle = (height - 1) / 2
+        top = np.round(middle - np.clip(high, -1, 1) * middle).astype(int)
+        bottom = np.round(middle - np.clip(low, -1, 1) * middle).astype(int)
+        for x in range(width):
+            draw.line((x, top[x], x, bottom[x]), fill=(96, 165, 250))
+
+    image.save(output, "PNG", optimize=True)
+
+
+def render(kind, source, output):
+    """Write the preview for one capture; runs in a pool worker process."""
+
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    partial = output.with_name(f".{output.name}.partial")
+
+    if kind == "image":
+        render_image(source, partial)
+    elif kind == "video":
+        render_video_poster(source, partial)
+    elif kind == "audio":
+        render_waveform(source, partial)
+    else:
+        raise ValueError(f"no preview for {kind} captures")
+
+    os.replace(partial, output)
+    return output.stat().st_size
+
+
+def preview_path(directory, digest, kind):
+    return Path(directory) / digest[:2] / f"{digest}.{EXTENSIONS[kind]}"
+
+
+def build(kind, source, directory):
+    """Fingerprint a capture and render its preview unless the cache has it; runs in a pool worker.
+
+    Returns the fingerprint and the bytes written to the cache.
+    """
+
+    digest = fingerprint(source)
+    output = preview_path(directory, digest, kind)
+    if output.exists():
+        return digest, 0
+    return digest, render(kind, source, output)
+
+
+def lower_priority():
+    os.nice(19)
+
+
+class ThumbnailCache:
+    """Content-addressed, size-bounded cache of capture previews.
+
+    lookup() answers from the cache immediately and never reads the capture.
+    On a miss it queues the preview in a low-priority worker process and
+    returns None, so callers can serve a placeholder. Previews are named by a
+    fingerprint of the capture's contents, which the worker computes; the
+    fingerprints of the last MAX_DIGESTS (path, size, mtime) keys are
+    remembered. The oldest previews are evicted once the cache grows past
+    max_bytes.
+    """
+
+    def __init__(self, directory=THUMBNAIL_DIR, max_bytes=DEFAULT_CACHE_BYTES, workers=DEFAULT_WORKERS):
+        self.directory = Path(directory)
+        self.max_bytes = int(max_bytes)
+        self.workers = workers
+        self.executor = None
+        self.digests = OrderedDict()
+        self.pending = {}
+        self.failed = set()
+        self.size = None
+        self.lock = threading.Lock()
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def cached_path(self, digest, kind):
+        return preview_path(self.directory, digest, kind)
+
+    def url(self, cached):
+        return "/captures/" + cached.relative_to(CAPTURE_DIR).as_posix()
+
+    def lookup(self, path, size, modified):
+        """Return the cached preview path for a capture, or None while it is being made."""
+
+        kind = capture_kind(path)
+        if kind not in EXTENSIONS or not self.available:
+            return None
+
+        key = (str(path), size, modified)
+        with self.lock:
+            digest = self.digests.get(key)
+            if digest is not None:
+                self.digests.move_to_end(key)
+
+        if digest is not None:
+            cached = self.cached_path(digest, kind)
+            if cached.exists():
+                return cached
+
+        self._schedule(key, kind, path)
+        return None
+
+    def _schedule(self, key, kind, path):
+        with self.lock:
+            if key in self.pending or key in self.failed:
+                return
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=get_context("spawn"),
+                    initializer=lower_priority,
+                )
+            future = self.executor.submit(build, kind, str(path), str(self.directory))
+            self.pending[key] = future
+
+        future.add_done_callback(lambda future: self._finished(key, path, future))
+
+    def _finished(self, key, path, future):
+        with self.lock:
+            self.pending.pop(key, None)
+            if future.cancelled():
+                return
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool):
+                # A worker died (out of memory, killed); start a fresh pool on the next lookup.
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False, cancel_futures=True)
+                    self.executor = None
+                print(f"Preview worker for {Path(path).name} exited: {error}", flush=True)
+                return
+            if error is not None:
+                self.failed.add(key)
+                print(f"Preview for {Path(path).name} failed: {error}", flush=True)
+                return
+
+            digest, written = future.result()
+            self.digests[key] = digest
+            self.digests.move_to_end(key)
+            while len(self.digests) > MAX_DIGESTS:
+                self.digests.popitem(last=False)
+
+            if self.size is None:
+                self.size = self._disk_usage()
+            else:
+                self.size += written
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        if not self.directory.exists():
+            return []
+        return [path for path in self.directory.glob("*/*") if not path.name.startswith(".")]
+
+    def _disk_usage(self):
+        return sum(path.stat().st_size for path in self._files())
+
+    def _evict(self):
+        files = sorted(((path.stat(), path) for path in self._files()), key=lambda item: item[0].st_mtime)
+        # Trim to 90% so every new preview does not trigger another eviction pass.
+        target = self.max_bytes * 0.9
+        for stat, path in files:
+            if self.size <= target:
+                break
+            path.unlink(missing_ok=True)
+            self.size -= stat.st_size
+
+    def clear(self):
+        with self.lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.digests.clear()
+            self.failed.clear()
+            self.size = 0
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Build preview images for Diamond's captures. "
+            "Import API: controllers.thumbnails.ThumbnailCache().lookup(path, size, modified)."
+        )
+    )
+    parser.add_argument("captures", nargs="*", help="capture files; defaults to every capture")
+    parser.add_argument("--clear", action="store_true", help="delete the preview cache first")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cache = ThumbnailCache()
+    if args.clear:
+        cache.clear()
+
+    paths = [Path(path) for path in args.captures] or sorted(
+        path for path in CAPTURE_DIR.iterdir() if path.is_file()
+    )
+    for path in paths:
+        kind = capture_kind(path)
+        if kind not in EXTENSIONS:
+            continue
+        cached = cache.cached_path(fingerprint(path), kind)
+        try:
+            if not cached.exists():
+                render(kind, path, cached)
+            print(f"{path.name} -> {cached}")
+        except Exception as error:
+            print(f"{path.name}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import itertools
+import os
 from datetime import datetime
 from pathlib import Path
 from time import monotonic
@@ -14,6 +16,31 @@ def capture_path(prefix, extension):
     return CAPTURE_DIR / f"{prefix}_{timestamp()}.{extension.lstrip('.')}"
 
 
+def claim_capture_path(directory, prefix, extension, also=()):
+    """Create an empty capture file in directory under a name no other capture has, and return it.
+
+    Names carry milliseconds, and a counter when two captures start within the
+    same one. The file is created with O_EXCL, so two recorders can never be
+    handed the same path. A name already used in one of the also directories
+    counts as taken too.
+    """
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]}"
+    extension = extension.lstrip(".")
+
+    for count in itertools.count():
+        name = f"{stem}-{count}.{extension}" if count else f"{stem}.{extension}"
+        if any((Path(other) / name).exists() for other in also):
+            continue
+        try:
+            os.close(os.open(directory / name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        except FileExistsError:
+            continue
+        return directory / name
+
+
 class OptionalController:
     """Retrying wrapper for hardware that may be disconnected at startup."""
 
@@ -28,6 +55,10 @@ class OptionalController:
     def available(self):
         return self.device is not None
 
+    def connect_due(self, now=None):
+        now = monotonic() if now is None else now
+        return self.device is None and now >= self.next_attempt
+
     def tick(self, now=None):
         now = monotonic() if now is None else now
 
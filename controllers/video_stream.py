@@ -0,0 +1,137 @@
+import asyncio
+import json
+import threading
+from collections import deque
+
+from controllers.mp4 import Fragmenter
+
+
+# About half a second of video at 30 fps; past that a viewer skips to the next keyframe.
+MAX_QUEUED_FRAMES = 15
+# A viewer that has to skip this many times in a row is too slow to keep.
+MAX_SKIPS = 5
+
+
+class LiveViewer:
+    """Bounded per-connection queue of fragmented MP4 messages.
+
+    push() runs on the event loop. A viewer starts at a keyframe, and when its
+    queue backs up it throws away everything pending and waits for the next
+    keyframe instead of letting latency grow.
+    """
+
+    def __init__(self, max_queued=MAX_QUEUED_FRAMES, max_skips=MAX_SKIPS):
+        self.max_queued = max_queued
+        self.max_skips = max_skips
+        self.queue = deque()
+        self.queued_frames = 0
+        self.ready = asyncio.Event()
+        self.init = None
+        self.waiting_for_keyframe = True
+        self.skips = 0
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    def push(self, header, init, segment, keyframe):
+        if self.closed:
+            return
+
+        if self.queued_frames >= self.max_queued:
+            self.queue.clear()
+            self.queued_frames = 0
+            self.init = None
+            self.waiting_for_keyframe = True
+            self.skips += 1
+            if self.skips > self.max_skips:
+                self.close()
+                return
+
+        if self.waiting_for_keyframe:
+            if not keyframe:
+                return
+            self.waiting_for_keyframe = False
+        elif keyframe:
+            self.skips = 0
+
+        if keyframe and self.init is not init:
+            self.queue.append(("text", header))
+            self.queue.append(("bytes", init))
+            self.init = init
+
+        self.queue.append(("frame", segment))
+        self.queued_frames += 1
+        self.ready.set()
+
+    async def next(self):
+        """Return ("text" | "bytes", payload), or None once the viewer is closed."""
+
+        while not self.queue and not self.closed:
+            self.ready.clear()
+            await self.ready.wait()
+
+        if self.closed:
+            return None
+
+        kind, payload = self.queue.popleft()
+        if kind == "frame":
+            self.queued_frames -= 1
+            kind = "bytes"
+        return kind, payload
+
+
+class LiveVideoBroadcast:
+    """Fan one camera encoder out to many viewers as fragmented MP4.
+
+    Each encoded frame, already parsed by the camera, is muxed into a media
+    segment once on the encoder thread, and the same bytes are queued for every
+    viewer on the event loop.
+    """
+
+    def __init__(self, camera, loop):
+        self.camera = camera
+        self.loop = loop
+        self.fragmenter = Fragmenter(camera.width, camera.height, camera.framerate)
+        self.viewers = set()
+        self.lock = threading.Lock()
+        self.header = None
+
+    def add(self, viewer):
+        with self.lock:
+            first = not self.viewers
+            self.viewers.add(viewer)
+        if first:
+            self.camera.subscribe(self.on_frame)
+
+    def remove(self, viewer):
+        viewer.close()
+        with self.lock:
+            self.viewers.discard(viewer)
+            last = not self.viewers
+        if last:
+            self.camera.unsubscribe(self.on_frame)
+
+    def on_frame(self, sample, frame):
+        self.fragmenter.update_parameters(sample)
+        if self.fragmenter.init is None:
+            return
+
+        if self.header is None or self.header[0] is not self.fragmenter.init:
+            header = json.dumps(
+                {
+                    "mime": f'video/mp4; codecs="{self.fragmenter.codec}"',
+                    "width": self.fragmenter.width,
+                    "height": self.fragmenter.height,
+                }
+            )
+            self.header = (self.fragmenter.init, header)
+
+        segment = self.fragmenter.fragment([sample])
+        init, header = self.header
+        self.loop.call_soon_threadsafe(self._deliver, header, init, segment, sample.keyframe)
+
+    def _deliver(self, header, init, segment, keyframe):
+        for viewer in list(self.viewers):
+            viewer.push(header, init, segment, keyframe)
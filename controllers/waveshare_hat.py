@@ -2,10 +2,12 @@ import argparse
 import time
 
 try:
-    from smbus2 import SMBus
+    from smbus2 import SMBus, i2c_msg
 except ImportError:
     from smbus import SMBus
 
+    i2c_msg = None
+
 
 DEFAULT_BUS = 1
 DEFAULT_ADDRESS = 0x42
@@ -24,6 +26,17 @@ CALIBRATION_VALUE = 4096
 CURRENT_LSB_MA = 0.1
 POWER_LSB_MW = 2.0
 
+SAMPLE_REGISTERS = (REG_SHUNT_VOLTAGE, REG_BUS_VOLTAGE, REG_POWER, REG_CURRENT, REG_CALIBRATION)
+
+
+def to_signed(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def register_value(data, signed=False):
+    value = (data[0] << 8) | data[1]
+    return to_signed(value) if signed else value
+
 
 def clamp(value, minimum=0, maximum=100):
     return max(minimum, min(maximum, value))
@@ -42,11 +55,13 @@ class WaveshareHat:
     def __init__(self, bus=DEFAULT_BUS, address=DEFAULT_ADDRESS):
         self.bus_number = bus
         self.address = address
-        self.bus = SMBus(bus)
+        self.owns_bus = isinstance(bus, int)
+        self.bus = SMBus(bus) if self.owns_bus else bus
         self.configure()
 
     def close(self):
-        self.bus.close()
+        if self.owns_bus:
+            self.bus.close()
 
     def _write_register(self, register, value):
         self.bus.write_i2c_block_data(
@@ -57,12 +72,23 @@ class WaveshareHat:
 
     def _read_register(self, register, signed=False):
         data = self.bus.read_i2c_block_data(self.address, register, 2)
-        value = (data[0] << 8) | data[1]
+        return register_value(data, signed)
 
-        if signed and value & 0x8000:
-            value -= 0x10000
+    def read_registers(self, registers):
+        """Read several 16-bit registers, in one combined I2C transfer when smbus2 allows."""
 
-        return value
+        if i2c_msg is None:
+            return [self._read_register(register) for register in registers]
+
+        messages = []
+        reads = []
+        for register in registers:
+            read = i2c_msg.read(self.address, 2)
+            messages += [i2c_msg.write(self.address, [register]), read]
+            reads.append(read)
+
+        self.bus.i2c_rdwr(*messages)
+        return [register_value(list(read)) for read in reads]
 
     def configure(self):
         self._write_register(REG_CONFIG, CONFIG_32V_2A)
@@ -77,21 +103,26 @@ class WaveshareHat:
         return self._read_register(REG_SHUNT_VOLTAGE, signed=True) * 0.00001
 
     def current(self):
-        self._write_register(REG_CALIBRATION, CALIBRATION_VALUE)
         return self._read_register(REG_CURRENT, signed=True) * CURRENT_LSB_MA / 1000
 
     def power(self):
-        self._write_register(REG_CALIBRATION, CALIBRATION_VALUE)
         return self._read_register(REG_POWER) * POWER_LSB_MW / 1000
 
     def battery(self, empty_voltage=DEFAULT_EMPTY_VOLTAGE, full_voltage=DEFAULT_FULL_VOLTAGE):
-        voltage = self.bus_voltage()
+        shunt, bus, power, current, calibration = self.read_registers(SAMPLE_REGISTERS)
+
+        if calibration != CALIBRATION_VALUE:
+            # The INA219 lost its settings (brownout or reset); current and power are invalid.
+            self.configure()
+            shunt, bus, power, current, calibration = self.read_registers(SAMPLE_REGISTERS)
+
+        voltage = ((bus >> 3) * 4) / 1000
         return {
             "voltage": voltage,
             "percent": battery_percent(voltage, empty_voltage, full_voltage),
-            "current": self.current(),
-            "power": self.power(),
-            "shunt_voltage": self.shunt_voltage(),
+            "current": to_signed(current) * CURRENT_LSB_MA / 1000,
+            "power": power * POWER_LSB_MW / 1000,
+            "shunt_voltage": to_signed(shunt) * 0.00001,
         }
 
 
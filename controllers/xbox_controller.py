@@ -2,7 +2,6 @@ import glob
 import os
 import select
 import subprocess
-from dataclasses import dataclass, field
 from time import sleep
 
 from evdev import InputDevice, ecodes
@@ -13,23 +12,81 @@ DEFAULT_CONTROLLER_MAC = "40:8E:2C:4A:2D:2E"
 LEFT_STICK_X = ecodes.ABS_X
 LEFT_STICK_Y = ecodes.ABS_Y
 
+STICK = "stick"
+TRIGGER = "trigger"
+HAT = "hat"
+# ControllerState field, kind and whether the axis is flipped so up and right are positive.
+AXES = {
+    ecodes.ABS_X: ("x", STICK, False),
+    ecodes.ABS_Y: ("y", STICK, True),
+    ecodes.ABS_RX: ("rx", STICK, False),
+    ecodes.ABS_RY: ("ry", STICK, True),
+    ecodes.ABS_Z: ("lt", TRIGGER, False),
+    ecodes.ABS_RZ: ("rt", TRIGGER, False),
+    ecodes.ABS_HAT0X: ("hat_x", HAT, False),
+    ecodes.ABS_HAT0Y: ("hat_y", HAT, True),
+}
+# Lookup tables have at most 2**TABLE_BITS + 1 entries; a 16-bit stick then
+# moves in steps of 64 counts, well inside its own fuzz.
+TABLE_BITS = 10
+# Face buttons go by position, which every pad agrees on, rather than by label.
+POSITION_NAMES = ("BTN_SOUTH", "BTN_EAST", "BTN_NORTH", "BTN_WEST")
+
+
+def button_name(code):
+    names = ecodes.BTN.get(code) or ecodes.KEY.get(code)
+    if names is None:
+        return str(code)
+    if isinstance(names, str):
+        return names
+    return next((name for name in names if name in POSITION_NAMES), names[0])
+
+
+EV_ABS = ecodes.EV_ABS
+EV_KEY = ecodes.EV_KEY
+BUTTON_NAMES = {code: button_name(code) for code in (*ecodes.KEY, *ecodes.BTN)}
 
-@dataclass
-class ControllerState:
-    x: float = 0
-    y: float = 0
-    buttons: list[str] = field(default_factory=list)
-    changed: bool = False
 
+class ControllerState:
+    """Every input on the pad.
 
-def normalize_axis(value, absinfo):
-    center = (absinfo.min + absinfo.max) / 2
-    span = (absinfo.max - absinfo.min) / 2
+    Sticks and the hat run from -1 to 1 with up and right positive, and
+    triggers from 0 to 1. held is the set of buttons down now, and buttons
+    lists those pressed since the previous read. XboxController updates one
+    instance in place, so copy what you need before its next read.
+    """
 
-    if span <= 0:
-        return 0
+    __slots__ = ("x", "y", "rx", "ry", "lt", "rt", "hat_x", "hat_y", "held", "buttons", "changed")
 
-    return max(-1, min(1, (value - center) / span))
+    def __init__(
+        self,
+        x=0.0,
+        y=0.0,
+        rx=0.0,
+        ry=0.0,
+        lt=0.0,
+        rt=0.0,
+        hat_x=0.0,
+        hat_y=0.0,
+        held=None,
+        buttons=None,
+        changed=False,
+    ):
+        self.x = x
+        self.y = y
+        self.rx = rx
+        self.ry = ry
+        self.lt = lt
+        self.rt = rt
+        self.hat_x = hat_x
+        self.hat_y = hat_y
+        self.held = set(held or ())
+        self.buttons = list(buttons or ())
+        self.changed = changed
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"ControllerState({fields})"
 
 
 def apply_deadzone(value, deadzone):
@@ -40,6 +97,35 @@ def apply_deadzone(value, deadzone):
     return scaled if value > 0 else -scaled
 
 
+def axis_table(absinfo, kind, invert=False, deadzone=0.0):
+    """Return (shift, table): table[(value - absinfo.min) >> shift] is the normalized value.
+
+    Sticks get the deadzone and run from -1 to 1, triggers from 0 to 1, and
+    the hat's three positions map to -1, 0 and 1.
+    """
+
+    span = absinfo.max - absinfo.min
+    if span <= 0:
+        return 0, (0.0,)
+
+    shift = max(0, span.bit_length() - TABLE_BITS)
+    last = span >> shift
+    table = []
+    for index in range(last + 1):
+        share = index / last
+        if kind == TRIGGER:
+            value = share
+        else:
+            value = 2 * share - 1
+            if kind == STICK:
+                value = apply_deadzone(value, deadzone)
+        if invert:
+            value = -value
+        # "or" turns the -0.0 an inverted centre gives into 0.0.
+        table.append(float(value) or 0.0)
+    return shift, tuple(table)
+
+
 def find_device(path=DEFAULT_DEVICE):
     if os.path.exists(path) and is_drive_device(path):
         return path
@@ -112,7 +198,16 @@ def wait_for_device(path=DEFAULT_DEVICE, controller_mac=DEFAULT_CONTROLLER_MAC):
 
 
 class XboxController:
-    """Xbox controller reader that owns connection and event polling."""
+    """Xbox controller reader that owns connection and event polling.
+
+    Every axis's range is read once at connect and turned into a lookup table
+    that already includes normalization, inversion and the stick deadzone, so
+    an event costs a shift and an index. read() applies pending events to one
+    preallocated ControllerState and returns it.
+
+    device takes an already open InputDevice-like object, such as the virtual
+    gamepad in controllers.simulation, instead of searching /dev/input.
+    """
 
     def __init__(
         self,
@@ -120,23 +215,36 @@ class XboxController:
         controller_mac=DEFAULT_CONTROLLER_MAC,
         deadzone=0.08,
         wait=True,
+        device=None,
     ):
         if not 0 <= deadzone < 1:
             raise ValueError("deadzone must be at least 0 and less than 1")
 
-        self.device_path = (
-            wait_for_device(device_path, controller_mac)
-            if wait
-            else find_device(device_path)
-        )
-        if not self.device_path:
-            raise FileNotFoundError("Xbox controller drive device not found")
-
-        self.device = InputDevice(self.device_path)
+        if device is None:
+            self.device_path = (
+                wait_for_device(device_path, controller_mac)
+                if wait
+                else find_device(device_path)
+            )
+            if not self.device_path:
+                raise FileNotFoundError("Xbox controller drive device not found")
+            device = InputDevice(self.device_path)
+        else:
+            self.device_path = device.path
+
+        self.device = device
         self.deadzone = deadzone
-        self.x_value = self.device.absinfo(LEFT_STICK_X).value
-        self.y_value = self.device.absinfo(LEFT_STICK_Y).value
-        self.state = self._state(changed=True)
+        self.state = ControllerState(changed=True)
+        # Ranges are read once here; a pad reports the same ones until it disconnects.
+        self.axes = {}
+        for code, (name, kind, invert) in AXES.items():
+            try:
+                absinfo = device.absinfo(code)
+            except OSError:
+                continue
+            shift, table = axis_table(absinfo, kind, invert, deadzone if kind == STICK else 0.0)
+            self.axes[code] = (name, absinfo.min, shift, table, len(table) - 1)
+            self._set_axis(code, absinfo.value)
 
     @property
     def name(self):
@@ -145,34 +253,67 @@ class XboxController:
     def fileno(self):
         return self.device.fd
 
-    def _state(self, buttons=None, changed=False):
-        x_info = self.device.absinfo(LEFT_STICK_X)
-        y_info = self.device.absinfo(LEFT_STICK_Y)
-        x = apply_deadzone(normalize_axis(self.x_value, x_info), self.deadzone)
-        y = apply_deadzone(-normalize_axis(self.y_value, y_info), self.deadzone)
-        return ControllerState(x=x, y=y, buttons=buttons or [], changed=changed)
+    def _set_axis(self, code, value):
+        name, low, shift, table, last = self.axes[code]
+        index = (value - low) >> shift
+        if index < 0:
+            index = 0
+        elif index > last:
+            index = last
+        setattr(self.state, name, table[index])
+
+    def _idle(self):
+        self.state.buttons.clear()
+        self.state.changed = False
+        return self.state
 
     def poll(self, timeout=0):
         readable, _, _ = select.select([self.device.fd], [], [], timeout)
 
         if not readable:
-            self.state = self._state()
-            return self.state
+            return self._idle()
+
+        return self.read()
 
+    def read(self):
+        """Drain pending events without waiting; use when fileno() is known readable."""
+
+        try:
+            events = list(self.device.read())
+        except BlockingIOError:
+            return self._idle()
+
+        state = self.state
+        axes = self.axes
+        buttons = state.buttons
+        held = state.held
+        buttons.clear()
         changed = False
-        buttons = []
 
-        for event in self.device.read():
-            if event.type == ecodes.EV_ABS:
-                if event.code == LEFT_STICK_X:
-                    self.x_value = event.value
+        for event in events:
+            kind = event.type
+            if kind == EV_ABS:
+                axis = axes.get(event.code)
+                if axis is None:
+                    continue
+                # _set_axis, inlined: this runs for every stick report.
+                name, low, shift, table, last = axis
+                index = (event.value - low) >> shift
+                if index < 0:
+                    index = 0
+                elif index > last:
+                    index = last
+                setattr(state, name, table[index])
+                changed = True
+            elif kind == EV_KEY:
+                name = BUTTON_NAMES.get(event.code) or str(event.code)
+                if event.value == 1:
+                    buttons.append(name)
+                    held.add(name)
                     changed = True
-                elif event.code == LEFT_STICK_Y:
-                    self.y_value = event.value
+                elif event.value == 0 and name in held:
+                    held.remove(name)
                     changed = True
-            elif event.type == ecodes.EV_KEY and event.value:
-                buttons.append(ecodes.KEY.get(event.code, str(event.code)))
-                changed = True
 
-        self.state = self._state(buttons=buttons, changed=changed)
-        return self.state
+        state.changed = changed
+        return state
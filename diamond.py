@@ -1,31 +1,83 @@
 import argparse
 import asyncio
-import subprocess
+import hashlib
+import io
+import struct
 import tempfile
+import threading
 from contextlib import asynccontextmanager
 from pathlib import Path
-from time import monotonic
+from time import perf_counter
 
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
-from controllers.camera import capture_image, default_image_path, record_video
+from controllers.blackbox import (
+    CONTROLLER,
+    MIX,
+    TELEMETRY,
+    WEB_CLEAR,
+    WEB_DRIVE,
+    BlackBox,
+    ReplayClock,
+    ReplayController,
+    SystemClock,
+    compare_mix,
+    parse_log,
+    read_sessions,
+)
+from controllers.camera import DEFAULT_PREROLL_BYTES, connect_camera, still_command, video_command
+from controllers.captures import (
+    DEFAULT_MIN_FREE_BYTES,
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_QUOTAS,
+    KINDS,
+    MAX_PAGE_SIZE,
+    MB,
+    STAGING_DIR,
+    CaptureCatalog,
+    CaptureWriter,
+    parse_quota,
+)
+from controllers.control import (
+    DEFAULT_MAX_ACCEL,
+    DEFAULT_MAX_SLEW,
+    DEFAULT_RATE as CONTROL_RATE,
+    ControlScheduler,
+)
+from controllers.i2c_bus import PRIORITY_DISPLAY, PRIORITY_TELEMETRY, I2CBus
+from controllers.jobs import CANCELLED, DONE, TIMEOUT, JobRunner
 from controllers.led_display import LedDisplay
 from controllers.microphone import (
-    DEFAULT_CHANNELS as MIC_CHANNELS,
-    DEFAULT_CONTAINER as MIC_CONTAINER,
-    DEFAULT_DEVICE as MIC_DEVICE,
-    DEFAULT_FORMAT as MIC_FORMAT,
-    DEFAULT_RATE as MIC_RATE,
-    default_audio_path,
+    DEFAULT_PREROLL_SECONDS as MIC_PREROLL,
+    VoiceTrigger,
+    connect_microphone,
 )
+from controllers.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    REGISTRY,
+    RequestMetrics,
+    gauge,
+    histogram,
+)
+from controllers.motor_driver import BACKENDS as MOTOR_BACKENDS, DEFAULT_BACKEND as MOTOR_BACKEND
+from controllers import simulation
 from controllers.rover import connect_rover
-from controllers.speaker import play_file, play_tone
-from controllers.utils import CAPTURE_DIR, OptionalController, capture_path
-from controllers.waveshare_hat import read_battery
+from controllers.speaker import aplay_command, connect_speaker, play_file, play_tone, write_tone
+from controllers.status_stream import StatusBroadcast
+from controllers.telemetry import (
+    DEFAULT_HISTORY_POINTS,
+    DEFAULT_HISTORY_SECONDS,
+    DEFAULT_RATE as TELEMETRY_RATE,
+    TelemetrySampler,
+)
+from controllers.thumbnails import PLACEHOLDER_SVG, ThumbnailCache
+from controllers.utils import CAPTURE_DIR, OptionalController
+from controllers.video_stream import LiveVideoBroadcast, LiveViewer
+from controllers.waveshare_hat import WaveshareHat
 from controllers.wifi import format_wifi_level, read_wifi_level
 from controllers.xbox_controller import (
     DEFAULT_CONTROLLER_MAC,
@@ -35,12 +87,29 @@ from controllers.xbox_controller import (
 
 
 DISPLAY_INTERVAL = 1.0
-DRIVE_POLL_INTERVAL = 0.05
+IDLE_HEARTBEAT = 1.0
 CONTROLLER_RETRY_INTERVAL = 5.0
 WEB_DRIVE_TIMEOUT = 0.4
+SEQUENCE_MODULUS = 1 << 32
+# Little-endian drive frame from the browser: seq, x, y, client timestamp in ms.
+DRIVE_FRAME = struct.Struct("<Iffd")
+# Acknowledgement back to the browser: seq, echoed client timestamp, applied flag.
+DRIVE_ACK = struct.Struct("<Id?")
 PORT = 3030
+SHUTDOWN_GRACE = 2.0
+# How long a media job may run past its requested length before it is stopped.
+JOB_GRACE = 10.0
 INDEX_FILE = Path(__file__).resolve().parent / "index.html"
 
+LOOP_SECONDS = histogram(
+    "diamond_hardware_loop_seconds",
+    "Time one hardware_loop iteration spends handling input, excluding connection attempts and waits",
+)
+DISPLAY_UPDATE_SECONDS = histogram(
+    "diamond_display_update_seconds",
+    "Time update_display holds the event loop while queueing LCD writes",
+)
+
 
 class DisplayMessage(BaseModel):
     text: str = Field(default="", max_length=64)
@@ -57,6 +126,20 @@ class ToneRequest(BaseModel):
     volume: float = Field(default=0.05, ge=0, le=1)
 
 
+class ClipRequest(BaseModel):
+    seconds: float = Field(default=10, gt=0, le=60)
+    after: float = Field(default=0, ge=0, le=30)
+
+
+class MicRecordRequest(BaseModel):
+    preroll: float = Field(default=MIC_PREROLL, ge=0, le=10)
+
+
+class VoiceTriggerRequest(BaseModel):
+    enabled: bool = True
+    preroll: float = Field(default=MIC_PREROLL, ge=0, le=10)
+
+
 class CaptureName(BaseModel):
     name: str
 
@@ -66,46 +149,216 @@ class TimedCapture(BaseModel):
 
 
 class AppState:
-    def __init__(self, args):
+    def __init__(self, args, clock=None):
         self.args = args
+        self.clock = clock or SystemClock()
+        self.blackbox = BlackBox(args.blackbox, clock=self.clock) if args.blackbox else None
         self.rover = OptionalController(
             "Rover motor output",
-            lambda: connect_rover(max_speed=args.max_speed),
+            lambda: connect_rover(
+                max_speed=args.max_speed,
+                backend="fake" if args.simulate else args.motor_backend,
+            ),
             retry_interval=CONTROLLER_RETRY_INTERVAL,
         )
         self.xbox = OptionalController(
             "Xbox controller",
-            lambda: connect_xbox_controller(
-                device_path=args.device,
-                controller_mac=args.controller_mac,
-                deadzone=args.deadzone,
+            lambda: (
+                simulation.connect_gamepad(args.sim_gamepad_script, deadzone=args.deadzone)
+                if args.simulate
+                else connect_xbox_controller(
+                    device_path=args.device,
+                    controller_mac=args.controller_mac,
+                    deadzone=args.deadzone,
+                )
             ),
             retry_interval=CONTROLLER_RETRY_INTERVAL,
         )
+        self.control = ControlScheduler(
+            self.rover,
+            rate=args.control_rate,
+            max_slew=args.max_slew,
+            max_accel=args.max_accel,
+            clock=self.clock,
+            recorder=self.blackbox,
+        )
+        camera_connect = simulation.connect_camera if args.simulate else connect_camera
+        self.camera = OptionalController(
+            "Camera",
+            lambda: camera_connect(preroll_bytes=int(args.preroll_mb * 1024 * 1024)),
+            retry_interval=CONTROLLER_RETRY_INTERVAL,
+        )
+        if args.simulate:
+            # The simulated pack drains faster while the motors are driven.
+            battery = simulation.SimulatedBattery(load=lambda: simulation.motor_amps(self.control.output))
+            self.i2c = I2CBus(simulation.simulated_bus(battery))
+        else:
+            self.i2c = I2CBus()
+        self.hat = OptionalController(
+            "UPS HAT",
+            lambda: self.i2c.run("ups_hat", WaveshareHat, PRIORITY_TELEMETRY),
+            retry_interval=CONTROLLER_RETRY_INTERVAL,
+        )
+        self.telemetry = TelemetrySampler(
+            self.hat,
+            rate=args.telemetry_rate,
+            history_seconds=args.telemetry_history,
+            bus=self.i2c,
+            recorder=self.blackbox,
+        )
+        self.speaker = OptionalController(
+            "Speaker output",
+            (
+                (lambda: simulation.connect_speaker(args.sim_audio_out))
+                if args.simulate
+                else connect_speaker
+            ),
+            retry_interval=CONTROLLER_RETRY_INTERVAL,
+        )
+        self.video = None
         self.display = None
         self.message = args.message
         self.web_drive = None
         self.web_drive_at = 0
+        self.web_drive_owner = None
+        self.drive_event = None
+        self.loop = None
+        self.xbox_fd = None
         self.battery = None
         self.wifi = None
-        self.mic_process = None
-        self.mic_output = None
+        self.microphone = OptionalController(
+            "Microphone",
+            (
+                (lambda: simulation.connect_microphone(args.sim_audio_in))
+                if args.simulate
+                else connect_microphone
+            ),
+            retry_interval=CONTROLLER_RETRY_INTERVAL,
+        )
+        self.mic_recording = None
+        self.voice_trigger = None
+        self.captures = CaptureCatalog(
+            quotas={**DEFAULT_QUOTAS, **dict(args.capture_quota or [])},
+            min_free_bytes=int(args.capture_min_free_mb * MB),
+            archive=args.capture_archive,
+        )
+        self.writer = CaptureWriter(
+            self.captures,
+            staging=args.staging_dir or None,
+            on_flushed=lambda path: self.status.notify(),
+        )
+        self.thumbnails = ThumbnailCache()
+        self.status = StatusBroadcast(lambda: status_snapshot(self))
+        self.jobs = JobRunner(on_change=self.status.notify)
+        self.status_task = None
+        self.video_recording = None
+        # Recording routes run in worker threads; this keeps start and stop one at a time.
+        self.video_lock = threading.Lock()
         self.running = True
         self.hardware_task = None
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description="Run Diamond's FastAPI hardware server.")
     parser.add_argument("--device", default=DEFAULT_DEVICE)
     parser.add_argument("--controller-mac", default=DEFAULT_CONTROLLER_MAC)
     parser.add_argument("--deadzone", type=float, default=0.08)
     parser.add_argument("--max-speed", type=float, default=1.00)
+    parser.add_argument(
+        "--control-rate",
+        type=float,
+        default=CONTROL_RATE,
+        help="motor update rate, 100-500 Hz",
+    )
+    parser.add_argument(
+        "--max-slew",
+        type=float,
+        default=DEFAULT_MAX_SLEW,
+        help="motor power change per second",
+    )
+    parser.add_argument(
+        "--max-accel",
+        type=float,
+        default=DEFAULT_MAX_ACCEL,
+        help="motor slew change per second",
+    )
+    parser.add_argument(
+        "--motor-backend",
+        choices=MOTOR_BACKENDS,
+        default=MOTOR_BACKEND,
+        help="gpiozero, hardware (PWM peripheral on GPIO12/13 plus lgpio), or fake for no motor output",
+    )
     parser.add_argument("--message", default="Diamond online")
     parser.add_argument("--no-display", action="store_true")
+    parser.add_argument(
+        "--preroll-mb",
+        type=float,
+        default=DEFAULT_PREROLL_BYTES / (1024 * 1024),
+        help="RAM for the video pre-roll buffer behind /api/camera/clip; 0 disables it",
+    )
+    parser.add_argument(
+        "--telemetry-rate",
+        type=float,
+        default=TELEMETRY_RATE,
+        help="UPS HAT samples per second",
+    )
+    parser.add_argument(
+        "--telemetry-history",
+        type=float,
+        default=DEFAULT_HISTORY_SECONDS,
+        help="seconds of UPS HAT samples kept for /api/telemetry/history",
+    )
+    parser.add_argument(
+        "--staging-dir",
+        default=str(STAGING_DIR),
+        help="tmpfs directory captures are written to before the card; empty writes straight to the card",
+    )
+    parser.add_argument(
+        "--capture-quota",
+        action="append",
+        type=parse_quota,
+        metavar="KIND=MB",
+        help="space kept for image, video, audio or file captures; repeat for each kind",
+    )
+    parser.add_argument(
+        "--capture-min-free-mb",
+        type=float,
+        default=DEFAULT_MIN_FREE_BYTES / MB,
+        help="retire the oldest captures while the card has less free space than this",
+    )
+    parser.add_argument("--capture-archive", help="move retired captures here instead of deleting them")
     parser.add_argument("--wifi-interface", help="wireless interface to read, such as wlan0")
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="run against simulated gamepad, motors, UPS HAT, LCD, camera and audio instead of hardware",
+    )
+    parser.add_argument(
+        "--sim-gamepad-script",
+        metavar="PATH",
+        help="'seconds x y [button]' steps the simulated gamepad loops through",
+    )
+    parser.add_argument(
+        "--sim-audio-in",
+        metavar="WAV",
+        help="the simulated microphone hears this file on repeat",
+    )
+    parser.add_argument("--sim-audio-out", metavar="WAV", help="save simulated speaker output to this file")
+    parser.add_argument(
+        "--blackbox",
+        metavar="PATH",
+        help="append every drive input, motor mix and telemetry sample to this binary log",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        help="replay a black box log through the hardware loop against fake devices, then exit",
+    )
+    parser.add_argument("--replay-session", type=int, default=-1, help="session in the log to replay")
+    parser.add_argument("--replay-output", metavar="PATH", help="write the replay's own black box log here")
     parser.add_argument("--host", default="0.0.0.0")
     parser.add_argument("--port", type=int, default=PORT)
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 def status_line(battery, wifi):
@@ -113,71 +366,282 @@ def status_line(battery, wifi):
     return f"{battery_text} {format_wifi_level(wifi)}"[:16]
 
 
-def update_display(state):
-    try:
-        state.battery = read_battery()
-    except OSError as error:
-        print(f"Battery read failed: {error}", flush=True)
-        state.battery = None
+def display_failed(state, transaction):
+    if transaction.error is None:
+        return
+
+    print(f"Display update failed: {transaction.error!r}", flush=True)
+    state.display = None
+
+
+def write_display_line(state, line, text):
+    """Queue an LCD line write; a newer write to the same line replaces a queued one."""
+
+    display = state.display
+    if display is None:
+        return
+
+    transaction = state.i2c.submit(
+        "lcd",
+        lambda smbus: display.write_line(line, text),
+        PRIORITY_DISPLAY,
+        key=("lcd", line),
+    )
+    transaction.add_done_callback(lambda transaction: display_failed(state, transaction))
+
 
+def update_display(state):
+    state.battery = state.telemetry.latest
     state.wifi = read_wifi_level(state.args.wifi_interface)
+    write_display_line(state, 0, status_line(state.battery, state.wifi))
+    write_display_line(state, 1, state.message)
+
+
+def watch_controller(state, loop, controller):
+    """Wake the hardware loop whenever the controller's event device is readable."""
+
+    fd = controller.fileno() if controller is not None else None
+    if fd == state.xbox_fd:
+        return
+
+    unwatch_controller(state, loop)
+    if fd is not None:
+        loop.add_reader(fd, state.drive_event.set)
+        state.xbox_fd = fd
+
+
+def unwatch_controller(state, loop):
+    if state.xbox_fd is not None:
+        loop.remove_reader(state.xbox_fd)
+        state.xbox_fd = None
+
+
+def next_wakeup(state, now, next_display_update):
+    deadline = min(now + IDLE_HEARTBEAT, next_display_update)
+
+    web_drive_expiry = state.web_drive_at + WEB_DRIVE_TIMEOUT
+    if state.web_drive and web_drive_expiry > now:
+        deadline = min(deadline, web_drive_expiry)
 
-    if state.display:
-        state.display.write(status_line(state.battery, state.wifi), state.message)
+    for controller in (state.xbox, state.rover):
+        if controller.device is None:
+            deadline = min(deadline, controller.next_attempt)
+
+    return max(0, deadline - now)
 
 
 async def hardware_loop(state):
+    loop = asyncio.get_running_loop()
+
     if not state.args.no_display:
         try:
-            state.display = LedDisplay()
-            await asyncio.to_thread(update_display, state)
+            state.display = await asyncio.to_thread(state.i2c.run, "lcd", LedDisplay, PRIORITY_DISPLAY)
+            update_display(state)
         except OSError as error:
             print(f"Display unavailable: {error}", flush=True)
             state.display = None
 
-    next_display_update = monotonic() + DISPLAY_INTERVAL
+    next_display_update = state.clock() + DISPLAY_INTERVAL
+    xbox_state = None
     stopped = True
 
-    while state.running:
-        now = monotonic()
-        controller = await asyncio.to_thread(state.xbox.tick, now)
-        motor_output = await asyncio.to_thread(state.rover.tick, now)
-        xbox_state = None
+    try:
+        while state.running:
+            now = state.clock()
+
+            # Connection attempts can block on bluetoothctl, so only they leave the loop thread.
+            if state.xbox.connect_due(now):
+                await asyncio.to_thread(state.xbox.tick, now)
+            if state.rover.connect_due(now):
+                await asyncio.to_thread(state.rover.tick, now)
+
+            started = perf_counter()
+            controller = state.xbox.device
+            motor_output = state.rover.device
+            watch_controller(state, loop, controller)
+
+            if controller is None:
+                xbox_state = None
+            else:
+                try:
+                    xbox_state = controller.read()
+                except OSError as error:
+                    unwatch_controller(state, loop)
+                    state.xbox.clear(error)
+                    stop_rover(state)
+                    xbox_state = None
+
+            now = state.clock()
+            if xbox_state is not None and state.blackbox is not None:
+                state.blackbox.controller(now, xbox_state)
+            drive_command = None
+            if state.web_drive and now - state.web_drive_at <= WEB_DRIVE_TIMEOUT:
+                drive_command = {**state.web_drive, "received": state.web_drive_at}
+            elif xbox_state is not None:
+                drive_command = {"x": xbox_state.x, "y": xbox_state.y, "received": now}
+
+            if motor_output is not None and drive_command is not None:
+                state.control.drive(drive_command["x"], drive_command["y"], drive_command["received"])
+                stopped = False
+            elif not stopped:
+                state.control.halt()
+                stopped = True
+
+            # LCD writes are queued on the I2C bus thread, so they never hold up input handling.
+            if now >= next_display_update:
+                display_started = perf_counter()
+                update_display(state)
+                DISPLAY_UPDATE_SECONDS.observe(perf_counter() - display_started)
+                next_display_update = now + DISPLAY_INTERVAL
+
+            LOOP_SECONDS.observe(perf_counter() - started)
+
+            await state.clock.wait(state.drive_event, next_wakeup(state, state.clock(), next_display_update))
+            state.drive_event.clear()
+    finally:
+        unwatch_controller(state, loop)
+
+
+def stop_rover(state):
+    state.control.stop()
+
+
+def sequence_newer(seq, last_seq):
+    """Return whether seq follows last_seq, allowing the uint32 counter to wrap."""
+
+    if last_seq is None:
+        return True
 
-        if controller is not None:
+    delta = (seq - last_seq) % SEQUENCE_MODULUS
+    return 0 < delta < SEQUENCE_MODULUS // 2
+
+
+def decode_drive_frame(data):
+    if len(data) != DRIVE_FRAME.size:
+        raise ValueError(f"drive frame must be {DRIVE_FRAME.size} bytes")
+
+    seq, x, y, sent_at = DRIVE_FRAME.unpack(data)
+    if not (-1 <= x <= 1 and -1 <= y <= 1):
+        raise ValueError("x and y must be between -1 and 1")
+
+    return seq, x, y, sent_at
+
+
+def wake_hardware_loop(state):
+    """Wake hardware_loop from any thread, including FastAPI's sync handler pool."""
+
+    if state.loop is not None:
+        state.loop.call_soon_threadsafe(state.drive_event.set)
+
+
+def set_web_drive(state, x, y, owner=None):
+    state.web_drive = {"x": x, "y": y}
+    state.web_drive_at = state.clock()
+    state.web_drive_owner = owner
+    if state.blackbox is not None:
+        state.blackbox.web_drive(state.web_drive_at, x, y)
+    wake_hardware_loop(state)
+
+
+def clear_web_drive(state, owner=None):
+    if owner is not None and state.web_drive_owner is not owner:
+        return
+
+    state.web_drive = None
+    state.web_drive_owner = None
+    if state.blackbox is not None:
+        state.blackbox.web_clear(state.clock())
+    stop_rover(state)
+    wake_hardware_loop(state)
+
+
+async def drive_session(state, websocket):
+    """Apply binary drive frames from one browser until it disconnects or goes quiet."""
+
+    last_seq = None
+
+    try:
+        while True:
             try:
-                xbox_state = controller.poll(timeout=0)
-            except OSError as error:
-                state.xbox.clear(error)
-                stop_rover(state)
-
-        drive_command = None
-        if state.web_drive and now - state.web_drive_at <= WEB_DRIVE_TIMEOUT:
-            drive_command = state.web_drive
-        elif xbox_state is not None:
-            drive_command = {"x": xbox_state.x, "y": xbox_state.y}
-
-        if motor_output is not None and drive_command is not None:
-            motor_output.drive(drive_command["x"], drive_command["y"])
-            stopped = False
-        elif not stopped:
-            stop_rover(state)
-            stopped = True
-
-        if now >= next_display_update:
+                message = await asyncio.wait_for(websocket.receive(), timeout=WEB_DRIVE_TIMEOUT)
+            except asyncio.TimeoutError:
+                clear_web_drive(state, owner=websocket)
+                continue
+
+            if message["type"] == "websocket.disconnect":
+                return
+
             try:
-                await asyncio.to_thread(update_display, state)
-            except OSError as error:
-                print(f"Display update failed: {error}", flush=True)
-                state.display = None
-            next_display_update = now + DISPLAY_INTERVAL
+                seq, x, y, sent_at = decode_drive_frame(message.get("bytes") or b"")
+            except ValueError:
+                await websocket.close(code=1003)
+                return
 
-        await asyncio.sleep(DRIVE_POLL_INTERVAL)
+            applied = sequence_newer(seq, last_seq)
+            if applied:
+                last_seq = seq
+                set_web_drive(state, x, y, owner=websocket)
 
+            await websocket.send_bytes(DRIVE_ACK.pack(seq, sent_at, applied))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        clear_web_drive(state, owner=websocket)
 
-def stop_rover(state):
-    if state.rover.device:
-        state.rover.device.stop()
+
+def live_video(state, camera):
+    if state.video is None or state.video.camera is not camera:
+        state.video = LiveVideoBroadcast(camera, state.loop)
+    return state.video
+
+
+async def video_session(state, websocket):
+    """Stream fragmented MP4 to one browser until it disconnects or falls too far behind."""
+
+    camera = await asyncio.to_thread(state.camera.tick)
+    if camera is None:
+        await websocket.close(code=1011, reason="Camera unavailable")
+        return
+
+    broadcast = live_video(state, camera)
+    viewer = LiveViewer()
+    # Viewers never send anything, so a pending receive only exists to notice disconnects.
+    receiver = asyncio.create_task(websocket.receive())
+    receiver.add_done_callback(lambda task: viewer.close())
+    broadcast.add(viewer)
+
+    too_slow = False
+    try:
+        while True:
+            item = await viewer.next()
+            if item is None:
+                too_slow = not receiver.done()
+                break
+
+            kind, payload = item
+            if kind == "text":
+                await websocket.send_text(payload)
+            else:
+                await websocket.send_bytes(payload)
+    except (WebSocketDisconnect, RuntimeError, OSError):
+        pass
+    finally:
+        broadcast.remove(viewer)
+        receiver.cancel()
+
+    if too_slow:
+        await websocket.close(code=1013, reason="Viewer too slow")
+
+
+def speaker_engine(state):
+    """Return the running audio engine, or None to fall back to one aplay per sound."""
+
+    engine = state.speaker.tick()
+    if engine is not None and not engine.running:
+        state.speaker.clear("output stream stopped")
+        engine.close()
+        engine = state.speaker.tick()
+    return engine
 
 
 def capture_file(name):
@@ -193,163 +657,387 @@ def capture_file(name):
     return path
 
 
-def list_captures():
-    CAPTURE_DIR.mkdir(parents=True, exist_ok=True)
-    captures = []
-
-    for path in sorted(CAPTURE_DIR.iterdir(), key=lambda item: item.stat().st_mtime, reverse=True):
-        if not path.is_file() or path.name == ".gitkeep":
-            continue
-        if path.suffix.lower() == ".h264":
-            continue
+def add_thumbnails(state, captures):
+    """Point each listed capture at its preview, or at the placeholder endpoint until it exists."""
 
-        captures.append(
-            {
-                "name": path.name,
-                "size": path.stat().st_size,
-                "url": f"/captures/{path.name}",
-                "kind": capture_kind(path),
-            }
+    for capture in captures:
+        cached = state.thumbnails.lookup(CAPTURE_DIR / capture["name"], capture["size"], capture["modified"])
+        capture["thumbnail"] = (
+            state.thumbnails.url(cached) if cached else f"/api/captures/{capture['name']}/thumbnail"
         )
-
+        capture["thumbnail_ready"] = cached is not None
     return captures
 
 
-def capture_kind(path):
-    suffix = path.suffix.lower()
-    if suffix in (".jpg", ".jpeg", ".png"):
-        return "image"
-    if suffix in (".mp4", ".webm"):
-        return "video"
-    if suffix in (".wav", ".raw", ".mp3"):
-        return "audio"
-    return "file"
+def captured(state, output):
+    """Hand a finished capture to the writer and return the path it will have on the card.
+
+    The catalog lists it, and the status stream announces it, once the flush is done.
+    """
+
+    if output is None:
+        return None
+    return state.writer.commit(output)
+
+
+def microphone_stream(state):
+    stream = state.microphone.tick()
+    if stream is not None and not stream.running:
+        state.microphone.clear("capture stream stopped")
+        stream.close()
+        stream = state.microphone.tick()
+    return stream
 
 
-def start_microphone_recording(state):
-    if state.mic_process and state.mic_process.poll() is None:
+def start_microphone_recording(state, preroll=MIC_PREROLL):
+    if state.mic_recording:
         raise HTTPException(status_code=409, detail="Recording already in progress")
 
-    output = default_audio_path("wav")
-    command = [
-        "arecord",
-        "-D",
-        MIC_DEVICE,
-        "-f",
-        MIC_FORMAT,
-        "-r",
-        str(MIC_RATE),
-        "-c",
-        str(MIC_CHANNELS),
-        "-t",
-        MIC_CONTAINER,
-        str(output),
-    ]
-    output.parent.mkdir(parents=True, exist_ok=True)
-    state.mic_process = subprocess.Popen(command)
-    state.mic_output = output
-    return output
+    stream = microphone_stream(state)
+    if stream is None:
+        raise HTTPException(status_code=503, detail="Microphone unavailable")
+
+    output = state.writer.path("audio", "wav", bounded=False)
+    try:
+        state.mic_recording = (stream, stream.start_recording(output, preroll=preroll))
+    except Exception:
+        state.writer.discard(output)
+        raise
+    state.status.notify()
+    return state.mic_recording[1].output
 
 
 def stop_microphone_recording(state):
-    if not state.mic_process:
+    if not state.mic_recording:
         raise HTTPException(status_code=409, detail="Recording is not running")
 
-    process = state.mic_process
-    output = state.mic_output
+    stream, recording = state.mic_recording
+    state.mic_recording = None
+    return captured(state, stream.stop_recording(recording))
 
-    if process.poll() is None:
-        process.terminate()
-        try:
-            process.wait(timeout=3)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            process.wait(timeout=3)
 
-    state.mic_process = None
-    state.mic_output = None
+def voice_trigger_active(state):
+    trigger = state.voice_trigger
+    return trigger is not None and trigger.stream is state.microphone.device
+
+
+def set_voice_trigger(state, enabled, preroll=MIC_PREROLL):
+    if state.voice_trigger:
+        state.voice_trigger.close()
+        state.voice_trigger = None
+
+    if not enabled:
+        return False
+
+    stream = microphone_stream(state)
+    if stream is None:
+        raise HTTPException(status_code=503, detail="Microphone unavailable")
+
+    state.voice_trigger = VoiceTrigger(
+        stream,
+        preroll=preroll,
+        on_capture=lambda output: captured(state, output),
+        output_path=lambda: state.writer.path("audio", "wav", bounded=False),
+    )
+    return True
+
+
+def microphone_levels(state):
+    stream = state.microphone.device
+    if stream is None or not stream.running:
+        return None
+    return stream.analyzer.levels()
+
+
+def start_video_recording(state, camera):
+    with state.video_lock:
+        if state.video_recording:
+            raise HTTPException(status_code=409, detail="Video recording already in progress")
+        if camera is None:
+            raise HTTPException(status_code=503, detail="Camera unavailable")
+
+        output = state.writer.path("video", "mp4", bounded=False)
+        try:
+            state.video_recording = (camera, camera.start_recording(output))
+        except Exception:
+            state.writer.discard(output)
+            raise
+    state.status.notify()
     return output
 
 
-def record_mp4(seconds):
-    mp4_output = capture_path("video", "mp4")
+def stop_video_recording(state):
+    with state.video_lock:
+        if not state.video_recording:
+            raise HTTPException(status_code=409, detail="Video recording is not running")
 
-    with tempfile.NamedTemporaryFile(prefix="diamond-video-", suffix=".h264", delete=True) as file:
-        raw_output = Path(file.name)
-        record_video(raw_output, seconds=seconds)
-        subprocess.run(
-            ["ffmpeg", "-y", "-loglevel", "error", "-i", str(raw_output), "-c", "copy", str(mp4_output)],
-            check=True,
-            timeout=float(seconds) + 15,
-        )
+        camera, sink = state.video_recording
+        state.video_recording = None
+    return captured(state, camera.stop_recording(sink))
+
+
+def photo_job(state, camera):
+    async def work(job):
+        # Named once the job runs, so a job cancelled while queued leaves no file behind.
+        output = state.writer.path("image", "jpg")
+        try:
+            if camera is not None:
+                await state.jobs.run_blocking(camera.capture_still, output)
+            else:
+                await state.jobs.run_process(still_command(output))
+        except BaseException:
+            state.writer.discard(output)
+            raise
+        return captured(state, output).name
+
+    return state.jobs.submit("photo", "camera", work, timeout=JOB_GRACE)
+
+
+def video_job(state, camera, seconds):
+    """Record a fixed-length MP4 without holding a thread for its duration."""
 
-    return mp4_output
+    async def work(job):
+        output = state.writer.path("video", "mp4")
+        try:
+            if camera is None:
+                await state.jobs.run_process(video_command(output, seconds))
+                return captured(state, output).name
+            sink = await state.jobs.run_blocking(camera.start_recording, output)
+        except BaseException:
+            state.writer.discard(output)
+            raise
+
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            # A cancelled recording keeps what was captured so far.
+            await state.jobs.run_blocking(camera.stop_recording, sink)
+            captured(state, output)
+        return output.name
+
+    return state.jobs.submit("video", "camera", work, timeout=seconds + JOB_GRACE, expected_seconds=seconds)
+
+
+def clip_job(state, camera, seconds, after=0):
+    """Write the last seconds of buffered video, plus after seconds more, to an MP4."""
+
+    if camera is None or camera.preroll is None:
+        raise HTTPException(status_code=503, detail="Video pre-roll buffer unavailable")
+
+    samples = camera.preroll.snapshot(seconds)
+    if not samples:
+        raise HTTPException(status_code=409, detail="No video buffered yet")
+
+    async def work(job):
+        clip = samples
+        if after:
+            await asyncio.sleep(after)
+            clip = samples + camera.preroll.since(samples[-1].timestamp)
+        output = state.writer.path("clip", "mp4")
+        try:
+            await state.jobs.run_blocking(camera.save_clip, output, clip)
+        except BaseException:
+            state.writer.discard(output)
+            raise
+        return captured(state, output).name
+
+    return state.jobs.submit("clip", "media", work, timeout=after + JOB_GRACE, expected_seconds=after or None)
+
+
+def play_job(state, path):
+    """Play a file with aplay when the speaker engine is unavailable."""
+
+    return state.jobs.submit("play", "speaker", lambda job: state.jobs.run_process(aplay_command(path)))
+
+
+def tone_job(state, frequency, seconds, volume):
+    async def work(job):
+        with tempfile.NamedTemporaryFile(prefix="diamond-tone-", suffix=".wav") as file:
+            write_tone(file.name, frequency=frequency, seconds=seconds, volume=volume)
+            await state.jobs.run_process(aplay_command(file.name))
+
+    return state.jobs.submit("tone", "speaker", work, timeout=seconds + JOB_GRACE, expected_seconds=seconds)
+
+
+def job_accepted(job, response):
+    """Answer for a capture that carries on as a job: where to follow it, with a 202."""
+
+    url = f"/api/jobs/{job.id}"
+    response.headers["Location"] = url
+    return {"ok": True, "job": job.as_dict(), "url": url}
+
+
+async def finish_job(job):
+    """Wait for a job on behalf of an endpoint that answers only once the work is done."""
+
+    await job.wait()
+    if job.state == DONE:
+        return job.result
+    if job.state == TIMEOUT:
+        raise HTTPException(status_code=504, detail=job.error)
+    if job.state == CANCELLED:
+        raise HTTPException(status_code=409, detail=f"Job {job.id} was cancelled")
+    raise HTTPException(status_code=500, detail=job.error)
+
+
+def status_snapshot(state):
+    return {
+        "battery": state.battery,
+        "wifi": state.wifi,
+        "display": {"message": state.message},
+        "controllers": {
+            "rover": state.rover.available,
+            "xbox": state.xbox.available,
+            "display": state.display is not None,
+            "camera": state.camera.available,
+            "speaker": state.speaker.available,
+            "microphone": state.microphone.available,
+            "mic_recording": state.mic_recording is not None,
+            "voice_trigger": voice_trigger_active(state),
+            "video_recording": state.video_recording is not None,
+        },
+        "control": {**state.control.stats.snapshot(), "output": state.control.output},
+        "i2c": state.i2c.snapshot(),
+        "microphone": microphone_levels(state),
+        "jobs": state.jobs.active(),
+        "captures": {**state.captures.summary(), **state.writer.stats()},
+    }
+
+
+def register_metrics(state):
+    """Point the scrape-time gauges at this app's state."""
+
+    def battery(field):
+        def read():
+            latest = state.telemetry.latest
+            return latest[field] if latest else None
+
+        return read
+
+    gauge("diamond_battery_volts", "UPS HAT battery voltage", function=battery("voltage"))
+    gauge("diamond_battery_amps", "UPS HAT battery current", function=battery("current"))
+    gauge("diamond_battery_percent", "Estimated battery charge", function=battery("percent"))
+    gauge("diamond_captures", "Captures in the catalog", function=lambda: state.captures.summary()["count"])
+    gauge(
+        "diamond_capture_flushes_pending",
+        "Captures waiting to be written to the card",
+        function=lambda: state.writer.pending,
+    )
+    gauge("diamond_jobs_active", "Queued and running media jobs", function=lambda: len(state.jobs.active()))
+    gauge("diamond_status_subscribers", "Open status streams", function=lambda: len(state.status.subscribers))
 
 
 def create_app(args=None):
     args = args or parse_args()
     state = AppState(args)
+    register_metrics(state)
 
     @asynccontextmanager
     async def lifespan(app):
         app.state.diamond = state
+        state.loop = asyncio.get_running_loop()
+        state.drive_event = asyncio.Event()
+        state.control.start()
+        state.telemetry.start()
+        state.writer.start()
         state.hardware_task = asyncio.create_task(hardware_loop(state))
+        state.status_task = asyncio.create_task(state.status.run())
+        # Bring media devices up in the background so first use finds them warm.
+        warmup = asyncio.gather(
+            asyncio.to_thread(state.camera.tick),
+            asyncio.to_thread(state.speaker.tick),
+            asyncio.to_thread(state.microphone.tick),
+        )
         try:
             yield
         finally:
             state.running = False
+            state.status.close()
             if state.hardware_task:
                 state.hardware_task.cancel()
-            stop_rover(state)
+            if state.status_task:
+                state.status_task.cancel()
+            state.control.close()
+            await warmup
+            await state.jobs.close()
+            await asyncio.to_thread(state.telemetry.close)
+            if state.video_recording:
+                stop_video_recording(state)
+            if state.camera.device:
+                state.camera.device.close()
+            if state.speaker.device:
+                state.speaker.device.close()
             if state.display:
                 state.display.close()
-            if state.mic_process and state.mic_process.poll() is None:
-                state.mic_process.terminate()
+            state.i2c.close()
+            state.thumbnails.close()
+            if state.voice_trigger:
+                state.voice_trigger.close()
+            if state.mic_recording:
+                stop_microphone_recording(state)
+            if state.microphone.device:
+                state.microphone.device.close()
+            await asyncio.to_thread(state.writer.close)
+            if state.blackbox:
+                state.blackbox.close()
 
     app = FastAPI(title="Diamond Rover", lifespan=lifespan)
+    app.add_middleware(RequestMetrics)
     app.mount("/captures", StaticFiles(directory=CAPTURE_DIR), name="captures")
 
     @app.get("/")
     def index():
         return FileResponse(INDEX_FILE)
 
+    @app.get("/metrics")
+    def metrics():
+        return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
     @app.get("/api/status")
     def api_status():
-        return {
-            "battery": state.battery,
-            "wifi": state.wifi,
-            "display": {"message": state.message},
-            "controllers": {
-                "rover": state.rover.available,
-                "xbox": state.xbox.available,
-                "display": state.display is not None,
-                "mic_recording": state.mic_process is not None and state.mic_process.poll() is None,
-            },
-            "captures": list_captures(),
-        }
+        return status_snapshot(state)
+
+    @app.get("/api/status/stream")
+    def api_status_stream():
+        return StreamingResponse(
+            state.status.events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    @app.get("/api/telemetry/history")
+    def api_telemetry_history(
+        seconds: float | None = Query(default=None, gt=0),
+        points: int = Query(default=DEFAULT_HISTORY_POINTS, ge=0, le=10000),
+    ):
+        return state.telemetry.history_json(seconds=seconds, points=points)
 
     @app.post("/api/display/message")
     def api_display_message(payload: DisplayMessage):
         state.message = payload.text
-        if state.display:
-            state.display.write_line(1, state.message)
+        write_display_line(state, 1, state.message)
+        state.status.notify()
         return {"ok": True, "message": state.message}
 
     @app.post("/api/drive")
     def api_drive(payload: DriveCommand):
-        state.web_drive = {"x": payload.x, "y": payload.y}
-        state.web_drive_at = monotonic()
+        set_web_drive(state, payload.x, payload.y)
         return {"ok": True}
 
     @app.post("/api/drive/stop")
     def api_drive_stop():
-        state.web_drive = None
-        stop_rover(state)
+        clear_web_drive(state)
         return {"ok": True}
 
+    @app.websocket("/ws/drive")
+    async def ws_drive(websocket: WebSocket):
+        await websocket.accept()
+        await drive_session(state, websocket)
+
     @app.post("/api/mic/record/start")
-    def api_mic_start():
-        output = start_microphone_recording(state)
+    def api_mic_start(payload: MicRecordRequest | None = None):
+        preroll = payload.preroll if payload else MIC_PREROLL
+        output = start_microphone_recording(state, preroll=preroll)
         return {"ok": True, "capture": output.name}
 
     @app.post("/api/mic/record/stop")
@@ -357,42 +1045,268 @@ def create_app(args=None):
         output = stop_microphone_recording(state)
         return {"ok": True, "capture": output.name if output else None}
 
+    @app.post("/api/mic/voice-trigger")
+    def api_mic_voice_trigger(payload: VoiceTriggerRequest):
+        enabled = set_voice_trigger(state, payload.enabled, preroll=payload.preroll)
+        state.status.notify()
+        return {"ok": True, "enabled": enabled}
+
     @app.post("/api/speaker/tone")
     async def api_speaker_tone(payload: ToneRequest):
-        await asyncio.to_thread(
-            play_tone,
+        engine = await asyncio.to_thread(speaker_engine, state)
+        if engine is None:
+            job = tone_job(state, payload.frequency, payload.seconds, payload.volume)
+            return {"ok": True, "voice": None, "job": job.id}
+
+        voice = play_tone(
             frequency=payload.frequency,
             seconds=payload.seconds,
             volume=payload.volume,
+            engine=engine,
         )
-        return {"ok": True}
+        return {"ok": True, "voice": voice.id if voice else None}
 
     @app.post("/api/speaker/play")
     async def api_speaker_play(payload: CaptureName):
         path = capture_file(payload.name)
-        await asyncio.to_thread(play_file, path)
+        engine = await asyncio.to_thread(speaker_engine, state)
+        if engine is None:
+            return {"ok": True, "voice": None, "job": play_job(state, path).id}
+
+        voice = await asyncio.to_thread(play_file, path, engine=engine)
+        return {"ok": True, "voice": voice.id if voice else None}
+
+    @app.post("/api/speaker/stop")
+    def api_speaker_stop():
+        if state.speaker.device:
+            state.speaker.device.stop_all()
         return {"ok": True}
 
     @app.post("/api/camera/photo")
     async def api_camera_photo():
-        output = await asyncio.to_thread(capture_image, default_image_path())
+        camera = await asyncio.to_thread(state.camera.tick)
+        job = photo_job(state, camera)
+        return {"ok": True, "capture": await finish_job(job), "job": job.id}
+
+    @app.post("/api/camera/video", status_code=202)
+    async def api_camera_video(payload: TimedCapture, response: Response):
+        camera = await asyncio.to_thread(state.camera.tick)
+        return job_accepted(video_job(state, camera, payload.seconds), response)
+
+    @app.post("/api/camera/clip", status_code=202)
+    async def api_camera_clip(payload: ClipRequest, response: Response):
+        camera = await asyncio.to_thread(state.camera.tick)
+        return job_accepted(clip_job(state, camera, payload.seconds, payload.after), response)
+
+    @app.get("/api/jobs")
+    def api_jobs():
+        return {"jobs": state.jobs.list()}
+
+    @app.post("/api/jobs/photo")
+    async def api_jobs_photo():
+        camera = await asyncio.to_thread(state.camera.tick)
+        return {"ok": True, "job": photo_job(state, camera).as_dict()}
+
+    @app.post("/api/jobs/video")
+    async def api_jobs_video(payload: TimedCapture):
+        camera = await asyncio.to_thread(state.camera.tick)
+        return {"ok": True, "job": video_job(state, camera, payload.seconds).as_dict()}
+
+    @app.post("/api/jobs/clip")
+    async def api_jobs_clip(payload: ClipRequest):
+        camera = await asyncio.to_thread(state.camera.tick)
+        return {"ok": True, "job": clip_job(state, camera, payload.seconds, payload.after).as_dict()}
+
+    @app.get("/api/jobs/{job_id}")
+    def api_job(job_id: int):
+        job = state.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job.as_dict()
+
+    @app.delete("/api/jobs/{job_id}")
+    def api_job_cancel(job_id: int):
+        if state.jobs.get(job_id) is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if not state.jobs.cancel(job_id):
+            raise HTTPException(status_code=409, detail="Job already finished")
+        return {"ok": True}
+
+    @app.post("/api/camera/record/start")
+    async def api_camera_record_start():
+        camera = await asyncio.to_thread(state.camera.tick)
+        output = await asyncio.to_thread(start_video_recording, state, camera)
         return {"ok": True, "capture": output.name}
 
-    @app.post("/api/camera/video")
-    async def api_camera_video(payload: TimedCapture):
-        output = await asyncio.to_thread(record_mp4, payload.seconds)
+    @app.post("/api/camera/record/stop")
+    async def api_camera_record_stop():
+        output = await asyncio.to_thread(stop_video_recording, state)
         return {"ok": True, "capture": output.name}
 
+    @app.websocket("/ws/video")
+    async def ws_video(websocket: WebSocket):
+        await websocket.accept()
+        await video_session(state, websocket)
+
     @app.get("/api/captures")
-    def api_captures():
-        return {"captures": list_captures()}
+    def api_captures(
+        kind: str | None = Query(default=None),
+        since: float | None = Query(default=None),
+        until: float | None = Query(default=None),
+        cursor: str | None = Query(default=None),
+        limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ):
+        if kind is not None and kind not in KINDS:
+            raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(KINDS)}")
+
+        try:
+            page = state.captures.page(kind=kind, since=since, until=until, cursor=cursor, limit=limit)
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error)) from error
+
+        add_thumbnails(state, page["captures"])
+        return page
+
+    @app.get("/api/captures/usage")
+    def api_captures_usage():
+        return {
+            "kinds": state.captures.usage(),
+            "min_free_bytes": state.captures.min_free_bytes,
+            "writer": state.writer.stats(),
+        }
+
+    @app.get("/api/captures/{name}/thumbnail")
+    def api_capture_thumbnail(name: str):
+        path = capture_file(name)
+        stat = path.stat()
+        cached = state.thumbnails.lookup(path, stat.st_size, stat.st_mtime_ns / 1e9)
+        if cached is None:
+            return Response(
+                PLACEHOLDER_SVG,
+                media_type="image/svg+xml",
+                headers={"Cache-Control": "no-store"},
+            )
+        return FileResponse(cached)
 
     return app
 
 
+def apply_record(state, controller, record):
+    """Hand one recorded input to a replaying app, as the live inputs would have."""
+
+    kind, at, *values = record
+    if kind == CONTROLLER:
+        controller.push(*values)
+    elif kind == WEB_DRIVE:
+        set_web_drive(state, *values)
+    elif kind == WEB_CLEAR:
+        clear_web_drive(state)
+    elif kind == TELEMETRY:
+        state.telemetry.latest = dict(zip(("time", "voltage", "current", "power", "percent"), values))
+        return
+    else:
+        return
+    state.drive_event.set()
+
+
+async def replay_session(args, session):
+    """Run a recorded session through hardware_loop with fake devices on virtual time.
+
+    The control scheduler ticks on the replay clock instead of its own thread,
+    so the result depends only on the log and the code. Returns timing, the
+    largest differences from the recorded motor mix, and a digest of the
+    replayed mix that two code versions can be compared by.
+    """
+
+    output = io.BytesIO()
+    overrides = {"blackbox": output, "motor_backend": "fake", "no_display": True}
+    args = argparse.Namespace(**{**vars(args), **overrides})
+    clock = ReplayClock(session, apply=None)
+    state = AppState(args, clock=clock)
+    controller = ReplayController()
+    recorded_controller = any(record[0] == CONTROLLER for record in session.records)
+    state.xbox = OptionalController(
+        ReplayController.name,
+        lambda: controller if recorded_controller else None,
+        retry_interval=CONTROLLER_RETRY_INTERVAL,
+    )
+    state.drive_event = asyncio.Event()
+
+    def finished():
+        state.running = False
+
+    clock.apply = lambda record: apply_record(state, controller, record)
+    clock.tick = state.control.tick
+    clock.period = state.control.period
+    clock.on_finished = finished
+
+    started = perf_counter()
+    try:
+        await hardware_loop(state)
+    finally:
+        state.control.stop()
+        state.blackbox.close()
+        state.i2c.close()
+    elapsed = perf_counter() - started
+
+    replayed = parse_log(output.getvalue())[-1]
+    if args.replay_output:
+        Path(args.replay_output).write_bytes(output.getvalue())
+    mix = [record for record in replayed.records if record[0] == MIX]
+    motor = state.rover.device
+    return {
+        "duration": session.duration,
+        "elapsed": elapsed,
+        "records": len(session.records),
+        "ticks": clock.ticks,
+        "motor_writes": motor.driver.writes if motor else 0,
+        "mix_digest": hashlib.sha256(repr(mix).encode()).hexdigest(),
+        **compare_mix(session.records, replayed.records, lag=state.control.period),
+    }
+
+
+def replay(args):
+    sessions = read_sessions(args.replay)
+    try:
+        session = sessions[args.replay_session]
+    except IndexError:
+        raise SystemExit(f"{args.replay} has {len(sessions)} sessions") from None
+
+    result = asyncio.run(replay_session(args, session))
+    speedup = result["duration"] / result["elapsed"] if result["elapsed"] else 0
+    print(
+        f"Replayed {result['duration']:.1f}s of driving in {result['elapsed']:.2f}s ({speedup:.0f}x): "
+        f"{result['records']} records, {result['ticks']} control ticks, {result['motor_writes']} motor writes"
+    )
+    print(
+        f"Largest difference from the recording: target {result['target_error']:.4f}, "
+        f"output {result['output_error']:.4f}; mix digest {result['mix_digest'][:16]}"
+    )
+
+
+class DiamondServer(uvicorn.Server):
+    async def shutdown(self, sockets=None):
+        # uvicorn waits for open responses before lifespan shutdown, and status streams never end.
+        state = getattr(self.config.app.state, "diamond", None)
+        if state is not None:
+            state.status.close()
+        await super().shutdown(sockets=sockets)
+
+
 def main():
     args = parse_args()
-    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="info")
+    if args.replay:
+        replay(args)
+        return
+
+    config = uvicorn.Config(
+        create_app(args),
+        host=args.host,
+        port=args.port,
+        log_level="info",
+        timeout_graceful_shutdown=SHUTDOWN_GRACE,
+    )
+    DiamondServer(config).run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,33 @@
+import time
+import wave
+
+from controllers.captures import CaptureCatalog, CaptureWriter
+from controllers.microphone import MicrophoneStream, VoiceTrigger
+from controllers.simulation import SimulatedMicrophone
+
+
+def test_back_to_back_utterances_get_separate_files(tmp_path):
+    writer = CaptureWriter(CaptureCatalog(tmp_path), staging=None)
+    stream = MicrophoneStream(device="simulated", source=SimulatedMicrophone())
+    captured = []
+    trigger = VoiceTrigger(
+        stream,
+        preroll=0,
+        on_capture=captured.append,
+        output_path=lambda: writer.path("audio", "wav", bounded=False),
+    )
+    try:
+        # Two utterances well inside one second, as the analyzer would report them.
+        for _ in range(2):
+            trigger(True, stream.position)
+            time.sleep(0.1)
+            trigger(False, stream.position)
+    finally:
+        trigger.close()
+        stream.close()
+
+    assert len(captured) == 2
+    assert captured[0] != captured[1]
+    for path in captured:
+        with wave.open(str(path), "rb") as file:
+            assert file.getnframes() > 0